@@ -2,6 +2,7 @@ import boto3
 import os
 import json
 import datetime
+from hashlib import md5
 from typing import Union
 
 import ydb
@@ -110,7 +111,20 @@ def handler(event, context):
     session.retry_operation_sync(
         create_execute_query(
             query_template.format(table_path=table_path, row=row)))
-    
+
+    table_path = "users/subscriptions"
+
+    if message["event"] == "subscribe":
+        # The same search saved twice keeps a single subscription.
+        subscription_id = md5(f'{from_user["id"]}:{param}'.encode()).hexdigest()
+        query = f"REPLACE INTO `{table_path}`("\
+            "user_id, subscription_id, params, created_dttm) VALUES" \
+            f'({from_user["id"]},"{subscription_id}",{nvl(param)},cast("{dttm}" as datetime))'
+        session.retry_operation_sync(create_execute_query(query))
+    elif message["event"] == "unsubscribe":
+        query = f"DELETE FROM `{table_path}` WHERE user_id = {from_user['id']}"
+        session.retry_operation_sync(create_execute_query(query))
+
     return {
         'statusCode': 200,
         "message": message,
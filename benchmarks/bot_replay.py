@@ -0,0 +1,365 @@
+"""Webhook replay load test for the telegram-bot function.
+
+Feeds Telegram updates through telegram-bot/index.py ``handler`` with
+in-process stand-ins for the Bot API, add-user-event, get-offers, YDB and
+S3, and reports throughput and p50/p95/p99 latency per step. Updates are
+either synthetic wizard sessions (/search through the stars step and a
+scroll) or recorded ones, e.g. message0.json dumps, given as JSON files
+or JSON lines.
+
+Stand-ins answer after ``--backend-ms`` so the run can model network
+round trips; with 0 it measures the bot's own processing.
+``--duplicates`` redelivers that share of updates, the way Telegram does
+when the webhook is slow; the redeliveries are reported as "duplicate".
+``--failures`` makes the stand-ins raise during the first delivery of
+that share of updates. The failed delivery is reported as "failed" and
+must be answered with an error. Its redelivery, reported as "retry",
+must run the handlers again rather than be skipped as a duplicate.
+
+Usage: python benchmarks/bot_replay.py [--sessions N] [--concurrency N]
+           [--backend-ms MS] [--duplicates SHARE] [--failures SHARE]
+           [--updates FILE ...]
+"""
+import argparse
+import datetime
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "telegram-bot")
+
+BACKEND_DELAY = 0.0
+
+PARAMS = {
+    "country_name": "Египет", "min_departure_date": str(datetime.date.today()),
+    "interval_days": 5, "min_nights": 5, "max_nights": 8, "num_stars": 3,
+}
+
+OFFER = {
+    "title": "Benchmark Hotel", "num_stars": 4.0, "num_nights": 7.0,
+    "start_date": "01.01.2030", "end_date": "08.01.2030", "country_name": "Египет",
+    "city_name": "Хургада", "price": 50000.0, "link": "https://example.com/hotel",
+}
+
+
+# Set while a delivery should fail; stand-ins run in the handler's thread.
+# S3 is left working: the message dump happens before the dispatcher, and
+# the failures are meant to hit the update handlers.
+failing = threading.local()
+
+
+class Counter:
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def hit(self, name: str) -> None:
+        if getattr(failing, "active", False) and name != "s3":
+            raise ConnectionError(f"{name} unavailable")
+        with self._lock:
+            self.calls[name] += 1
+        if BACKEND_DELAY:
+            time.sleep(BACKEND_DELAY)
+
+
+calls = Counter()
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self._data = data
+        self.content = json.dumps(data).encode()
+
+    def json(self):
+        return self._data
+
+
+def fake_post(url, json=None, **kwargs):
+    calls.hit("add-user-event")
+    return FakeResponse({})
+
+
+def fake_get(url, json=None, **kwargs):
+    calls.hit("get-offers")
+    return FakeResponse([OFFER] * json["number"])
+
+
+class FakeTransaction:
+    def execute(self, query, *args, **kwargs):
+        calls.hit("ydb")
+        rows = [types.SimpleNamespace(param=json.dumps({key: value})) for key, value in PARAMS.items()]
+        return [types.SimpleNamespace(rows=rows)]
+
+
+class FakeSession:
+    def create(self):
+        return self
+
+    def transaction(self, *args):
+        return FakeTransaction()
+
+
+class FakeDriver:
+    def __init__(self, *args, **kwargs):
+        self.table_client = types.SimpleNamespace(session=FakeSession)
+
+    def wait(self, *args, **kwargs):
+        pass
+
+
+class FakeS3:
+    def put_object(self, **kwargs):
+        calls.hit("s3")
+
+
+class FakeBotRequest:
+    """Answers Bot API calls the way Telegram would, without the network."""
+
+    con_pool_size = 1
+
+    def post(self, url, data, timeout=None):
+        method = url.rsplit("/", 1)[-1]
+        calls.hit(f"bot.{method}")
+        if method in ("answerCallbackQuery",):
+            return True
+        return {
+            "message_id": 1, "date": int(time.time()), "text": data.get("text", ""),
+            "chat": {"id": data.get("chat_id", 1), "type": "private"},
+        }
+
+    def stop(self):
+        pass
+
+
+def install_fakes() -> None:
+    """Stand-ins for the modules the bot imports lazily."""
+    requests = types.ModuleType("requests")
+    requests.post, requests.get = fake_post, fake_get
+
+    ydb = types.ModuleType("ydb")
+    ydb.Driver = FakeDriver
+    ydb.iam = types.ModuleType("ydb.iam")
+    ydb.iam.MetadataUrlCredentials = lambda *args, **kwargs: None
+
+    boto3 = types.ModuleType("boto3")
+    boto3.session = types.SimpleNamespace(Session=lambda **kwargs: types.SimpleNamespace(
+        client=lambda **kwargs: FakeS3()))
+
+    sys.modules.update({"requests": requests, "ydb": ydb, "ydb.iam": ydb.iam, "boto3": boto3})
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_ENDPOITNT_URL", "AWS_REGION_NAME"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+
+
+def load_bot():
+    install_fakes()
+    sys.path.insert(0, BOT_DIR)
+    spec = importlib.util.spec_from_file_location("bot_index", os.path.join(BOT_DIR, "index.py"))
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+
+    from telegram import Bot
+
+    # The bot logs every step at INFO, which would dominate the timings.
+    logging.getLogger().setLevel(logging.WARNING)
+
+    dispatcher = bot.get_dispatcher()
+    fake_bot = Bot(os.environ["BOT_TOKEN"], request=FakeBotRequest())
+    # Skip the getMe round trip that Bot.username would trigger.
+    fake_bot._bot = types.SimpleNamespace(username="benchmark_bot", id=0)
+    dispatcher.bot = fake_bot
+    return bot
+
+
+def user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": "Bench", "language_code": "ru"}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": user_id, "type": "private"}, "from": user(user_id),
+        "entities": entities if text.startswith("/") else [],
+    }}
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "1", "data": data, "from": user(user_id),
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": "",
+            "chat": {"id": user_id, "type": "private"},
+        },
+    }}
+
+
+def wizard_session(user_id: int, first_update_id: int) -> list:
+    """(step, update) pairs of one full /search conversation."""
+    day = datetime.date.today() + datetime.timedelta(7)
+    steps = [
+        ("/start", lambda i: message_update(i, user_id, "/start")),
+        ("/help", lambda i: message_update(i, user_id, "/help")),
+        ("/search", lambda i: message_update(i, user_id, "/search")),
+        ("1 country", lambda i: callback_update(i, user_id, json.dumps({"val": 2, "id": 1}))),
+        ("calendar year", lambda i: callback_update(i, user_id, f"cbcal_0_s_y_{day.year}_{day.month}_{day.day}")),
+        ("calendar month", lambda i: callback_update(i, user_id, f"cbcal_0_s_m_{day.year}_{day.month}_{day.day}")),
+        ("calendar day", lambda i: callback_update(i, user_id, f"cbcal_0_s_d_{day.year}_{day.month}_{day.day}")),
+        ("2 interval", lambda i: callback_update(i, user_id, json.dumps({"val": 5, "id": 2}))),
+        ("3 min nights", lambda i: callback_update(i, user_id, json.dumps({"val": 5, "id": 3}))),
+        ("4 max nights", lambda i: callback_update(i, user_id, json.dumps({"val": 8, "id": 4}))),
+        ("5 stars", lambda i: callback_update(i, user_id, json.dumps({"val": 3, "id": 5}))),
+        ("6 scroll", lambda i: callback_update(i, user_id, json.dumps({"val": 0, "id": 6}))),
+    ]
+    return [(name, build(first_update_id + i)) for i, (name, build) in enumerate(steps)]
+
+
+def step_name(update: dict) -> str:
+    """Step label of a recorded update."""
+    if "message" in update:
+        text = update["message"].get("text", "")
+        return text.split()[0] if text.startswith("/") else "message"
+    data = update.get("callback_query", {}).get("data", "")
+    if data.startswith("cbcal"):
+        return "calendar"
+    try:
+        return str(json.loads(data)["id"])
+    except (ValueError, KeyError, TypeError):
+        return "callback"
+
+
+def load_updates(paths: list) -> list:
+    updates = []
+    for path in paths:
+        with open(path) as f:
+            text = f.read().strip()
+        if text.startswith("["):
+            items = json.loads(text)
+        elif text.startswith("{") and "\n" not in text:
+            items = [json.loads(text)]
+        else:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        updates.extend((step_name(update), update) for update in items)
+    return updates
+
+
+def renumber(session: list, offset: int) -> list:
+    """Copy of a session with update_ids shifted, so replays aren't deduplicated."""
+    return [(name, {**update, "update_id": update["update_id"] + offset}) for name, update in session]
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(q * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def run_sessions(
+    bot, sessions: list, concurrency: int, duplicates: float = 0, failures: float = 0,
+) -> tuple:
+    """Runs each session's updates in order, sessions in parallel.
+
+    errors counts deliveries that raised or weren't answered as expected:
+    a failed delivery must get a non-200 answer and its retry must not be
+    skipped as a duplicate.
+    """
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def run(session):
+        rng = random.Random(session[0][1]["update_id"] if session else 0)
+        steps = []
+        for name, update in session:
+            if rng.random() < failures:
+                steps.append(("failed", update))
+                name = "retry"
+            steps.append((name, update))
+            if rng.random() < duplicates:
+                steps.append(("duplicate", update))
+        for name, update in steps:
+            failing.active = name == "failed"
+            start = time.perf_counter()
+            try:
+                response = bot.handler({"body": json.dumps(update)}, None)
+            except Exception:
+                with lock:
+                    errors[name] += 1
+                continue
+            finally:
+                failing.active = False
+            elapsed = time.perf_counter() - start
+            if name == "failed":
+                wrong = response.get("statusCode") == 200
+            else:
+                wrong = name == "retry" and response.get("body") == "Duplicate update"
+            with lock:
+                latencies[name].append(elapsed)
+                errors[name] += wrong
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, sessions))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    global BACKEND_DELAY
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--backend-ms", type=float, default=0)
+    parser.add_argument("--duplicates", type=float, default=0)
+    parser.add_argument("--failures", type=float, default=0)
+    parser.add_argument("--updates", nargs="*", default=[])
+    args = parser.parse_args()
+    BACKEND_DELAY = args.backend_ms / 1000
+
+    bot = load_bot()
+    if args.updates:
+        recorded = load_updates(args.updates)
+        sessions = [renumber(recorded, i * 10**6) for i in range(args.sessions)]
+    else:
+        sessions = [
+            wizard_session(user_id=1000 + i, first_update_id=i * 100)
+            for i in range(args.sessions)
+        ]
+
+    # One untimed session so first-call costs (keyboards, calendar import)
+    # don't land in the percentiles.
+    run_sessions(bot, [renumber(sessions[0], 10**9)], 1)
+
+    latencies, errors, elapsed = run_sessions(
+        bot, sessions, args.concurrency, args.duplicates, args.failures)
+    total = sum(map(len, latencies.values()))
+
+    print(f"{total} updates in {elapsed:.2f} s, {total / elapsed:.1f} updates/s, "
+          f"concurrency {args.concurrency}, backend {args.backend_ms:g} ms")
+    print(f"{'step':<16}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    names = [name for session in sessions[:1] for name, _ in session]
+    if args.duplicates:
+        names.append("duplicate")
+    if args.failures:
+        names.extend(("failed", "retry"))
+    for name in dict.fromkeys(names):
+        values = sorted(latencies.get(name, []))
+        if not values:
+            print(f"{name:<16}{0:>7}{'-':>9}{'-':>9}{'-':>9}{errors[name]:>8}")
+            continue
+        p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+        print(f"{name:<16}{len(values):>7}{p50:>9.2f}{p95:>9.2f}{p99:>9.2f}{errors[name]:>8}")
+    print()
+    print("stand-in calls: " + ", ".join(
+        f"{name} {count}" for name, count in sorted(calls.calls.items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Cold-start import benchmark for the telegram-bot function.
+
+Runs ``python -X importtime`` on telegram-bot/index.py in fresh
+interpreters and reports the import cost of the module itself and of the
+dependencies its handlers import lazily.
+
+Usage: python benchmarks/bot_startup.py [--runs N] [--top N]
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "telegram-bot")
+
+LAZY_MODULES = ["boto3", "ydb", "requests", "telegram_bot_calendar"]
+
+
+def import_times(statement: str) -> tuple:
+    """Cumulative import times in microseconds.
+
+    Returns the top-level modules and the direct imports of ``index``.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=BOT_DIR, capture_output=True, text=True,
+        env={**os.environ, "BOT_TOKEN": "0:benchmark"},
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    top_level = {}
+    children = {}
+    index_children = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        # Nesting is two spaces per level; children are printed before parents.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        if depth == 0:
+            top_level[name] = int(cumulative)
+            if name == "index":
+                index_children = children
+            children = {}
+        elif depth == 1:
+            children[name] = int(cumulative)
+    return top_level, index_children
+
+
+def measure(statement: str, runs: int) -> tuple:
+    totals = []
+    last = {}
+    for _ in range(runs):
+        top_level, last = import_times(statement)
+        totals.append(sum(top_level.values()))
+    return statistics.median(totals), last
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    installed = [m for m in LAZY_MODULES if importlib.util.find_spec(m) is not None]
+    missing = sorted(set(LAZY_MODULES) - set(installed))
+    if missing:
+        print(f"not installed, left out of the comparison: {', '.join(missing)}")
+
+    lazy_total, lazy = measure("import index", args.runs)
+    eager_total, _ = measure(
+        "; ".join(f"import {m}" for m in ["index"] + installed), args.runs)
+
+    print(f"import index (lazy deps): {lazy_total / 1000:8.1f} ms median of {args.runs}")
+    print(f"import index + all deps:  {eager_total / 1000:8.1f} ms median of {args.runs}")
+    print(f"saved on /start, /help:   {(eager_total - lazy_total) / 1000:8.1f} ms")
+    print()
+    print(f"heaviest {args.top} imports of index:")
+    for name, us in sorted(lazy.items(), key=lambda x: -x[1])[:args.top]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Daily rollup check for compact-events.
+
+Runs compact-events/index.py ``handler`` against an in-process
+events_log until it has caught up, and checks `users/events_daily`
+against counts computed directly from the log. Rows come back the way
+the SDK returns them without native dates: Datetime columns as epoch
+seconds and Date columns (``day``, the state watermark) as days since
+the epoch. The log has a gap of empty days, and a second pass starts
+from a watermark stuck in 1970, which must skip ahead instead of
+stepping through the empty years. Exits with status 1 on a mismatch.
+
+Usage: python benchmarks/compaction_rollup.py [--days N] [--users N]
+           [--max-days N]
+"""
+import argparse
+import datetime
+import importlib.util
+import os
+import random
+import sys
+import types
+from collections import defaultdict
+
+import ydb
+import ydb.iam
+
+EVENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "compact-events")
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def days_of(value) -> int:
+    """A Date parameter as the SDK sends it."""
+    return (value - EPOCH).days if isinstance(value, datetime.date) else value
+
+
+class Store:
+    def __init__(self, log: list):
+        self.log = log
+        self.daily = {}
+        self.state = {}
+
+
+class FakeTransaction:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def begin(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def execute(self, query, parameters=None, **kwargs):
+        if "FROM `users/compaction_state`" in query:
+            watermark = self.store.state.get(parameters["$job"])
+            rows = [] if watermark is None else [types.SimpleNamespace(watermark=watermark)]
+            return [types.SimpleNamespace(rows=rows)]
+        if "UPSERT INTO `users/compaction_state`" in query:
+            self.store.state[parameters["$job"]] = days_of(parameters["$watermark"])
+        return [types.SimpleNamespace(rows=[])]
+
+
+class FakeSession:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def prepare(self, query):
+        return query
+
+    def transaction(self, *args):
+        return FakeTransaction(self.store)
+
+
+class FakePool:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def retry_operation_sync(self, fn):
+        return fn(FakeSession(self.store))
+
+
+class FakeTableClient:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def scan_query(self, query, parameters=None):
+        text = query.yql_text
+        if "MIN(created_dttm)" in text:
+            since = (parameters or {}).get("$since", 0)
+            times = [at for _, _, at in self.store.log if at >= since]
+            rows = [types.SimpleNamespace(first=min(times) if times else None)]
+        elif "GROUP BY CAST(created_dttm AS Date)" in text:
+            groups = defaultdict(set)
+            counts = defaultdict(int)
+            for user_id, event, at in self.store.log:
+                if parameters["$since"] <= at < parameters["$until"]:
+                    key = (at // 86400, event)
+                    groups[key].add(user_id)
+                    counts[key] += 1
+            rows = [
+                types.SimpleNamespace(day=day, event=event, events=counts[day, event], users=len(users))
+                for (day, event), users in groups.items()
+            ]
+        else:
+            rows = []
+        return [types.SimpleNamespace(result_set=types.SimpleNamespace(rows=rows))]
+
+    def bulk_upsert(self, table, rows, columns):
+        for row in rows:
+            self.store.daily[row["day"], row["event"]] = (row["events"], row["users"])
+
+
+def load_index(store: Store):
+    ydb.Driver = lambda *args, **kwargs: types.SimpleNamespace(
+        wait=lambda **kwargs: None, table_client=FakeTableClient(store))
+    ydb.SessionPool = lambda driver: FakePool(store)
+    ydb.iam.MetadataUrlCredentials = lambda *args, **kwargs: None
+    os.environ.setdefault("YDB_DATABASE", "/check")
+    sys.path.insert(0, EVENTS_DIR)
+    spec = importlib.util.spec_from_file_location("events_index", os.path.join(EVENTS_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+    return index
+
+
+def make_log(days: int, users: int, today: datetime.date) -> list:
+    rng = random.Random(days * 1000 + users)
+    start = today - datetime.timedelta(days)
+    gap = range(days // 3, days // 3 + 5)
+    log = []
+    for offset in range(days + 1):
+        if offset in gap:
+            continue
+        day = start + datetime.timedelta(offset)
+        base = int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
+        for _ in range(rng.randint(1, 4 * users)):
+            log.append((rng.randrange(users), rng.choice(("search", "find", "subscribe")),
+                        base + rng.randrange(86400)))
+    return log
+
+
+def expected_daily(log: list, today: datetime.date) -> dict:
+    groups = defaultdict(set)
+    counts = defaultdict(int)
+    for user_id, event, at in log:
+        day = EPOCH + datetime.timedelta(days=at // 86400)
+        if day < today:
+            groups[day, event].add(user_id)
+            counts[day, event] += 1
+    return {key: (counts[key], len(users)) for key, users in groups.items()}
+
+
+def catch_up(index, limit: int = 100) -> int:
+    runs = 0
+    while runs < limit:
+        runs += 1
+        if not index.rollup_events_log(datetime.datetime.now(datetime.timezone.utc).date()):
+            break
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--max-days", type=int, default=7)
+    args = parser.parse_args()
+
+    today = datetime.datetime.now(datetime.timezone.utc).date()
+    store = Store(make_log(args.days, args.users, today))
+    index = load_index(store)
+    index.ROLLUP_MAX_DAYS = args.max_days
+    expected = expected_daily(store.log, today)
+
+    failed = False
+    for name, watermark in (("fresh state", None), ("watermark stuck in 1970", 1)):
+        store.daily.clear()
+        store.state.clear()
+        if watermark is not None:
+            store.state[index.ROLLUP_JOB] = watermark
+        runs = catch_up(index)
+        index.handler({}, None)
+        stored = EPOCH + datetime.timedelta(days=store.state[index.ROLLUP_JOB])
+        matching = sum(store.daily.get(key) == value for key, value in expected.items())
+        unexpected = len(set(store.daily) - set(expected))
+        ok = store.daily == expected and stored == today
+        failed |= not ok
+        print(f"{name}: {runs} runs, {matching} of {len(expected)} daily rows match, "
+              f"{unexpected} unexpected, watermark {stored}: {'ok' if ok else 'MISMATCH'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
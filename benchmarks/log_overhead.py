@@ -0,0 +1,92 @@
+"""Per-call cost of logging an offers payload.
+
+Compares the eager ``logging.info(json.dumps(results))`` the functions
+used to do with slog's EventLogger, with the level disabled, with the
+event sampled out and with the line emitted. Lines go to a handler that
+formats them into a discarded buffer, the way a function's stdout
+handler would, and the average emitted line size is reported too.
+
+Usage: python benchmarks/log_overhead.py [--offers N] [--calls N] [--rate R]
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "get-offers"))
+
+from slog import EventLogger
+
+OFFER = {
+    "title": "Benchmark Hotel & Spa", "num_stars": 4.0, "num_nights": 7.0,
+    "start_date": "01.01.2030", "end_date": "08.01.2030", "country_name": "Египет",
+    "city_name": "Хургада", "price": 50000.0, "link": "https://example.com/hotel/12345",
+    "row_id": "c8ce3654-d152-5c46-a9ad-ac5d7aa0902b", "user_id": 1, "offer_number": 1,
+}
+
+
+class CountingStream(io.TextIOBase):
+    def __init__(self):
+        self.lines = 0
+        self.chars = 0
+
+    def write(self, text):
+        if text != "\n":
+            self.lines += 1
+            self.chars += len(text)
+        return len(text)
+
+
+def measure(fn, calls: int) -> float:
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--offers", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = [{**OFFER, "offer_number": i} for i in range(args.offers)]
+    logger = logging.getLogger("benchmark")
+    logger.propagate = False
+    stream = CountingStream()
+    logger.addHandler(logging.StreamHandler(stream))
+
+    full = EventLogger(logger=logger)
+    sampled = EventLogger(rates={"offers.results": args.rate}, logger=logger)
+
+    cases = [
+        ("eager json.dumps", logging.INFO,
+         lambda: logger.info(json.dumps(results))),
+        ("eager json.dumps", logging.WARNING,
+         lambda: logger.info(json.dumps(results))),
+        ("slog", logging.WARNING,
+         lambda: full.info("offers.results", count=len(results), results=results)),
+        (f"slog rate {args.rate:g}", logging.INFO,
+         lambda: sampled.info("offers.results", count=len(results), results=results)),
+        ("slog", logging.INFO,
+         lambda: full.info("offers.results", count=len(results), results=results)),
+    ]
+
+    print(f"{args.offers} offers per call, {args.calls} calls per case")
+    print(f"{'case':<22}{'level':>9}{'ns/call':>11}{'lines':>8}{'chars/line':>12}")
+    for name, level, fn in cases:
+        logger.setLevel(level)
+        fn()
+        stream.lines = stream.chars = 0
+        ns = measure(fn, args.calls)
+        per_line = stream.chars / stream.lines if stream.lines else 0
+        print(f"{name:<22}{logging.getLevelName(level):>9}{ns:>11.0f}"
+              f"{stream.lines:>8}{per_line:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
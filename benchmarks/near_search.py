@@ -0,0 +1,178 @@
+"""End-to-end check of distance-sorted near searches in get-offers.
+
+Sends requests with ``near`` and ``sort: "distance"`` through
+get-offers/index.py ``handler`` against in-process hotel locations and
+prod offers, and checks the saved offers against a brute-force ranking:
+every offer of a hotel within the radius, nearest hotel first and the
+cheaper offer per night first within a hotel, cut at MAX_OFFERS. Exits
+with status 1 on a mismatch or an error.
+
+Usage: python benchmarks/near_search.py [--hotels N] [--offers N]
+           [--queries N]
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import random
+import sys
+import types
+import uuid
+
+import ydb
+import ydb.iam
+
+OFFERS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "get-offers")
+sys.path.insert(0, OFFERS_DIR)
+
+from geo import haversine_km
+
+
+class Row(dict):
+    """A result row, readable by attribute and by column name."""
+
+    __getattr__ = dict.__getitem__
+
+
+class Store:
+    def __init__(self, locations: list, offers: list):
+        self.locations = locations
+        self.offers = offers
+        self.saved = {}
+
+
+class FakeTransaction:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def execute(self, query, parameters=None, **kwargs):
+        parameters = parameters or {}
+        rows = []
+        if "REPLACE INTO `users/offers`" in query:
+            for row in parameters["$offers"]:
+                self.store.saved.setdefault(row["user_id"], []).append(Row(row))
+        elif "DELETE FROM `users/offers`" in query:
+            self.store.saved.pop(parameters["$user_id"], None)
+        elif "FROM `users/offers`" in query:
+            offset, number = parameters["$offset"], parameters["$number"]
+            rows = [
+                row for row in self.store.saved.get(parameters["$user_id"], [])
+                if offset < row["offer_number"] <= offset + number
+            ]
+        return [types.SimpleNamespace(rows=rows)]
+
+
+class FakeSession:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def prepare(self, query):
+        return query
+
+    def transaction(self, *args):
+        return FakeTransaction(self.store)
+
+
+class FakePool:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def retry_operation_sync(self, fn):
+        return fn(FakeSession(self.store))
+
+
+class FakeTableClient:
+    def __init__(self, store: Store):
+        self.store = store
+
+    def scan_query(self, query, parameters=None):
+        text = query.yql_text
+        if "parser/prod/hotel_locations" in text:
+            rows = self.store.locations
+        elif "parser/prod/offers" in text:
+            links = set(parameters.get("$links", ()))
+            rows = [offer for offer in self.store.offers if offer["link"] in links]
+        else:
+            rows = []
+        return [types.SimpleNamespace(result_set=types.SimpleNamespace(rows=rows))]
+
+
+def load_index(store: Store):
+    ydb.Driver = lambda *args, **kwargs: types.SimpleNamespace(
+        wait=lambda **kwargs: None, table_client=FakeTableClient(store))
+    ydb.SessionPool = lambda driver: FakePool(store)
+    ydb.iam.MetadataUrlCredentials = lambda *args, **kwargs: None
+    spec = importlib.util.spec_from_file_location("offers_index", os.path.join(OFFERS_DIR, "index.py"))
+    index = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(index)
+    return index
+
+
+def make_store(hotels: int, offers: int, rng: random.Random) -> Store:
+    locations = [
+        Row(link=f"/hotel/{i}", latitude=str(27 + rng.uniform(-1, 1)), longitude=str(33 + rng.uniform(-1, 1)))
+        for i in range(hotels)
+    ]
+    rows = []
+    for _ in range(offers):
+        nights = float(rng.choice((3, 7, 10, 14)))
+        rows.append(Row(
+            start_date="01.06.2030", end_date="08.06.2030", title="Hotel", country_name="Египет",
+            num_nights=nights, city_name="Хургада", price=float(rng.randrange(20, 300) * 1000),
+            link=f"/hotel/{rng.randrange(hotels)}", num_stars=4.0, row_id=str(uuid.UUID(int=rng.getrandbits(128))),
+        ))
+    return Store(locations, rows)
+
+
+def expected_offers(index, store: Store, near: dict) -> list:
+    distances = {}
+    for location in store.locations:
+        distance = haversine_km(
+            near["latitude"], near["longitude"], float(location.latitude), float(location.longitude))
+        if distance <= near["radius_km"]:
+            distances[location.link] = distance
+    ranked = sorted(
+        (offer for offer in store.offers if offer["link"] in distances),
+        key=lambda offer: (distances[offer["link"]], offer["price"] / offer["num_nights"]))
+    return [offer["row_id"] for offer in ranked[:index.MAX_OFFERS]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hotels", type=int, default=400)
+    parser.add_argument("--offers", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(args.hotels * 1000 + args.offers)
+    store = make_store(args.hotels, args.offers, rng)
+    index = load_index(store)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    failed = 0
+    for user_id in range(args.queries):
+        near = {
+            "latitude": 27 + rng.uniform(-1, 1), "longitude": 33 + rng.uniform(-1, 1),
+            "radius_km": rng.choice((5, 20, 50, 150)),
+        }
+        message = {
+            "user_id": user_id, "params": {"near": near, "sort": "distance"},
+            "offset": 0, "number": index.MAX_OFFERS,
+        }
+        expected = expected_offers(index, store, near)
+        try:
+            response = index.handler({"body": json.dumps(message)}, None)
+            got = [offer["row_id"] for offer in json.loads(response["body"])]
+        except Exception as error:
+            got = f"{type(error).__name__}: {error}"
+        ok = got == expected
+        failed += not ok
+        print(f"radius {near['radius_km']:>3} km: {len(expected)} offers expected, "
+              f"{len(got) if isinstance(got, list) else got}: {'ok' if ok else 'MISMATCH'}")
+    print(f"{args.queries - failed} of {args.queries} distance-sorted searches match")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
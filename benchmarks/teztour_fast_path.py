@@ -0,0 +1,163 @@
+"""Conformance and speed of the teztour attribute fast path.
+
+Checks parseteztour/fast_attrs.py ``scan_cards`` against the tree
+parser's ``parse_card`` on every page and times both. For each page the
+fast path must either return exactly the tree's values for its FIELDS,
+card by card, or return None to fall back; any other result is a
+mismatch and makes the script exit with status 1. Pages that the tree
+parser itself rejects are skipped.
+
+Pages are HTML files given with ``--pages`` (``.gz`` is read too), or
+synthetic pages covering the markup variants the scanner has to handle:
+attribute order and quoting, entities, missing group attributes,
+wrappers and nested divs, and cards that must fall back.
+
+Usage: python benchmarks/teztour_fast_path.py [--pages FILE ...]
+           [--synthetic N] [--cards N] [--repeat N]
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parseteztour"))
+
+from extractor import Extractor
+from fast_attrs import FIELDS, scan_cards
+from site_specs import TEZTOUR
+
+extractor = Extractor(TEZTOUR)
+
+
+def quote(rng: random.Random, value: str) -> str:
+    if rng.random() < 0.2 and value and all(c.isalnum() or c in ".-_" for c in value):
+        return value
+    if rng.random() < 0.3 and "'" not in value:
+        return f"'{value}'"
+    return f'"{value}"'
+
+
+def city_tag(rng: random.Random, i: int) -> str:
+    attrs = [
+        ("class", "city-name"), ("data-hotel-id", str(1000 + i)),
+        ("data-hotel-rating", f"4.{i % 10}"), ("data-hotel-rating-text", "Очень хорошо"),
+        ("data-lat", f"{27 + i / 1000:.4f}"), ("data-lng", f"{33 + i / 1000:.4f}"),
+        ("data-title", rng.choice([f"Hotel {i}", f"Sun &amp; Sea {i}", f"Отель «{i}»"])),
+    ]
+    if rng.random() < 0.1:
+        attrs.pop(rng.randrange(1, len(attrs)))
+    head, tail = attrs[:1], attrs[1:]
+    rng.shuffle(tail)
+    if rng.random() < 0.5:
+        head, tail = tail[:2], head + tail[2:]
+    return "<div " + " ".join(f"{name}={quote(rng, value)}" for name, value in head + tail) + ">"
+
+
+def card(rng: random.Random, i: int) -> str:
+    amenities = "".join(
+        f'<h6 class="hotel-amenities-item">Удобство {k}</h6>' for k in range(rng.randint(0, 4)))
+    inner = rng.choice(["", '<div class="wrap"><div class="deep">x</div></div>', "<div/>"])
+    markup = (
+        f'<div class="hotel_point {rng.choice(["", "promo"])}">'
+        f'<a class="fav-detailurl" href="/hotel/{i}?from=list&amp;n={i}">x</a>'
+        f'<img class="preview" src="/img/{i}.jpg">'
+        f'{city_tag(rng, i)}Hurghada {i}</div>{inner}{amenities}'
+        f'<div class="inline-visible"><div class="type">Вылет {i % 28 + 1}.05</div></div>'
+        f'<div class="type">second</div><div class="type">7 ночей</div>'
+        '<div class="fav-mealplan">AI</div><div class="fav-room">Standard</div>'
+        f'<a class="price-box" data-currency="RUB" data-price="{50000 + i * 7}">цена</a>'
+        '<div class="price-box-hint">hint</div><ul class="price-include"><li>a</li></ul>'
+        f'<div class="hotel-star-box star-{i % 5 + 1}">*</div>'
+        "</div>"
+    )
+    roll = rng.random()
+    if roll < 0.005:
+        # Markup the scanner must refuse.
+        markup = markup.replace('<img', '<!-- <div class="city-name" data-lat="0"> --><img', 1)
+    elif roll < 0.01:
+        markup = markup.replace('data-price=', 'data-price="1" data-price=', 1)
+    return markup
+
+
+def synthetic_page(seed: int, cards: int) -> bytes:
+    rng = random.Random(seed)
+    body = "".join(card(rng, seed * 1000 + i) for i in range(cards))
+    if rng.random() < 0.5:
+        body = f'<div class="hotel_point-list">{body}</div>'
+    return (
+        "<html><head><script>var x = '<div class=\"hotel_point\">';</script></head><body>"
+        f'<div class="header">Туры</div>{body}<footer><div class="city-name">x</div></footer>'
+        "</body></html>"
+    ).encode()
+
+
+def read_page(path: str) -> bytes:
+    with open(path, "rb") as f:
+        content = f.read()
+    return gzip.decompress(content) if path.endswith(".gz") else content
+
+
+def tree_rows(content: bytes) -> list:
+    cards = extractor.get_cards(extractor.make_soup(content))
+    return [{field: row[field] for field in FIELDS} for row in map(extractor.parse_card, cards)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", nargs="*", default=[])
+    parser.add_argument("--synthetic", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = [(path, read_page(path)) for path in args.pages]
+    else:
+        pages = [(f"synthetic-{i}", synthetic_page(i, args.cards)) for i in range(args.synthetic)]
+
+    checked = fallbacks = skipped = mismatches = cards = 0
+    tree_time = fast_time = 0.0
+    for name, content in pages:
+        try:
+            expected = tree_rows(content)
+        except ValueError:
+            skipped += 1
+            continue
+        got = scan_cards(content)
+        checked += 1
+        if got is None:
+            fallbacks += 1
+            continue
+        if got != expected:
+            mismatches += 1
+            for i, (a, b) in enumerate(zip(got, expected)):
+                if a != b:
+                    print(f"mismatch {name} card {i}:\n  fast {a}\n  tree {b}")
+                    break
+            else:
+                print(f"mismatch {name}: {len(got)} cards scanned, {len(expected)} parsed")
+            continue
+
+        cards += len(expected)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            tree_rows(content)
+        tree_time += time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            scan_cards(content)
+        fast_time += time.perf_counter() - start
+
+    print(f"{checked} pages checked, {skipped} rejected by the tree parser, "
+          f"{fallbacks} fell back, {mismatches} mismatched")
+    if fast_time:
+        runs = cards * args.repeat
+        print(f"tree  {tree_time / runs * 1e6:8.1f} us/card")
+        print(f"fast  {fast_time / runs * 1e6:8.1f} us/card  ({tree_time / fast_time:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
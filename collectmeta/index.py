@@ -21,6 +21,11 @@ driver.wait(fail_fast=True, timeout=5)
 # Create the session pool instance to manage YDB sessions.
 pool = ydb.SessionPool(driver)
 
+from tracing import Tracer, parse_time
+
+# OTLP/JSON span export target, see tracing.py.
+tracer = Tracer("collectmeta", os.getenv("TRACE_EXPORT"))
+
 from typing import Union
 def load_to_s3(data: Union[str, dict, list], Key, Bucket, is_json=False):
     boto_session = boto3.session.Session(
@@ -102,20 +107,44 @@ def create_execute_query(query):
         )
     return _execute_query
 
-def process_file(Bucket, Key):
-    result = load_process_meta_from_s3(
-        s3, Bucket, Key, 
-    )
+def trace_scrape(meta: dict, started: int):
+    """Scrape and queue-wait spans from the page's meta timestamps."""
+    parsing_started = parse_time(meta["parsing_started"])
+    parsing_ended = parse_time(meta["parsing_ended"])
+    tracer.record(
+        "scrape", parsing_started, parsing_ended,
+        parsing_id=meta["parsing_id"], website=meta["website"])
+    tracer.record(
+        "queue.collectmeta", parsing_ended, started, parsing_id=meta["parsing_id"])
 
-    query = create_statement(result)
+def process_file(Bucket, Key):
+    span = tracer.span("collectmeta", key=Key)
     try:
-        pool.retry_operation_sync(create_execute_query(query))
-    except:
-        raise ValueError(f"Failed at query {query}")
-    
-    flag_key = os.path.join("/".join(Key.split("/")[:-1]), "meta.flg")
-
-    load_to_s3("", Key=flag_key, Bucket="parsing")
+        with span.child("s3.read"):
+            result = load_process_meta_from_s3(
+                s3, Bucket, Key, 
+            )
+        span.parsing_id = result["parsing_id"]
+        trace_scrape(result, span.start)
+
+        query = create_statement(result)
+        try:
+            with span.child("ydb.write"):
+                pool.retry_operation_sync(create_execute_query(query))
+        except:
+            raise ValueError(f"Failed at query {query}")
+        
+        flag_key = os.path.join("/".join(Key.split("/")[:-1]), "meta.flg")
+
+        # Writing the flag triggers the parser.
+        with span.child("s3.flag"):
+            load_to_s3("", Key=flag_key, Bucket="parsing")
+    except Exception as e:
+        span.error = repr(e)
+        raise
+    finally:
+        span.end()
+        tracer.flush()
         
     return result
     
@@ -0,0 +1,148 @@
+"""Compaction of users/events and daily rollup of users/events_log.
+
+A user's old select_param rows are folded into one row. The bot reads
+them through ChainMap, so for a key set twice the earliest row wins; the
+folded row keeps that result and sits at the earliest row's created_dttm,
+which leaves its order against newer rows unchanged. get_params therefore
+returns the same params before and after compaction.
+
+events_log is rolled up into per-day, per-event counts in a column table
+written with BulkUpsert.
+Only whole days are rolled up, and the next day to roll up is kept in
+`users/compaction_state`, so a run that stops midway is picked up by the
+next one and a repeated day just overwrites its aggregates. A stretch of
+days without events is skipped in one step.
+"""
+import datetime
+import json
+from collections import ChainMap, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+old_params_query = """DECLARE $cutoff AS Datetime;
+
+SELECT user_id, COUNT(*) AS rows
+FROM `users/events`
+WHERE event = 'select_param' AND created_dttm < $cutoff
+GROUP BY user_id
+HAVING COUNT(*) > 1
+"""
+
+user_params_query = """DECLARE $user_ids AS List<Int32>;
+DECLARE $cutoff AS Datetime;
+
+SELECT user_id, param, created_dttm
+FROM `users/events`
+WHERE user_id IN $user_ids
+    AND event = 'select_param' AND created_dttm < $cutoff
+ORDER BY user_id, created_dttm
+"""
+
+compact_params_query = """DECLARE $compacted AS List<Struct<
+    user_id: Int32,
+    param: Utf8,
+    event: Utf8,
+    created_dttm: Datetime>>;
+DECLARE $deleted AS List<Struct<
+    user_id: Int32,
+    created_dttm: Datetime>>;
+
+REPLACE INTO `users/events`
+SELECT * FROM AS_TABLE($compacted);
+
+DELETE FROM `users/events` ON
+SELECT * FROM AS_TABLE($deleted);
+"""
+
+state_select_query = """DECLARE $job AS Utf8;
+
+SELECT watermark
+FROM `users/compaction_state`
+WHERE job = $job
+"""
+
+state_upsert_query = """DECLARE $job AS Utf8;
+DECLARE $watermark AS Date;
+
+UPSERT INTO `users/compaction_state` (job, watermark, updated_dttm)
+VALUES ($job, $watermark, CurrentUtcDatetime());
+"""
+
+first_log_day_query = """DECLARE $since AS Datetime;
+
+SELECT MIN(created_dttm) AS first
+FROM `users/events_log`
+WHERE created_dttm >= $since
+"""
+
+daily_rollup_query = """DECLARE $since AS Datetime;
+DECLARE $until AS Datetime;
+
+SELECT day, event, COUNT(*) AS events, COUNT(DISTINCT user_id) AS users
+FROM `users/events_log`
+WHERE created_dttm >= $since AND created_dttm < $until AND event IS NOT NULL
+GROUP BY CAST(created_dttm AS Date) AS day, event
+"""
+
+def fold_params(rows: list) -> Tuple[Optional[dict], List[dict]]:
+    """(compacted row, deleted keys) for one user's rows ordered by time."""
+    if len(rows) < 2:
+        return None, []
+    params = dict(ChainMap(*(json.loads(row.param) for row in rows if row.param)))
+    first = rows[0]
+    compacted = {
+        "user_id": first.user_id,
+        "param": json.dumps(params),
+        "event": "select_param",
+        "created_dttm": first.created_dttm,
+    }
+    deleted = [
+        {"user_id": row.user_id, "created_dttm": row.created_dttm}
+        for row in rows[1:]
+    ]
+    return compacted, deleted
+
+
+def fold_users(rows: list) -> Tuple[List[dict], List[dict]]:
+    by_user: Dict[int, list] = defaultdict(list)
+    for row in rows:
+        by_user[row.user_id].append(row)
+    compacted, deleted = [], []
+    for user_rows in by_user.values():
+        row, keys = fold_params(user_rows)
+        if row is not None:
+            compacted.append(row)
+            deleted.extend(keys)
+    return compacted, deleted
+
+
+def day_range(first: datetime.date, today: datetime.date, max_days: int) -> List[datetime.date]:
+    """Whole days from first up to yesterday, at most max_days of them."""
+    days = []
+    day = first
+    while day < today and len(days) < max_days:
+        days.append(day)
+        day += datetime.timedelta(1)
+    return days
+
+
+EPOCH = datetime.date(1970, 1, 1)
+
+
+def date_from_days(value) -> datetime.date:
+    """Value of a Date column; the SDK returns days since the epoch."""
+    if isinstance(value, int):
+        return EPOCH + datetime.timedelta(days=value)
+    return value
+
+
+def date_from_seconds(value) -> datetime.date:
+    """Day of a Datetime column value; the SDK returns epoch seconds."""
+    if isinstance(value, int):
+        return datetime.datetime.fromtimestamp(value, datetime.timezone.utc).date()
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def to_seconds(day: datetime.date) -> int:
+    return int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp())
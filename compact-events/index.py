@@ -0,0 +1,166 @@
+import ydb
+import ydb.iam
+import os
+import json
+import time
+import datetime
+
+import logging
+
+from compaction import (
+    old_params_query, user_params_query, compact_params_query,
+    state_select_query, state_upsert_query, first_log_day_query,
+    daily_rollup_query, fold_users, day_range, date_from_days, date_from_seconds,
+    to_seconds,
+)
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Create driver in global space.
+driver = ydb.Driver(
+    endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+    credentials=ydb.iam.MetadataUrlCredentials(),)
+# Wait for the driver to become active for requests.
+driver.wait(fail_fast=True, timeout=5)
+# Create the session pool instance to manage YDB sessions.
+pool = ydb.SessionPool(driver)
+
+# select_param rows older than this are folded, so a wizard in progress
+# is left alone.
+COMPACT_AFTER_HOURS = int(os.getenv("COMPACT_AFTER_HOURS", "24"))
+
+# Users folded per transaction.
+COMPACT_BATCH_USERS = int(os.getenv("COMPACT_BATCH_USERS", "100"))
+
+# Days of events_log rolled up per run; the rest wait for the next run.
+ROLLUP_MAX_DAYS = int(os.getenv("ROLLUP_MAX_DAYS", "31"))
+
+ROLLUP_JOB = "events_log_daily"
+
+daily_columns = (
+    ydb.BulkUpsertColumns()
+    # Key columns of the column table are NOT NULL.
+    .add_column("day", ydb.PrimitiveType.Date)
+    .add_column("event", ydb.PrimitiveType.Utf8)
+    .add_column("events", ydb.OptionalType(ydb.PrimitiveType.Uint64))
+    .add_column("users", ydb.OptionalType(ydb.PrimitiveType.Uint64))
+)
+
+
+def create_compact_users(user_ids: list, cutoff: int):
+    def _compact_users(session):
+        # Rows are read and rewritten in one serializable transaction, so a
+        # /search clearing the user's events meanwhile aborts the fold.
+        tx = session.transaction(ydb.SerializableReadWrite()).begin()
+        rows = tx.execute(
+            session.prepare(user_params_query),
+            {"$user_ids": user_ids, "$cutoff": cutoff})[0].rows
+        compacted, deleted = fold_users(rows)
+        if not deleted:
+            tx.commit()
+            return 0
+        tx.execute(
+            session.prepare(compact_params_query),
+            {"$compacted": compacted, "$deleted": deleted},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(10).with_operation_timeout(8)
+        )
+        return len(deleted)
+    return _compact_users
+
+
+def compact_events(cutoff: int) -> int:
+    user_ids = []
+    query = ydb.ScanQuery(old_params_query, {"$cutoff": ydb.PrimitiveType.Datetime})
+    for response in driver.table_client.scan_query(query, {"$cutoff": cutoff}):
+        user_ids.extend(row.user_id for row in response.result_set.rows)
+
+    removed = 0
+    for start in range(0, len(user_ids), COMPACT_BATCH_USERS):
+        batch = user_ids[start:start + COMPACT_BATCH_USERS]
+        removed += pool.retry_operation_sync(create_compact_users(batch, cutoff))
+    logging.info(f"Folded {removed} select_param rows of {len(user_ids)} users")
+    return removed
+
+
+def create_execute_query(query: str, parameters: dict):
+    def _execute_query(session):
+        return session.transaction().execute(
+            session.prepare(query), parameters,
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+    return _execute_query
+
+
+def first_log_day(since: datetime.date):
+    """First day on or after since with events_log rows, or None."""
+    first = None
+    query = ydb.ScanQuery(first_log_day_query, {"$since": ydb.PrimitiveType.Datetime})
+    for response in driver.table_client.scan_query(query, {"$since": to_seconds(since)}):
+        for row in response.result_set.rows:
+            first = row.first
+    return None if first is None else date_from_seconds(first)
+
+
+def next_rollup_day():
+    rows = pool.retry_operation_sync(
+        create_execute_query(state_select_query, {"$job": ROLLUP_JOB}))[0].rows
+    if rows and rows[0].watermark is not None:
+        return date_from_days(rows[0].watermark)
+    return first_log_day(datetime.date(1970, 1, 1))
+
+
+def rollup_events_log(today: datetime.date) -> list:
+    first = next_rollup_day()
+    if first is None:
+        return []
+    days = day_range(first, today, ROLLUP_MAX_DAYS)
+    if not days:
+        return []
+
+    daily = []
+    query = ydb.ScanQuery(daily_rollup_query, {
+        "$since": ydb.PrimitiveType.Datetime, "$until": ydb.PrimitiveType.Datetime})
+    parameters = {
+        "$since": to_seconds(days[0]),
+        "$until": to_seconds(days[-1] + datetime.timedelta(1)),
+    }
+    for response in driver.table_client.scan_query(query, parameters):
+        for row in response.result_set.rows:
+            daily.append({
+                "day": date_from_days(row.day), "event": row.event,
+                "events": row.events, "users": row.users,
+            })
+
+    watermark = days[-1] + datetime.timedelta(1)
+    # Aggregates first, then the watermark: a run stopped in between
+    # recomputes the same days and overwrites them.
+    if daily:
+        table = os.path.join(os.getenv("YDB_DATABASE"), "users/events_daily")
+        driver.table_client.bulk_upsert(table, daily, daily_columns)
+    else:
+        # Nothing was logged on these days: continue from the next day with
+        # events instead of stepping through an empty stretch.
+        following = first_log_day(watermark)
+        if following is not None:
+            watermark = min(following, today)
+    pool.retry_operation_sync(create_execute_query(
+        state_upsert_query, {"$job": ROLLUP_JOB, "$watermark": watermark}))
+    logging.info(f"Rolled up events_log for {days[0]}..{days[-1]}: {len(daily)} rows")
+    return days
+
+
+def handler(event, context):
+    now = int(time.time())
+    removed = compact_events(now - COMPACT_AFTER_HOURS * 3600)
+    today = datetime.datetime.fromtimestamp(now, datetime.timezone.utc).date()
+    days = rollup_events_log(today)
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            "folded_rows": removed,
+            "rolled_up_days": [str(day) for day in days],
+        }),
+    }
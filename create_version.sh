@@ -13,6 +13,9 @@ then
     exit 1
 fi
 
+echo "Checking shared modules"
+python3 tools/check_copies.py || exit 1
+
 echo "Zipping objects of $1"
 zip -r -j $1.zip $1/*
 
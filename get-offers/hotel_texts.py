@@ -0,0 +1,74 @@
+"""Per-hotel search tokens, maintained outside the request path.
+
+The timer run of get-offers reads the raw rows stamped since each
+site's watermark (see watermarks.py), stems their title, location and
+amenities, and upserts one row of tokens per hotel link into
+`parser/prod/hotel_texts`, whose TTL matches the raw tables'.
+Requests only load that table into a TextIndex: all of it on a cold
+instance and on every rebuild, in between the rows updated since the
+previous load, each replacing the tokens its hotel had.
+
+Watermarks are inclusive, so rows stamped in the same second as the last
+one seen are read again rather than skipped. A run drops repeated
+row_ids and keeps the newest row per link, and upserting a hotel's
+tokens again changes nothing.
+"""
+from typing import Iterable, List
+
+import ydb
+
+from text_search import tokenize
+
+text_sources = {
+    "travelata": """DECLARE $since AS Datetime;
+
+SELECT row_id, link, title, location, attributes AS amenities, created_dttm
+FROM `parser/raw/travelata`
+WHERE created_dttm >= $since
+""",
+    "teztour": """DECLARE $since AS Datetime;
+
+SELECT row_id, link, title, location_name AS location, amenities_list AS amenities, created_dttm
+FROM `parser/raw/teztour`
+WHERE created_dttm >= $since
+""",
+}
+
+since_types = {"$since": ydb.PrimitiveType.Datetime}
+
+hotel_texts_query = """DECLARE $since AS Datetime;
+
+SELECT link, tokens, updated_dttm
+FROM `parser/prod/hotel_texts`
+WHERE updated_dttm >= $since
+"""
+
+hotel_texts_upsert_query = """DECLARE $texts AS List<Struct<
+    link: Utf8,
+    tokens: Utf8,
+    updated_dttm: Datetime>>;
+
+UPSERT INTO `parser/prod/hotel_texts`
+SELECT * FROM AS_TABLE($texts);
+"""
+
+
+def text_rows(rows: Iterable, updated_dttm: int) -> List[dict]:
+    """Rows for hotel_texts_upsert_query from raw rows, one per link."""
+    seen = set()
+    newest = {}
+    for row in rows:
+        if row.row_id in seen or row.link is None:
+            continue
+        seen.add(row.row_id)
+        if row.link not in newest or row.created_dttm >= newest[row.link].created_dttm:
+            newest[row.link] = row
+    return [
+        {
+            "link": link,
+            "tokens": " ".join(sorted(set(
+                tokenize(row.title) + tokenize(row.location) + tokenize(row.amenities)))),
+            "updated_dttm": updated_dttm,
+        }
+        for link, row in newest.items()
+    ]
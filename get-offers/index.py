@@ -1,19 +1,51 @@
 import ydb
 import os
 import json
+import time
 import datetime
 
 import logging
 
+from slog import EventLogger
+from topk import TopK
+from geo import GridIndex, parse_coordinate
+from text_search import TextIndex
+from hotel_texts import (
+    text_sources, since_types, hotel_texts_query, hotel_texts_upsert_query, text_rows,
+)
+from watermarks import (
+    PROD_OFFERS, watermark_select_query, watermark_upsert_query, hotel_texts_name,
+)
+from precompute import (
+    params_key, is_expired, is_fresh, precomputed_rows, saved_search_select_query,
+    saved_search_touch_query, precomputed_copy_query, precomputed_select_query,
+    active_searches_query, active_searches_types, precomputed_replace_query,
+)
+from price_history import history_select_query, merge_chunks
+from query_builder import (
+    OfferQuery, query_clear, query_get, query_clear_batch, query_get_batch, user_ids_types,
+)
+
 logging.getLogger().setLevel(logging.INFO)
 
+log = EventLogger()
+
+# Driver and pool live as long as the instance, so sessions keep their
+# prepared queries between invocations.
+_driver = None
+_pool = None
+
 def initialize_driver():
+    global _driver
+    if _driver is not None:
+        return _driver
     driver = ydb.Driver(
         endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
         credentials=ydb.iam.MetadataUrlCredentials(),)
     
     try:
         driver.wait(fail_fast=True, timeout=5)
+        _driver = driver
         return driver
     except TimeoutError:
         print("Connect failed to YDB")
@@ -21,60 +53,264 @@ def initialize_driver():
         print(driver.discovery_debug_details())
         exit(1)
 
-def create_execute_query(query):
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ydb.SessionPool(initialize_driver())
+    return _pool
+
+def create_execute_query(query, parameters=None):
   # Create the transaction and execute query.
     def _execute_query(session):
-        session.transaction().execute(
-            query,
+        if parameters is not None:
+            query_ = session.prepare(query)
+        else:
+            query_ = query
+        return session.transaction().execute(
+            query_, parameters,
             commit_tx=True,
             settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
         )
     return _execute_query
 
-query_clear_template = """DELETE FROM `users/offers`
-WHERE user_id = {user_id}
+query_insert_template = """DECLARE $offers AS List<Struct<
+    start_date: Utf8?,
+    end_date: Utf8?,
+    title: Utf8?,
+    country_name: Utf8?,
+    num_nights: Double?,
+    city_name: Utf8?,
+    price: Double?,
+    link: Utf8?,
+    num_stars: Double?,
+    row_id: Utf8?,
+    user_id: Int64,
+    offer_number: Int64>>;
+
+REPLACE INTO `users/offers`
+SELECT * FROM AS_TABLE($offers);
 """
 
+MAX_OFFERS = 100
 
-query_template = """$format = DateTime::Format("%d.%m.%Y");
-
-$data = (
-SELECT cast($format(start_date) as utf8) as start_date, 
-    cast($format(end_date) as utf8) as end_date,
-    title,
-    country_name,
-    num_nights,
-    city_name,
-    price,
-    link,
-    num_stars,
-    row_id,
-    cast({user_id} as Int64) as user_id
-FROM `parser/prod/offers`
-WHERE {where_query}
-LIMIT 100);
+OFFER_FIELDS = (
+    "start_date", "end_date", "title", "country_name", "num_nights",
+    "city_name", "price", "link", "num_stars", "row_id",
+)
 
-REPLACE INTO `users/offers`
-SELECT start_date, 
-    end_date,
-    title,
-    country_name,
-    num_nights,
-    city_name,
-    price,
-    link,
-    num_stars,
-    row_id,
-    user_id,
-    row_number() over (partition by user_id order by price / num_nights ASC) as offer_number
-FROM $data
+
+def price_per_night(offer: dict) -> float:
+    return offer["price"] / offer["num_nights"]
+
+
+locations_query = """SELECT link, latitude, longitude
+FROM `parser/prod/hotel_locations`
 """
 
-query_get_template = '''SELECT *
-FROM `users/offers`
-WHERE user_id = {user_id}
-    and offer_number > {offset} and offer_number <= {offset} + {number}
-'''
+# Hotel locations change rarely, the index is rebuilt at most this often.
+LOCATION_INDEX_TTL = int(os.getenv("LOCATION_INDEX_TTL", "600"))
+
+_location_index = None
+_location_index_built = 0
+
+
+def get_location_index(driver) -> GridIndex:
+    global _location_index, _location_index_built
+    now = time.monotonic()
+    if _location_index is None or now - _location_index_built > LOCATION_INDEX_TTL:
+        index = GridIndex()
+        query = ydb.ScanQuery(locations_query, {})
+        for response in driver.table_client.scan_query(query):
+            for row in response.result_set.rows:
+                latitude = parse_coordinate(row.latitude, 90)
+                longitude = parse_coordinate(row.longitude, 180)
+                if latitude is not None and longitude is not None:
+                    index.add(row.link, latitude, longitude)
+        logging.info(f"Built location index over {len(index)} hotels")
+        _location_index, _location_index_built = index, now
+    return _location_index
+
+
+def find_near(driver, near: dict) -> dict:
+    """Distance in km by hotel link for hotels within near["radius_km"]."""
+    index = get_location_index(driver)
+    found = index.within(
+        float(near["latitude"]), float(near["longitude"]), float(near["radius_km"]))
+    return {link: distance for distance, link in found}
+
+
+# Hotel tokens are loaded from the table the timer run maintains, see
+# hotel_texts.py; requests don't read the raw tables.
+TEXT_INDEX_TTL = int(os.getenv("TEXT_INDEX_TTL", "60"))
+
+# Refreshes only see updated hotels, so hotels deleted from the table by
+# its TTL are dropped by rebuilding the index this often.
+TEXT_INDEX_REBUILD = int(os.getenv("TEXT_INDEX_REBUILD", "3600"))
+
+# Hotel texts upserted per statement by the timer run.
+TEXT_BATCH_SIZE = 1000
+
+_text_index = None
+_text_index_since = 0
+_text_index_loaded = None
+_text_index_built = None
+
+
+def get_text_index(driver) -> TextIndex:
+    global _text_index, _text_index_since, _text_index_loaded, _text_index_built
+    now = time.monotonic()
+    if _text_index is None or now - _text_index_built > TEXT_INDEX_REBUILD:
+        index, since, built = TextIndex(), 0, now
+    elif now - _text_index_loaded > TEXT_INDEX_TTL:
+        index, since, built = _text_index, _text_index_since, _text_index_built
+    else:
+        return _text_index
+
+    query = ydb.ScanQuery(hotel_texts_query, since_types)
+    for response in driver.table_client.scan_query(query, {"$since": since}):
+        for row in response.result_set.rows:
+            # A row holds all tokens of its hotel, so it replaces the old ones.
+            index.replace_tokens(row.link, row.tokens.split())
+            since = max(since, row.updated_dttm)
+    logging.info(f"Text index covers {len(index)} hotels")
+    _text_index, _text_index_since, _text_index_loaded, _text_index_built = index, since, now, built
+    return _text_index
+
+
+def refresh_hotel_texts(driver) -> int:
+    """Upserts tokens of hotels in raw rows newer than each site's watermark."""
+    session = get_pool()
+    updated = 0
+    for website, source in text_sources.items():
+        name = hotel_texts_name(website)
+        rows = session.retry_operation_sync(create_execute_query(
+            watermark_select_query, {"$name": name}))[0].rows
+        since = rows[0].watermark if rows and rows[0].watermark is not None else 0
+
+        raw = []
+        query = ydb.ScanQuery(source, since_types)
+        for response in driver.table_client.scan_query(query, {"$since": since}):
+            raw.extend(response.result_set.rows)
+        if not raw:
+            continue
+
+        texts = text_rows(raw, int(time.time()))
+        for start in range(0, len(texts), TEXT_BATCH_SIZE):
+            session.retry_operation_sync(create_execute_query(
+                hotel_texts_upsert_query, {"$texts": texts[start:start + TEXT_BATCH_SIZE]}))
+        # Tokens first, then the watermark: a run stopped in between reads
+        # the same rows again.
+        session.retry_operation_sync(create_execute_query(watermark_upsert_query, {
+            "$name": name, "$watermark": max(row.created_dttm for row in raw)}))
+        updated += len(texts)
+    logging.info(f"Updated search tokens of {updated} hotels")
+    return updated
+
+
+def select_top_offers(
+    driver, params: dict, k: int = MAX_OFFERS, distances: dict = None,
+    sort: str = "price", links: set = None,
+) -> list:
+    if distances is not None:
+        links = set(distances) if links is None else links & set(distances)
+    if links is not None and not links:
+        return []
+
+    if sort == "distance" and distances is not None:
+        # Ranking by distance needs every match, so offers are streamed
+        # through a scan query into a bounded heap.
+        query = OfferQuery(params, links)
+        top = TopK(k, key=lambda offer: (distances[offer["link"]], price_per_night(offer)))
+        for response in driver.table_client.scan_query(query.scan_query(), query.parameters):
+            for row in response.result_set.rows:
+                top.push({field: row[field] for field in OFFER_FIELDS})
+        return top.result()
+
+    # The cheapest offers per night are ranked on the server.
+    query = OfferQuery(params, links, limit=k)
+    rows = get_pool().retry_operation_sync(
+        create_execute_query(query.text, query.parameters))[0].rows
+    return [{field: row[field] for field in OFFER_FIELDS} for row in rows]
+
+
+def offer_rows(offers: list, user_id: int) -> list:
+    return [
+        {**offer, "user_id": user_id, "offer_number": i}
+        for i, offer in enumerate(offers, start=1)
+    ]
+
+def create_insert_rows(rows: list):
+    def _execute_query(session):
+        prepared = session.prepare(query_insert_template)
+        session.transaction().execute(
+            prepared, {"$offers": rows},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+    return _execute_query
+
+def create_insert_offers(offers: list, user_id: int):
+    return create_insert_rows(offer_rows(offers, user_id))
+
+def search_offers(driver, params: dict) -> list:
+    # Optional {"latitude", "longitude", "radius_km"}; answered from the
+    # location index and applied while streaming the offers.
+    near = params.get("near")
+    distances = find_near(driver, near) if near else None
+
+    # Optional free text, matched against hotel titles, locations and
+    # amenities through the text index.
+    text = params.get("text")
+    links = get_text_index(driver).search(text) if text else None
+
+    log.info("offers.select", params=params)
+    return select_top_offers(
+        driver, params, distances=distances,
+        sort=params.get("sort", "price"), links=links)
+
+# Precomputed rankings older than this are stale and the search runs live.
+PRECOMPUTED_MAX_AGE = int(os.getenv("PRECOMPUTED_MAX_AGE", "900"))
+
+# Searches used within this many seconds are kept precomputed.
+ACTIVE_SEARCH_WINDOW = int(os.getenv("ACTIVE_SEARCH_WINDOW", str(3 * 24 * 3600)))
+
+def has_precomputed(key: str) -> bool:
+    saved = get_pool().retry_operation_sync(create_execute_query(
+        saved_search_select_query, {"$params_key": key}))[0].rows
+    return bool(saved) and is_fresh(saved[0].computed_dttm, time.time(), PRECOMPUTED_MAX_AGE)
+
+def touch_saved_search(key: str, params: dict) -> None:
+    # Registers the search for the precompute runs.
+    get_pool().retry_operation_sync(create_execute_query(
+        saved_search_touch_query,
+        {"$params_key": key, "$params": json.dumps(params, sort_keys=True)}))
+
+def fill_user_offers(driver, params: dict, user_id: int) -> None:
+    session = get_pool()
+    key = params_key(params)
+    session.retry_operation_sync(create_execute_query(query_clear, {"$user_id": user_id}))
+
+    if has_precomputed(key):
+        logging.info(f"Copying precomputed offers of search {key}")
+        session.retry_operation_sync(create_execute_query(
+            precomputed_copy_query, {"$params_key": key, "$user_id": user_id}))
+    else:
+        offers = search_offers(driver, params)
+        logging.info(f"Saving {len(offers)} offers for user")
+        session.retry_operation_sync(create_insert_offers(offers, user_id))
+    touch_saved_search(key, params)
+
+def lookup_offers(driver, params: dict) -> list:
+    """Offers of a search, from its precomputed ranking when that is fresh."""
+    key = params_key(params)
+    if has_precomputed(key):
+        rows = get_pool().retry_operation_sync(create_execute_query(
+            precomputed_select_query, {"$params_key": key}))[0].rows
+        offers = [{field: row[field] for field in OFFER_FIELDS} for row in rows]
+    else:
+        offers = search_offers(driver, params)
+    touch_saved_search(key, params)
+    return offers
 
 def query_offer(params: dict, user_id: int, offset: int, number: int) -> str:
 
@@ -85,53 +321,147 @@ def query_offer(params: dict, user_id: int, offset: int, number: int) -> str:
 
     if offset == 0:
         logging.info("Zero offset, creating offers for user")
-        session = ydb.SessionPool(driver)
-        query_clear = query_clear_template.format(user_id=user_id)
-        logging.info(f"Executing query: {query_clear}")
-        session.retry_operation_sync(create_execute_query(query_clear))
-
-        country = params["country_name"]
-        min_nights = params["min_nights"]
-        max_nights = params["max_nights"]
-        num_stars = params["num_stars"]
-        min_date = params["min_departure_date"]
-        max_date = datetime.date.fromisoformat(min_date) + datetime.timedelta(params["interval_days"])
-
-        if country is None:
-            query_country = "1=1"
-        else:
-            query_country = f"String::Strip(country_name) = '{country}'"
-        
-        query_nights = f" AND num_nights >= {min_nights} AND num_nights <= {max_nights} "
-
-        query_stars = f" AND num_stars >= {num_stars}"
-
-        query_date = f" AND start_date >= cast('{min_date}' as date) AND start_date <= cast('{max_date}' as date)"
-
-        where_query = query_country + query_nights + query_stars + query_date
-        query = query_template.format(where_query=where_query, user_id=user_id)
-        logging.info(f"Executing query {query}")
-        session.retry_operation_sync(create_execute_query(query))
+        fill_user_offers(driver, params, user_id)
     else:
         logging.info("Non-zero offset")
 
 
-    table_session = driver.table_client.session().create()
     logging.info("Extracting data")
-    query_get = query_get_template.format(user_id=user_id, offset=offset, number=number)
-
-    results = table_session.transaction().execute(query_get, commit_tx=True)[0].rows
+    results = get_pool().retry_operation_sync(create_execute_query(
+        query_get, {"$user_id": user_id, "$offset": offset, "$number": number}))[0].rows
     return list(map(dict, results))
 
+# Rows per REPLACE when a batch saves offers for many users.
+INSERT_BATCH_SIZE = 1000
+
+def load_saved_offers(driver, user_ids: set) -> dict:
+    """Saved offers by user, ordered by offer_number."""
+    saved = {user_id: [] for user_id in user_ids}
+    if not user_ids:
+        return saved
+    query = ydb.ScanQuery(query_get_batch, user_ids_types)
+    parameters = {"$user_ids": sorted(user_ids)}
+    for response in driver.table_client.scan_query(query, parameters):
+        for row in response.result_set.rows:
+            saved[row.user_id].append(dict(row))
+    for rows in saved.values():
+        rows.sort(key=lambda row: row["offer_number"])
+    return saved
+
+def query_batch(items: list) -> list:
+    """Results for many (user_id, params, offset, number) items at once.
+
+    Items asking for a first page run their search, and items with equal
+    params share one search. Later pages of all users are read with one
+    query. Results come back in the order of the items.
+    """
+    driver = initialize_driver()
+    session = get_pool()
+
+    searches = {}
+    fresh = {}
+    for item in items:
+        if item["offset"] != 0:
+            continue
+        key = json.dumps(item["params"], sort_keys=True)
+        if key not in searches:
+            searches[key] = lookup_offers(driver, item["params"])
+        fresh[item["user_id"]] = offer_rows(searches[key], item["user_id"])
+    logging.info(f"Batch of {len(items)} items ran {len(searches)} searches")
+
+    if fresh:
+        session.retry_operation_sync(create_execute_query(
+            query_clear_batch, {"$user_ids": sorted(fresh)}))
+        rows = [row for user_rows in fresh.values() for row in user_rows]
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            session.retry_operation_sync(create_insert_rows(rows[start:start + INSERT_BATCH_SIZE]))
+
+    saved = load_saved_offers(driver, {
+        item["user_id"] for item in items if item["user_id"] not in fresh})
+
+    results = []
+    for item in items:
+        if item["offset"] == 0:
+            offers = offer_rows(searches[json.dumps(item["params"], sort_keys=True)], item["user_id"])
+        else:
+            offers = fresh.get(item["user_id"], saved.get(item["user_id"], []))
+        offset, number = max(item["offset"], 0), item["number"]
+        results.append(offers[offset:offset + number])
+    return results
+
+def read_price_history(offer_hash: str, start: int, end: int) -> list:
+    """[timestamp, price] points of an offer with start <= timestamp <= end."""
+    rows = get_pool().retry_operation_sync(create_execute_query(
+        history_select_query, {"$offer_hash": offer_hash, "$start": start, "$end": end}))[0].rows
+    series = merge_chunks(rows).range(start, end)
+    return [list(point) for point in zip(series.times, series.prices)]
+
+def precompute_searches() -> int:
+    """Reranks recently used searches that are stale or predate new offers."""
+    driver = initialize_driver()
+
+    rows = get_pool().retry_operation_sync(create_execute_query(
+        watermark_select_query, {"$name": PROD_OFFERS}))[0].rows
+    latest = rows[0].watermark if rows else None
+
+    now = time.time()
+    searches = []
+    query = ydb.ScanQuery(active_searches_query, active_searches_types)
+    for response in driver.table_client.scan_query(query, {"$since": int(now - ACTIVE_SEARCH_WINDOW)}):
+        searches.extend(response.result_set.rows)
+
+    today = datetime.date.today()
+    refreshed = 0
+    for search in searches:
+        params = json.loads(search.params)
+        if is_expired(params, today):
+            continue
+        computed = search.computed_dttm
+        has_new_offers = latest is not None and (computed is None or latest > computed)
+        if not has_new_offers and is_fresh(computed, now, PRECOMPUTED_MAX_AGE / 2):
+            continue
+        computed = int(time.time())
+        rows = precomputed_rows(search_offers(driver, params), search.params_key, computed)
+        get_pool().retry_operation_sync(create_execute_query(precomputed_replace_query, {
+            "$params_key": search.params_key,
+            "$computed_dttm": computed,
+            "$num_offers": len(rows),
+            "$offers": rows,
+        }))
+        refreshed += 1
+    logging.info(f"Precomputed {refreshed} of {len(searches)} active searches")
+    return refreshed
+
 def handler(event, context):
 
+    if "messages" in event:
+        # Timer trigger: refresh hotel search tokens and precomputed searches.
+        hotels = refresh_hotel_texts(initialize_driver())
+        return {
+            'statusCode': 200,
+            'body': json.dumps({"hotel_texts": hotels, "refreshed": precompute_searches()})}
+
     message = json.loads(event["body"])
 
+    if "price_history" in message:
+        # {"offer_hash", "start", "end"}, times in epoch seconds.
+        request = message["price_history"]
+        return {
+            'statusCode': 200,
+            'body': json.dumps(read_price_history(
+                request["offer_hash"], int(request["start"]), int(request["end"])))}
+
+    if "batch" in message:
+        logging.info(f"Got batch of {len(message['batch'])} items")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(query_batch(message["batch"]))}
+
     from_user =  message["user_id"]
     params = message["params"]
     offset = message["offset"]
     number = message["number"]
-    logging.info(f"Got params {json.dumps(message)}")
+    log.info("offers.request", message=message)
     results = query_offer(params, from_user, offset, number)
 
     return {
@@ -0,0 +1,122 @@
+"""Precomputed results of recently used searches.
+
+Every first-page request, single or batched, registers its params in
+`users/saved_searches`. A timer-triggered run of get-offers reranks the
+searches used within the active window whenever the ``prod_offers``
+watermark shows newer prod offers, and stores the ranking in
+`users/precomputed_offers`. A user asking for the same params later gets
+that ranking copied into `users/offers` by one server-side query instead
+of waiting for a live search. Batches read the ranking directly. Rankings
+older than the max age are treated as stale and the search runs live.
+
+Searches are keyed by their exact params, departure dates included.
+Only repeats of the same search benefit: the same user searching again,
+or another user giving the same wizard answers. A search for a shifted
+date window is a new key and runs live the first time.
+"""
+import datetime
+import json
+from hashlib import md5
+from typing import Optional
+
+import ydb
+
+
+def params_key(params: dict) -> str:
+    # Exact params, see the module docstring.
+    return md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def is_expired(params: dict, today: datetime.date) -> bool:
+    """Whether the search's departure window is already over."""
+    min_date = params.get("min_departure_date")
+    if min_date is None:
+        return False
+    last_date = datetime.date.fromisoformat(min_date) + datetime.timedelta(
+        int(params.get("interval_days", 0)))
+    return last_date < today
+
+
+def is_fresh(computed_dttm: Optional[int], now: float, max_age: float) -> bool:
+    return computed_dttm is not None and now - computed_dttm <= max_age
+
+
+saved_search_select_query = """DECLARE $params_key AS Utf8;
+
+SELECT computed_dttm
+FROM `users/saved_searches`
+WHERE params_key = $params_key
+"""
+
+saved_search_touch_query = """DECLARE $params_key AS Utf8;
+DECLARE $params AS Utf8;
+
+UPSERT INTO `users/saved_searches` (params_key, params, last_used_dttm)
+VALUES ($params_key, $params, CurrentUtcDatetime());
+"""
+
+precomputed_copy_query = """DECLARE $params_key AS Utf8;
+DECLARE $user_id AS Int64;
+
+REPLACE INTO `users/offers`
+SELECT start_date, end_date, title, country_name, num_nights, city_name,
+    price, link, num_stars, row_id, $user_id AS user_id, offer_number
+FROM `users/precomputed_offers`
+WHERE params_key = $params_key
+"""
+
+active_searches_query = """DECLARE $since AS Datetime;
+
+SELECT params_key, params, computed_dttm
+FROM `users/saved_searches`
+WHERE last_used_dttm > $since
+"""
+
+active_searches_types = {"$since": ydb.PrimitiveType.Datetime}
+
+precomputed_select_query = """DECLARE $params_key AS Utf8;
+
+SELECT start_date, end_date, title, country_name, num_nights, city_name,
+    price, link, num_stars, row_id
+FROM `users/precomputed_offers`
+WHERE params_key = $params_key
+ORDER BY offer_number
+"""
+
+# New rankings overwrite offer numbers 1..n and the tail of a longer old
+# ranking is dropped, all in the transaction that marks the search computed.
+precomputed_replace_query = """DECLARE $params_key AS Utf8;
+DECLARE $computed_dttm AS Datetime;
+DECLARE $num_offers AS Int64;
+DECLARE $offers AS List<Struct<
+    params_key: Utf8,
+    offer_number: Int64,
+    start_date: Utf8?,
+    end_date: Utf8?,
+    title: Utf8?,
+    country_name: Utf8?,
+    num_nights: Double?,
+    city_name: Utf8?,
+    price: Double?,
+    link: Utf8?,
+    num_stars: Double?,
+    row_id: Utf8?,
+    computed_dttm: Datetime>>;
+
+REPLACE INTO `users/precomputed_offers`
+SELECT * FROM AS_TABLE($offers);
+
+DELETE FROM `users/precomputed_offers`
+WHERE params_key = $params_key AND offer_number > $num_offers;
+
+UPDATE `users/saved_searches`
+SET computed_dttm = $computed_dttm
+WHERE params_key = $params_key;
+"""
+
+
+def precomputed_rows(offers: list, key: str, computed_dttm: int) -> list:
+    return [
+        {**offer, "params_key": key, "offer_number": i, "computed_dttm": computed_dttm}
+        for i, offer in enumerate(offers, start=1)
+    ]
@@ -0,0 +1,236 @@
+"""Compact price history per offer_hash.
+
+A series keeps only price changes: two parallel arrays of epoch seconds
+and integer prices. On disk it is split into chunks of at most
+CHUNK_POINTS points, each stored as zigzag varint deltas. The open chunk
+of every offer lives in `parser/prod/price_history_head`, full chunks are
+sealed into `parser/prod/price_history`; neither table has a TTL.
+The parsers append points, and get-offers reads the points of an offer
+within a time range with history_select_query and merge_chunks.
+"""
+import calendar
+import datetime
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Optional, Tuple
+
+CHUNK_POINTS = 256
+
+# Drops are reported against the highest price seen within this window.
+DROP_WINDOW = 7 * 24 * 3600
+
+heads_select_template = """SELECT offer_hash, chunk_start, points, last_seen
+FROM `parser/prod/price_history_head`
+WHERE offer_hash IN ({offer_hashes})
+"""
+
+history_select_query = """DECLARE $offer_hash AS Utf8;
+DECLARE $start AS Uint32;
+DECLARE $end AS Uint32;
+
+SELECT chunk_start, points
+FROM `parser/prod/price_history`
+WHERE offer_hash = $offer_hash AND chunk_end >= $start AND chunk_start <= $end
+UNION ALL
+SELECT chunk_start, points
+FROM `parser/prod/price_history_head`
+WHERE offer_hash = $offer_hash AND chunk_start <= $end
+"""
+
+heads_replace_query = """DECLARE $heads AS List<Struct<
+    offer_hash: Utf8,
+    chunk_start: Uint32,
+    points: String,
+    last_seen: Uint32>>;
+DECLARE $sealed AS List<Struct<
+    offer_hash: Utf8,
+    chunk_start: Uint32,
+    chunk_end: Uint32,
+    points: String>>;
+
+REPLACE INTO `parser/prod/price_history_head`
+SELECT * FROM AS_TABLE($heads);
+
+REPLACE INTO `parser/prod/price_history`
+SELECT * FROM AS_TABLE($sealed);
+"""
+
+
+def _zigzag(value: int) -> int:
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def _unzigzag(value: int) -> int:
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class PriceSeries:
+    def __init__(self, times: Iterable[int] = (), prices: Iterable[int] = ()):
+        self.times = array("q", times)
+        self.prices = array("q", prices)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def append(self, timestamp: int, price: int) -> bool:
+        """Adds a point if it is newer and changes the price."""
+        if self.times and timestamp <= self.times[-1]:
+            return False
+        if self.prices and price == self.prices[-1]:
+            return False
+        self.times.append(timestamp)
+        self.prices.append(price)
+        return True
+
+    def range(self, start: int, end: int) -> "PriceSeries":
+        """Points with start <= time <= end."""
+        first = bisect_left(self.times, start)
+        last = bisect_right(self.times, end)
+        return PriceSeries(self.times[first:last], self.prices[first:last])
+
+    def price_at(self, timestamp: int) -> Optional[int]:
+        i = bisect_right(self.times, timestamp)
+        return self.prices[i - 1] if i > 0 else None
+
+    def drop_pct(self, window: int = DROP_WINDOW) -> float:
+        """Drop of the latest price from the window's maximum, in percent."""
+        if len(self) < 2:
+            return 0.0
+        latest = self.prices[-1]
+        # The price in effect when the window opened counts as well.
+        start = self.times[-1] - window
+        previous = self.range(start, self.times[-1]).prices[:-1].tolist()
+        opening = self.price_at(start)
+        if opening is not None:
+            previous.append(opening)
+        peak = max(previous, default=latest)
+        if peak <= 0 or latest >= peak:
+            return 0.0
+        return 100.0 * (peak - latest) / peak
+
+    def encode(self) -> bytes:
+        out = bytearray()
+        _write_varint(out, len(self))
+        last_time = last_price = 0
+        for timestamp, price in zip(self.times, self.prices):
+            _write_varint(out, _zigzag(timestamp - last_time))
+            _write_varint(out, _zigzag(price - last_price))
+            last_time, last_price = timestamp, price
+        return bytes(out)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "PriceSeries":
+        series = cls()
+        count, pos = _read_varint(data, 0)
+        timestamp = price = 0
+        for _ in range(count):
+            delta, pos = _read_varint(data, pos)
+            timestamp += _unzigzag(delta)
+            delta, pos = _read_varint(data, pos)
+            price += _unzigzag(delta)
+            series.times.append(timestamp)
+            series.prices.append(price)
+        return series
+
+
+def merge_chunks(rows) -> PriceSeries:
+    """Joins the chunks read by history_select_query into one series."""
+    series = PriceSeries()
+    for row in sorted(rows, key=lambda row: row.chunk_start):
+        chunk = PriceSeries.decode(row.points)
+        series.times.extend(chunk.times)
+        series.prices.extend(chunk.prices)
+    return series
+
+
+def parse_price(value) -> Optional[int]:
+    """Integer price from texts like "45 120 ₽" or "45120.00"."""
+    if value is None:
+        return None
+    digits = re.sub(r"[^\d.,]", "", str(value)).replace(",", ".")
+    try:
+        return int(round(float(digits)))
+    except ValueError:
+        return None
+
+
+def to_timestamp(created_dttm: str, time_fmt: str = "%Y-%m-%dT%H:%M:%SZ") -> int:
+    return calendar.timegm(datetime.datetime.strptime(created_dttm, time_fmt).timetuple())
+
+
+def latest_points(rows: List[dict]) -> dict:
+    """(timestamp, price) per offer_hash, lowest price if seen twice."""
+    points = {}
+    for row in rows:
+        price = parse_price(row["price"])
+        if price is None:
+            continue
+        point = (to_timestamp(row["created_dttm"]), price)
+        current = points.get(row["offer_hash"])
+        if current is None or point[1] < current[1]:
+            points[row["offer_hash"]] = point
+    return points
+
+
+def apply_points(heads, points: dict, min_drop_pct: float) -> tuple:
+    """Appends points to the open chunks read from the head table.
+
+    Returns the head and sealed rows to write and the offers whose price
+    dropped by at least min_drop_pct percent.
+    """
+    current = {row.offer_hash: row for row in heads}
+    new_heads, sealed, drops = [], [], []
+    for offer_hash, (timestamp, price) in points.items():
+        head = current.get(offer_hash)
+        if head is None:
+            series, chunk_start = PriceSeries(), timestamp
+        else:
+            series, chunk_start = PriceSeries.decode(head.points), head.chunk_start
+            if timestamp <= head.last_seen:
+                # Already applied by an earlier attempt of this page.
+                continue
+        if not series.append(timestamp, price):
+            new_heads.append(_head_row(offer_hash, chunk_start, series, timestamp))
+            continue
+
+        drop = series.drop_pct()
+        if drop >= min_drop_pct:
+            drops.append({
+                "offer_hash": offer_hash, "price": price, "drop_pct": round(drop, 2)})
+
+        if len(series) > CHUNK_POINTS:
+            full = PriceSeries(series.times[:-1], series.prices[:-1])
+            sealed.append({
+                "offer_hash": offer_hash, "chunk_start": chunk_start,
+                "chunk_end": full.times[-1], "points": full.encode(),
+            })
+            series = PriceSeries(series.times[-1:], series.prices[-1:])
+            chunk_start = timestamp
+        new_heads.append(_head_row(offer_hash, chunk_start, series, timestamp))
+    return new_heads, sealed, drops
+
+
+def _head_row(offer_hash: str, chunk_start: int, series: PriceSeries, last_seen: int) -> dict:
+    return {
+        "offer_hash": offer_hash, "chunk_start": chunk_start,
+        "points": series.encode(), "last_seen": last_seen,
+    }
@@ -0,0 +1,130 @@
+"""Parameterized offer queries.
+
+Every filter value goes through a DECLAREd parameter, so the query text
+depends only on which filters are set. The SDK caches prepared queries
+per session by text, so repeated searches skip compilation, and user
+input never becomes part of the YQL.
+
+country_name is stored stripped, and a search by country reads through
+the (country_name, start_date) secondary index instead of scanning the
+table.
+"""
+import datetime
+from typing import Optional
+
+import ydb
+
+OFFERS_TABLE = "parser/prod/offers"
+COUNTRY_INDEX = "country_start_date"
+
+_format = '$format = DateTime::Format("%d.%m.%Y");'
+
+_columns = """cast($format(start_date) as utf8) as start_date,
+    cast($format(end_date) as utf8) as end_date,
+    cast(title as utf8) as title,
+    cast(country_name as utf8) as country_name,
+    cast(num_nights as double) as num_nights,
+    cast(city_name as utf8) as city_name,
+    cast(price as double) as price,
+    cast(link as utf8) as link,
+    cast(num_stars as double) as num_stars,
+    cast(row_id as utf8) as row_id"""
+
+_utf8 = ydb.PrimitiveType.Utf8
+_double = ydb.PrimitiveType.Double
+
+
+class OfferQuery:
+    """SELECT over prod offers for a params dict from the bot wizard.
+
+    With a limit the cheapest offers per night come back sorted from the
+    server; without one every matching offer is returned for ranking on
+    the client.
+    """
+
+    def __init__(self, params: dict, links: Optional[set] = None, limit: Optional[int] = None):
+        self.limit = limit
+        self.declarations = []
+        self.conditions = ["price IS NOT NULL", "num_nights > 0"]
+        self.parameters = {}
+        self.types = {}
+        self.use_index = False
+
+        country = params.get("country_name")
+        if country is not None:
+            self._add("country", _utf8, country.strip(), "country_name = $country")
+            self.use_index = True
+        if "min_nights" in params:
+            self._add("min_nights", _double, float(params["min_nights"]), "num_nights >= $min_nights")
+        if "max_nights" in params:
+            self._add("max_nights", _double, float(params["max_nights"]), "num_nights <= $max_nights")
+        if "num_stars" in params:
+            self._add("num_stars", _double, float(params["num_stars"]), "num_stars >= $num_stars")
+        min_date = params.get("min_departure_date")
+        if min_date is not None:
+            min_date = datetime.date.fromisoformat(min_date)
+            max_date = min_date + datetime.timedelta(int(params.get("interval_days", 0)))
+            self._add("min_date", ydb.PrimitiveType.Date, min_date, "start_date >= $min_date")
+            self._add("max_date", ydb.PrimitiveType.Date, max_date, "start_date <= $max_date")
+        if links is not None:
+            self._add("links", ydb.ListType(_utf8), sorted(links), "link IN $links")
+        if limit is not None:
+            self._add("limit", ydb.PrimitiveType.Uint64, limit, None)
+
+    def _add(self, name: str, type_, value, condition: Optional[str]) -> None:
+        self.declarations.append(f"DECLARE ${name} AS {type_};")
+        self.parameters[f"${name}"] = value
+        self.types[f"${name}"] = type_
+        if condition is not None:
+            self.conditions.append(condition)
+
+    @property
+    def text(self) -> str:
+        source = f"`{OFFERS_TABLE}`"
+        if self.use_index:
+            source += f" VIEW {COUNTRY_INDEX}"
+        query = "\n".join(self.declarations + ["", _format, "", f"SELECT {_columns}"])
+        query += f"\nFROM {source}\nWHERE " + "\n    AND ".join(self.conditions)
+        if self.limit is not None:
+            query += "\nORDER BY price / num_nights\nLIMIT $limit"
+        return query + "\n"
+
+    def scan_query(self) -> ydb.ScanQuery:
+        # Scan queries can't read through secondary indexes.
+        use_index, self.use_index = self.use_index, False
+        try:
+            return ydb.ScanQuery(self.text, self.types)
+        finally:
+            self.use_index = use_index
+
+
+query_clear = """DECLARE $user_id AS Int64;
+
+DELETE FROM `users/offers`
+WHERE user_id = $user_id
+"""
+
+query_get = """DECLARE $user_id AS Int64;
+DECLARE $offset AS Int64;
+DECLARE $number AS Int64;
+
+SELECT *
+FROM `users/offers`
+WHERE user_id = $user_id
+    AND offer_number > $offset AND offer_number <= $offset + $number
+"""
+
+query_clear_batch = """DECLARE $user_ids AS List<Int64>;
+
+DELETE FROM `users/offers`
+WHERE user_id IN $user_ids
+"""
+
+query_get_batch = """DECLARE $user_ids AS List<Int64>;
+
+SELECT *
+FROM `users/offers`
+WHERE user_id IN $user_ids
+"""
+
+user_ids_types = {"$user_ids": ydb.ListType(ydb.PrimitiveType.Int64)}
@@ -0,0 +1,182 @@
+"""Free-text search over hotel titles, locations and amenities.
+
+Words are lowercased and Russian words are reduced to their stem with
+the Snowball algorithm, so "аквапарком" finds "Аквапарк". The index maps
+every stem to the set of hotel links whose text contains it; a query is
+answered by intersecting the sets of its words, smallest first.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set
+
+VOWELS = "аеиоуыэюя"
+
+PERFECTIVE_GERUND = (
+    ("в", "вши", "вшись"),
+    ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись"),
+)
+ADJECTIVE = (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым",
+    "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+PARTICIPLE = (
+    ("ем", "нн", "вш", "ющ", "щ"),
+    ("ивш", "ывш", "ующ"),
+)
+REFLEXIVE = ("ся", "сь")
+VERB = (
+    ("ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют",
+     "ны", "ть", "ешь", "нно"),
+    ("ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+     "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+     "ены", "ить", "ыть", "ишь", "ую", "ю"),
+)
+NOUN = (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и", "ией",
+    "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у", "ах",
+    "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)
+SUPERLATIVE = ("ейше", "ейш")
+DERIVATIONAL = ("ость", "ост")
+
+WORD_RE = re.compile(r"[^\W_]+")
+CYRILLIC_RE = re.compile(r"[а-я]")
+
+
+def _regions(word: str) -> tuple:
+    """Start of RV and R2 as defined by the Snowball Russian stemmer."""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i] not in VOWELS and word[i - 1] in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word: str, start: int, endings: Iterable[str], after_a: bool = False) -> Optional[str]:
+    """Word without the longest ending found inside word[start:]."""
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            if after_a:
+                cut = len(word) - len(ending)
+                if cut - 1 < start or word[cut - 1] not in "ая":
+                    continue
+            return word[:len(word) - len(ending)]
+    return None
+
+
+def _strip_groups(word: str, start: int, groups: tuple) -> Optional[str]:
+    first = _strip(word, start, groups[0], after_a=True)
+    second = _strip(word, start, groups[1])
+    if first is None:
+        return second
+    if second is None:
+        return first
+    # The longer ending wins.
+    return min(first, second, key=len)
+
+
+# Hotel texts repeat the same few thousand words over and over.
+@lru_cache(maxsize=65536)
+def stem_ru(word: str) -> str:
+    rv, r2 = _regions(word)
+    stripped = _strip_groups(word, rv, PERFECTIVE_GERUND)
+    if stripped is None:
+        word = _strip(word, rv, REFLEXIVE) or word
+        adjective = _strip(word, rv, ADJECTIVE)
+        if adjective is not None:
+            stripped = _strip_groups(adjective, rv, PARTICIPLE) or adjective
+        else:
+            stripped = _strip_groups(word, rv, VERB)
+            if stripped is None:
+                stripped = _strip(word, rv, NOUN)
+    word = stripped if stripped is not None else word
+
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+    word = _strip(word, r2, DERIVATIONAL) or word
+
+    if word.endswith("нн") and len(word) - 1 >= rv:
+        return word[:-1]
+    superlative = _strip(word, rv, SUPERLATIVE)
+    if superlative is not None:
+        word = superlative[:-1] if superlative.endswith("нн") else superlative
+    elif word.endswith("ь") and len(word) - 1 >= rv:
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    tokens = []
+    for word in WORD_RE.findall(text.lower().replace("ё", "е")):
+        tokens.append(stem_ru(word) if CYRILLIC_RE.search(word) else word)
+    return tokens
+
+
+class TextIndex:
+    def __init__(self):
+        self.links: List[str] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._doc_tokens: List[Set[str]] = []
+        self._postings: Dict[str, Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def add(self, link: str, *texts: Optional[str]) -> None:
+        """Adds words of texts to the hotel's document."""
+        for text in texts:
+            self.add_tokens(link, tokenize(text))
+
+    def add_tokens(self, link: str, tokens: Iterable[str]) -> None:
+        """Adds already stemmed tokens to the hotel's document."""
+        doc_id = self._doc_ids.get(link)
+        if doc_id is None:
+            doc_id = self._doc_ids[link] = len(self.links)
+            self.links.append(link)
+            self._doc_tokens.append(set())
+        doc_tokens = self._doc_tokens[doc_id]
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+            posting.add(doc_id)
+            doc_tokens.add(token)
+
+    def replace_tokens(self, link: str, tokens: Iterable[str]) -> None:
+        """Makes tokens the hotel's whole document, dropping its old words."""
+        doc_id = self._doc_ids.get(link)
+        if doc_id is not None:
+            for token in self._doc_tokens[doc_id]:
+                posting = self._postings[token]
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[token]
+            self._doc_tokens[doc_id] = set()
+        self.add_tokens(link, tokens)
+
+    def search(self, query: str) -> Set[str]:
+        """Links of hotels containing every word of the query."""
+        tokens = set(tokenize(query))
+        if not tokens:
+            return set()
+        postings = [self._postings.get(token) for token in tokens]
+        if not all(postings):
+            return set()
+        postings.sort(key=len)
+        doc_ids = set(postings[0])
+        for posting in postings[1:]:
+            doc_ids &= posting
+            if not doc_ids:
+                break
+        return {self.links[doc_id] for doc_id in doc_ids}
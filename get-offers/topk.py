@@ -0,0 +1,58 @@
+import heapq
+from itertools import count
+from typing import Callable, Iterable, List
+
+
+class _Descending:
+    """Orders keys in reverse, so that any comparable key (a tuple too)
+    can sit in the max-heap."""
+
+    __slots__ = ("key",)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other: "_Descending") -> bool:
+        return other.key < self.key
+
+    def __gt__(self, other: "_Descending") -> bool:
+        return self.key < other.key
+
+    def __eq__(self, other: "_Descending") -> bool:
+        return self.key == other.key
+
+
+class TopK:
+    """Keeps the k smallest items seen so far by `key` in a bounded heap.
+
+    Memory stays at O(k) no matter how many items are pushed, so offers
+    can be streamed straight from a scan query.
+    """
+
+    def __init__(self, k: int, key: Callable):
+        self.k = k
+        self.key = key
+        # Max-heap on key via reversed ordering; the counter breaks ties so
+        # that rows themselves are never compared.
+        self._heap = []
+        self._counter = count()
+
+    def push(self, item) -> None:
+        if self.k <= 0:
+            return
+        entry = (_Descending(self.key(item)), -next(self._counter), item)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def extend(self, items: Iterable) -> None:
+        for item in items:
+            self.push(item)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def result(self) -> List:
+        """Items ordered by ascending key, ties in arrival order."""
+        return [item for _, _, item in sorted(self._heap, reverse=True)]
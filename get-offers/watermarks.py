@@ -0,0 +1,29 @@
+"""Named timestamps in `parser/prod/watermarks`.
+
+Small state rows read with a point lookup instead of scanning the
+tables they describe:
+- ``prod_offers``: when the parsers last wrote to `parser/prod/offers`,
+  upserted in the same transaction as the offers.
+- ``hotel_texts/<website>``: created_dttm of the newest raw row whose
+  tokens are in `parser/prod/hotel_texts`.
+"""
+
+PROD_OFFERS = "prod_offers"
+
+watermark_select_query = """DECLARE $name AS Utf8;
+
+SELECT watermark
+FROM `parser/prod/watermarks`
+WHERE name = $name
+"""
+
+watermark_upsert_query = """DECLARE $name AS Utf8;
+DECLARE $watermark AS Datetime;
+
+UPSERT INTO `parser/prod/watermarks` (name, watermark)
+VALUES ($name, $watermark);
+"""
+
+
+def hotel_texts_name(website: str) -> str:
+    return f"hotel_texts/{website}"
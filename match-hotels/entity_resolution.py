@@ -0,0 +1,198 @@
+"""Linking the same hotel across tour operators.
+
+Hotels are compared only inside blocks: an exact normalized-name block
+and MinHash/LSH buckets over name character shingles, so the work grows
+with the number of hotels rather than with the number of pairs. A
+candidate pair is linked when the estimated name similarity passes the
+threshold, the locations share a token and, where both sides have
+coordinates, the hotels are close. Linked hotels are clustered with
+union-find and every cluster keeps the smallest hotel id it already had.
+"""
+import re
+import uuid
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from geo import haversine_km
+
+HOTEL_NAMESPACE = uuid.UUID("0c5b3f8e-7d0a-4f43-9d3c-2b6f1a9e4c71")
+
+# Words that say nothing about which hotel it is.
+STOP_WORDS = frozenset({
+    "hotel", "hotels", "resort", "resorts", "spa", "and", "the", "by",
+    "otel", "отель", "club", "beach", "apartments", "aparthotel", "suites",
+})
+
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Buckets bigger than this come from generic names and are skipped, which
+# keeps the number of compared pairs linear in the number of hotels.
+MAX_BLOCK_SIZE = 50
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+
+
+def _permutations(num_perm: int, seed: int = 1) -> List[Tuple[int, int]]:
+    # A fixed LCG keeps the signatures stable between runs.
+    state, result = seed, []
+    for _ in range(num_perm):
+        state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+        a = state % _PRIME or 1
+        state = (state * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+        result.append((a, state % _PRIME))
+    return result
+
+
+PERMUTATIONS = _permutations(NUM_PERM)
+
+
+def normalize_name(title: Optional[str]) -> str:
+    """"Rixos Premium Seagate 5*" -> "rixos premium seagate"."""
+    if not title:
+        return ""
+    words = re.findall(r"[^\W\d_]+|\d+(?!\s*\*)", title.lower().replace("ё", "е"))
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+
+def location_tokens(location: Optional[str]) -> frozenset:
+    if not location:
+        return frozenset()
+    return frozenset(re.findall(r"[^\W\d_]{3,}", location.lower().replace("ё", "е")))
+
+
+def shingles(name: str) -> set:
+    text = f" {name} "
+    if len(text) <= SHINGLE_SIZE:
+        return {text}
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(items: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [zlib.crc32(item.encode()) for item in items]
+    if not hashes:
+        return ()
+    return tuple(
+        min((a * h + b) % _PRIME for h in hashes) & _MASK
+        for a, b in PERMUTATIONS
+    )
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    if not left or not right:
+        return 0.0
+    return sum(x == y for x, y in zip(left, right)) / len(left)
+
+
+class Hotel:
+    __slots__ = ("website", "link", "title", "name", "location", "latitude", "longitude", "signature")
+
+    def __init__(self, website, link, title, location=None, latitude=None, longitude=None):
+        self.website = website
+        self.link = link
+        self.title = title
+        self.name = normalize_name(title)
+        self.location = location_tokens(location)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.signature = minhash(shingles(self.name)) if self.name else ()
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        return self.website, self.link
+
+
+def candidate_pairs(hotels: List[Hotel]) -> Iterable[Tuple[int, int]]:
+    """Index pairs sharing a block, each pair once."""
+    blocks = defaultdict(list)
+    for i, hotel in enumerate(hotels):
+        if not hotel.name:
+            continue
+        blocks[("name", hotel.name)].append(i)
+        for band in range(BANDS):
+            chunk = hotel.signature[band * ROWS:(band + 1) * ROWS]
+            blocks[("band", band, chunk)].append(i)
+
+    seen = set()
+    for members in blocks.values():
+        if not 2 <= len(members) <= MAX_BLOCK_SIZE:
+            continue
+        for x in range(len(members)):
+            for y in range(x + 1, len(members)):
+                pair = (members[x], members[y])
+                if pair not in seen:
+                    seen.add(pair)
+                    yield pair
+
+
+def is_match(left: Hotel, right: Hotel, threshold: float, max_distance_km: float) -> bool:
+    if left.location and right.location and not left.location & right.location:
+        return False
+    if None not in (left.latitude, left.longitude, right.latitude, right.longitude):
+        distance = haversine_km(left.latitude, left.longitude, right.latitude, right.longitude)
+        if distance > max_distance_km:
+            return False
+    return left.name == right.name or similarity(left.signature, right.signature) >= threshold
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        i, j = self.find(i), self.find(j)
+        if i != j:
+            self.parent[max(i, j)] = min(i, j)
+
+
+def resolve(
+    hotels: List[Hotel],
+    known_ids: Dict[Tuple[str, str], str],
+    threshold: float = 0.7,
+    max_distance_km: float = 1.0,
+) -> Dict[Tuple[str, str], str]:
+    """Hotel id for every (website, link), reusing known ids.
+
+    Hotels that shared an id before stay together, so links only ever
+    merge; a merged cluster keeps the smallest of its known ids.
+    """
+    clusters = UnionFind(len(hotels))
+    for i, j in candidate_pairs(hotels):
+        if is_match(hotels[i], hotels[j], threshold, max_distance_km):
+            clusters.union(i, j)
+
+    by_known_id = {}
+    for i, hotel in enumerate(hotels):
+        known = known_ids.get(hotel.key)
+        if known is not None:
+            if known in by_known_id:
+                clusters.union(i, by_known_id[known])
+            else:
+                by_known_id[known] = i
+
+    members = defaultdict(list)
+    for i in range(len(hotels)):
+        members[clusters.find(i)].append(hotels[i])
+
+    result = {}
+    for cluster in members.values():
+        ids = [known_ids[hotel.key] for hotel in cluster if hotel.key in known_ids]
+        if ids:
+            hotel_id = min(ids)
+        else:
+            first = min(f"{hotel.website}:{hotel.link}" for hotel in cluster)
+            hotel_id = str(uuid.uuid5(HOTEL_NAMESPACE, first))
+        for hotel in cluster:
+            result[hotel.key] = hotel_id
+    return result
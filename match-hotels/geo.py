@@ -0,0 +1,80 @@
+"""Grid index over hotel coordinates for radius searches.
+
+Points are bucketed into cells of `cell_deg` degrees; a radius query only
+visits the cells overlapping the query's bounding box and checks exact
+great-circle distance there.
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+def parse_coordinate(value, limit: float) -> Optional[float]:
+    try:
+        result = float(value)
+    except (TypeError, ValueError):
+        return None
+    if math.isnan(result) or abs(result) > limit:
+        return None
+    return result
+
+
+class GridIndex:
+    def __init__(self, cell_deg: float = 0.25):
+        self.cell_deg = cell_deg
+        self._columns = round(360 / cell_deg)
+        self._cells: Dict[Tuple[int, int], List[tuple]] = {}
+        self._size = 0
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = math.floor((lat + 90) / self.cell_deg)
+        column = math.floor((lng + 180) / self.cell_deg) % self._columns
+        return row, column
+
+    def add(self, key: Hashable, lat: float, lng: float) -> None:
+        self._cells.setdefault(self._cell(lat, lng), []).append((lat, lng, key))
+        self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def within(self, lat: float, lng: float, radius_km: float) -> List[Tuple[float, Hashable]]:
+        """(distance_km, key) pairs within radius_km, nearest first."""
+        lat_delta = radius_km / KM_PER_DEGREE
+        cos_lat = math.cos(math.radians(min(abs(lat) + lat_delta, 90)))
+        if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+            lng_delta = 180
+        else:
+            lng_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+
+        min_row, min_column = self._cell(max(lat - lat_delta, -90), lng - lng_delta)
+        max_row, _ = self._cell(min(lat + lat_delta, 90), lng + lng_delta)
+        num_columns = min(
+            math.floor((lng + lng_delta + 180) / self.cell_deg)
+            - math.floor((lng - lng_delta + 180) / self.cell_deg) + 1,
+            self._columns,
+        )
+
+        found = []
+        for row in range(min_row, max_row + 1):
+            for i in range(num_columns):
+                cell = self._cells.get((row, (min_column + i) % self._columns))
+                if cell is None:
+                    continue
+                for point_lat, point_lng, key in cell:
+                    distance = haversine_km(lat, lng, point_lat, point_lng)
+                    if distance <= radius_km:
+                        found.append((distance, key))
+        found.sort(key=lambda x: x[0])
+        return found
@@ -0,0 +1,115 @@
+import ydb
+import ydb.iam
+import os
+import datetime
+
+import logging
+
+from entity_resolution import Hotel, resolve
+from geo import parse_coordinate
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Create driver in global space.
+driver = ydb.Driver(
+    endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+    credentials=ydb.iam.MetadataUrlCredentials(),)
+# Wait for the driver to become active for requests.
+driver.wait(fail_fast=True, timeout=5)
+# Create the session pool instance to manage YDB sessions.
+pool = ydb.SessionPool(driver)
+
+# Estimated Jaccard similarity of name shingles needed to link two hotels.
+MATCH_THRESHOLD = float(os.getenv("MATCH_THRESHOLD", "0.7"))
+
+# Hotels with coordinates on both sides are never linked farther apart.
+MAX_DISTANCE_KM = float(os.getenv("MAX_DISTANCE_KM", "1"))
+
+WRITE_BATCH_SIZE = 1000
+
+travelata_hotels_query = """SELECT link, SOME(title) AS title, SOME(location) AS location
+FROM `parser/raw/travelata`
+GROUP BY link
+"""
+
+teztour_hotels_query = """SELECT link, SOME(title) AS title, SOME(location_name) AS location,
+    SOME(latitude) AS latitude, SOME(longitude) AS longitude
+FROM `parser/raw/teztour`
+GROUP BY link
+"""
+
+hotel_ids_query = """SELECT website, link, hotel_id
+FROM `parser/prod/hotel_ids`
+"""
+
+hotel_ids_replace_query = """DECLARE $hotel_ids AS List<Struct<
+    website: Utf8,
+    link: Utf8,
+    hotel_id: Utf8,
+    title: Utf8?,
+    updated_dttm: Datetime>>;
+
+REPLACE INTO `parser/prod/hotel_ids`
+SELECT * FROM AS_TABLE($hotel_ids);
+"""
+
+
+def scan(query: str):
+    for response in driver.table_client.scan_query(ydb.ScanQuery(query, {})):
+        yield from response.result_set.rows
+
+
+def load_hotels() -> list:
+    hotels = [
+        Hotel("travelata", row.link, row.title, row.location)
+        for row in scan(travelata_hotels_query)
+    ]
+    for row in scan(teztour_hotels_query):
+        hotels.append(Hotel(
+            "teztour", row.link, row.title, row.location,
+            latitude=parse_coordinate(row.latitude, 90),
+            longitude=parse_coordinate(row.longitude, 180),
+        ))
+    return hotels
+
+
+def create_replace_hotel_ids(rows: list):
+    def _replace_hotel_ids(session):
+        prepared = session.prepare(hotel_ids_replace_query)
+        session.transaction().execute(
+            prepared, {"$hotel_ids": rows},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(10).with_operation_timeout(8)
+        )
+    return _replace_hotel_ids
+
+
+def handler(event, context):
+    hotels = load_hotels()
+    known_ids = {(row.website, row.link): row.hotel_id for row in scan(hotel_ids_query)}
+    logging.info(f"Resolving {len(hotels)} hotels, {len(known_ids)} already mapped")
+
+    hotel_ids = resolve(hotels, known_ids, MATCH_THRESHOLD, MAX_DISTANCE_KM)
+
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+    changed = [
+        {
+            "website": hotel.website, "link": hotel.link,
+            "hotel_id": hotel_ids[hotel.key], "title": hotel.title, "updated_dttm": now,
+        }
+        for hotel in hotels
+        if known_ids.get(hotel.key) != hotel_ids[hotel.key]
+    ]
+    for start in range(0, len(changed), WRITE_BATCH_SIZE):
+        pool.retry_operation_sync(
+            create_replace_hotel_ids(changed[start:start + WRITE_BATCH_SIZE]))
+
+    linked = len(set(hotel_ids.values()))
+    logging.info(f"{len(hotels)} hotels form {linked} entities, {len(changed)} ids written")
+
+    return {
+        "hotels": len(hotels),
+        "entities": linked,
+        "changed": len(changed),
+        'statusCode': 200,
+    }
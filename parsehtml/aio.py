@@ -0,0 +1,141 @@
+"""asyncio execution path for the parsers.
+
+S3 calls run in the default executor so fetches of several pages
+overlap, parsing runs there too to keep the loop free, and batches go to
+YDB through the async driver with the same AIMD control as the sync
+writer.
+"""
+import asyncio
+import functools
+import os
+import time
+from typing import Callable, List, Tuple
+
+import ydb
+import ydb.aio
+import ydb.iam
+
+from ingest import checkpoint_select_query, parse_checkpoints
+from writer import OVERLOAD_ERRORS, AdaptiveWriter
+
+_loop = None
+_pool = None
+
+
+def run_async(coro):
+    """Runs a coroutine on an event loop kept for the whole instance.
+
+    The async driver is bound to its loop, so the loop outlives a single
+    invocation together with the driver.
+    """
+    global _loop
+    if _loop is None:
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+async def get_pool() -> ydb.aio.SessionPool:
+    global _pool
+    if _pool is None:
+        driver = ydb.aio.Driver(
+            endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+            credentials=ydb.iam.MetadataUrlCredentials(),)
+        await driver.wait(fail_fast=True, timeout=5)
+        _pool = ydb.aio.SessionPool(driver, size=int(os.getenv("YDB_MAX_IN_FLIGHT", "4")) * 2)
+    return _pool
+
+
+async def run_blocking(fn: Callable, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+def _read_object(client, Bucket: str, Key: str) -> bytes:
+    return client.get_object(Bucket=Bucket, Key=Key)["Body"].read()
+
+
+async def fetch_page(client, Bucket: str, meta_key: str, object_key: str) -> tuple:
+    """Fetches meta.json and requests content.html concurrently.
+
+    The content comes back as the get_object response with its body not
+    read yet. If it could not be requested its exception is returned
+    instead: that is only an error for pages whose meta is not failed,
+    which the caller decides.
+    """
+    meta, response = await asyncio.gather(
+        run_blocking(_read_object, client, Bucket, meta_key),
+        run_blocking(client.get_object, Bucket=Bucket, Key=object_key),
+        return_exceptions=True,
+    )
+    if isinstance(meta, BaseException):
+        raise meta
+    return meta, response
+
+
+async def load_checkpoints(pool: ydb.aio.SessionPool, parsing_id: str, key: str):
+    async def _select_checkpoints(session):
+        prepared = await session.prepare(checkpoint_select_query)
+        result = await session.transaction().execute(
+            prepared, {"$parsing_id": parsing_id, "$key": key},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+        return result[0].rows
+    return parse_checkpoints(await pool.retry_operation(_select_checkpoints))
+
+
+class AsyncAdaptiveWriter(AdaptiveWriter):
+    """AdaptiveWriter on the async session pool."""
+
+    async def _execute_async(self, first_row: int, last_row: int) -> Tuple[int, int]:
+        query, parameters = self.build_query(first_row, last_row)
+        timeout = self.controller.operation_timeout
+
+        async def _execute_query(session):
+            await session.transaction().execute(
+                query, parameters,
+                commit_tx=True,
+                settings=ydb.BaseRequestSettings().with_timeout(timeout + 1).with_operation_timeout(timeout)
+            )
+
+        def _on_error(e):
+            if isinstance(e, OVERLOAD_ERRORS):
+                self.controller.on_overload()
+
+        started = time.monotonic()
+        try:
+            await self.pool.retry_operation(
+                _execute_query,
+                retry_settings=ydb.RetrySettings(on_ydb_error_callback=_on_error))
+        except Exception as e:
+            raise ValueError(
+                f"Failed with exception {e} at rows {first_row}-{last_row}: {query.yql_text}")
+        self.controller.on_success(time.monotonic() - started)
+        return first_row, last_row
+
+    async def write_async(self, ranges: List[Tuple[int, int]]) -> int:
+        batches = 0
+        running = set()
+
+        async def _collect(return_when):
+            nonlocal running, batches
+            done, running = await asyncio.wait(running, return_when=return_when)
+            for task in done:
+                task.result()
+                batches += 1
+
+        try:
+            for first_row, last_row in ranges:
+                while first_row < last_row:
+                    while len(running) >= self.controller.in_flight:
+                        await _collect(asyncio.FIRST_COMPLETED)
+                    end = self._next_batch(first_row, last_row)
+                    running.add(asyncio.ensure_future(self._execute_async(first_row, end)))
+                    first_row = end
+            if running:
+                await _collect(asyncio.ALL_COMPLETED)
+        finally:
+            # Let batches already sent finish so their checkpoints land.
+            if running:
+                await asyncio.wait(running)
+        return batches
@@ -0,0 +1,162 @@
+"""Declarative card extractor.
+
+A site spec names the card selector and an ordered list of fields::
+
+    {
+        "website": "https://travelata.ru/",
+        "card": {"tag": "div", "class": "serpHotelCard"},
+        "fields": [
+            {"name": "title", "tag": "a", "class": "serpHotelCard__title"},
+            {"name": "href", "tag": "a", "class": "serpHotelCard__title",
+             "attr": "href"},
+            {"name": "num_stars", "tag": "i", "class": "icon-i16_star",
+             "count": True},
+        ],
+    }
+
+Field keys:
+
+* ``tag``, ``class`` - element to look up inside the card (first match).
+* ``within`` - optional ``{"tag", "class"}`` parent to look inside of.
+* ``attr`` - take this attribute instead of the element text. List valued
+  attributes (``class``) are joined with ``;``.
+* ``all`` - join the text of every match with ``;``.
+* ``count`` - number of matches.
+* ``index`` - take the n-th match instead of the first one.
+* ``required`` - raise ``ValueError`` when the element is missing
+  (default ``True``), otherwise the field is ``None``.
+* ``group`` - attribute fields of one group are filled all together: if any
+  of them is missing on the element, every one of them is ``None``.
+
+Specs are compiled once at import; fields sharing a selector share a
+single lookup per card.
+"""
+from typing import Callable, List
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+SEPARATOR = ";"
+
+
+def _text(node) -> str:
+    return node.get_text(" ", strip=True)
+
+
+def _selector_key(field: dict) -> tuple:
+    within = field.get("within")
+    parent = (within["tag"], within["class"]) if within else None
+    many = field.get("all", False) or field.get("count", False)
+    return parent, field["tag"], field["class"], many, field.get("index")
+
+
+def _compile_lookup(field: dict) -> Callable:
+    tag, class_ = field["tag"], field["class"]
+    within = field.get("within")
+    many = field.get("all", False) or field.get("count", False)
+    index = field.get("index")
+
+    if many:
+        def find(node):
+            return node.find_all(tag, class_=class_)
+    elif index is not None:
+        def find(node):
+            found = node.find_all(tag, class_=class_, limit=index + 1)
+            return found[index] if len(found) > index else None
+    else:
+        def find(node):
+            return node.find(tag, class_=class_)
+
+    if within is None:
+        return find
+
+    parent_tag, parent_class = within["tag"], within["class"]
+    missing = [] if many else None
+
+    def lookup(card):
+        parent = card.find(parent_tag, class_=parent_class)
+        return missing if parent is None else find(parent)
+    return lookup
+
+
+def _compile_value(field: dict) -> Callable:
+    if field.get("count", False):
+        return len
+    if field.get("all", False):
+        return lambda nodes: SEPARATOR.join(map(_text, nodes))
+
+    attr = field.get("attr")
+    if attr is None:
+        return _text
+
+    def value(node):
+        result = node.attrs[attr]
+        if isinstance(result, list):
+            return SEPARATOR.join(result)
+        return result
+    return value
+
+
+class Extractor:
+    """Compiled form of a site spec."""
+
+    def __init__(self, spec: dict):
+        self.website = spec["website"]
+        self.card_tag = spec["card"]["tag"]
+        self.card_class = spec["card"]["class"]
+        self.fields = [field["name"] for field in spec["fields"]]
+
+        keys = {}
+        self._lookups = []
+        self._getters = []
+        self._groups = {}
+        for field in spec["fields"]:
+            key = _selector_key(field)
+            if key not in keys:
+                keys[key] = len(self._lookups)
+                self._lookups.append(_compile_lookup(field))
+            group = field.get("group")
+            if group is not None:
+                self._groups.setdefault(group, []).append(field["name"])
+            self._getters.append((
+                field["name"], keys[key], _compile_value(field),
+                field.get("required", True), group,
+                f"Element {field['tag']} with class {field['class']}",
+            ))
+
+    def _is_card_class(self, value) -> bool:
+        # While parsing, the strainer sees the raw "a b" class string.
+        if value is None:
+            return False
+        classes = value.split() if isinstance(value, str) else value
+        return self.card_class in classes
+
+    def make_soup(self, content) -> BeautifulSoup:
+        # Only card subtrees are built, the rest of the page is skipped.
+        strainer = SoupStrainer(self.card_tag, class_=self._is_card_class)
+        return BeautifulSoup(content, "html.parser", parse_only=strainer)
+
+    def get_cards(self, soup: BeautifulSoup) -> List[BeautifulSoup]:
+        return soup.find_all(self.card_tag, class_=self.card_class)
+
+    def parse_card(self, card: BeautifulSoup) -> dict:
+        nodes = [lookup(card) for lookup in self._lookups]
+        result = {}
+        failed_groups = set()
+        for name, i, value, required, group, element in self._getters:
+            node = nodes[i]
+            if node is None:
+                if required:
+                    raise ValueError(f"{element} not found")
+                result[name] = None
+                continue
+            try:
+                result[name] = value(node)
+            except KeyError:
+                if group is None:
+                    raise ValueError(f"{element} has no attribute for {name}")
+                failed_groups.add(group)
+                result[name] = None
+        for group in failed_groups:
+            for name in self._groups[group]:
+                result[name] = None
+        return result
@@ -5,6 +5,10 @@ import json
 
 import logging
 
+from slog import EventLogger
+
+log = EventLogger()
+
 boto_session = boto3.session.Session(
     aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
     aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"]
@@ -26,146 +30,145 @@ driver.wait(fail_fast=True, timeout=5)
 pool = ydb.SessionPool(driver)
 
 from typing import Optional, Callable
-from bs4 import BeautifulSoup
-
-
-def get_text(
-    soup: BeautifulSoup,
-    element: str,
-    class_: str,
-    raise_error: bool = True,
-    attrs: Optional[list] = None,
-) -> str:
-    card = soup.find(element, class_=class_)
-
-    if card is None and raise_error:
-        raise ValueError(f"Element {element} with class {class_} not found")
-    elif card is None:
-        if attrs is None:
-            return None
-        else:
-            return None, *(None for _ in range(len(attrs)))
-    else:
-        text = card.get_text(" ", strip=True)
-        if attrs is None:
-            return text
-        else:
-            attr_value = (card.attrs[a] for a in attrs)
-            return text, *attr_value
+
+from extractor import Extractor
+from site_specs import TRAVELATA
 
 
 from functools import wraps
 import datetime
 from urllib.parse import urljoin
 from hashlib import md5
-import uuid
 
 
-def parse_func_wrapper(website: str, time_fmt: str = "%Y-%m-%dT%H:%M:%SZ") -> Callable:
+TIME_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def parse_func_wrapper(website: str) -> Callable:
     def dec_outer(fn):
         @wraps(fn)
         def somedec_inner(*args, **kwargs):
             result = fn(*args, **kwargs)
-            result["created_dttm"] = datetime.datetime.now().strftime(time_fmt)
             result["website"] = website
             result["link"] = urljoin(website, result["href"])
             result["offer_hash"] = md5(result["link"].encode()).hexdigest()
-            result["row_id"] = str(uuid.uuid4())
             return result
 
         return somedec_inner
 
     return dec_outer
 
+from page_cache import PageCache, page_digest
+from price_history import (
+    latest_points, apply_points, heads_select_template, heads_replace_query,
+    to_timestamp,
+)
+from offers import NORMALIZERS, prod_offers_upsert_query, prod_rows
+from subscriptions import (
+    build_index, match_offers, subscriptions_select_query, matches_upsert_query,
+)
+import time
+from content import (
+    CONTENT_NAME, candidate_keys, content_keys, get_content_object, is_missing,
+    read_content,
+)
+from writer import AdaptiveWriter, AimdController
+import aio
+from tracing import Span, Tracer
+import asyncio
+from ingest import (
+    stamp_rows, pending_ranges, parse_checkpoints,
+    checkpoint_select_query, create_checkpoint_query,
+)
+
+# Bump when get_cards/parse_card output changes so cached pages are reparsed.
+PARSER_VERSION = "1"
+
+# Initial rows per batch, the writer adapts it from there.
+BATCH_SIZE = 5
+
+# Price drops of at least this many percent are reported.
+PRICE_DROP_PCT = float(os.getenv("PRICE_DROP_PCT", "10"))
+
+# "sync" or "async", see aio.py.
+PARSER_MODE = os.getenv("PARSER_MODE", "sync")
+
+# Saved searches are reloaded at most this often per instance.
+SUBSCRIPTIONS_TTL = int(os.getenv("SUBSCRIPTIONS_TTL", "300"))
+
+_subscription_index = None
+_subscription_index_built = 0
+
+# OTLP/JSON span export target, see tracing.py.
+tracer = Tracer("parsehtml", os.getenv("TRACE_EXPORT"))
+
+page_cache = PageCache(max_entries=int(os.getenv("PAGE_CACHE_SIZE", "32")))
+
 import os
 from typing import List
 
 def update_dicts(dicts: List[dict], **kwargs) -> List[dict]:
     return list(map(lambda x: {**x, **kwargs}, dicts))
 
-def get_cards_travelata(soup: BeautifulSoup) -> List[dict]:
-    return soup.find_all("div", class_="serpHotelCard")
-
-@parse_func_wrapper("https://travelata.ru/")
-def parse_hotel_card_travelata(card: BeautifulSoup) -> dict:
-    title, href = get_text(card, "a", "serpHotelCard__title", attrs=["href"])
-    location = get_text(card, "a", class_="serpHotelCard__resort")
-
-    distances_card = card.find("div", class_="serpHotelCard__distances")
-    if distances_card is not None:
-        distances = list(
-            map(
-                lambda x: x.get_text(" ", strip=True),
-                distances_card.find_all("div", class_="serpHotelCard__distance"),
-            )
-        )
-    else:
-        distances = []
-
-    distances_str = ';'.join(distances)
+extractor = Extractor(TRAVELATA)
 
-    rating = get_text(card, "div", "serpHotelCard__rating")
-    reviews = get_text(card, "a", "hotel-reviews", raise_error=False)
-    less_places = get_text(
-        card, "div", "serpHotelCard__tip__less-places", raise_error=False
-    )
-    num_stars = len(card.find_all("i", "icon-i16_star"))
+get_cards = extractor.get_cards
+parse_card = parse_func_wrapper(extractor.website)(extractor.parse_card)
+normalize_offer = NORMALIZERS["travelata"]
 
-    orders_count = get_text(
-        card, "div", "serpHotelCard__ordersCount", raise_error=False
+def delete_page_objects(client, Bucket: str, Key: str):
+    prefix = "/".join(Key.split("/")[:-1])
+    keys = [Key, os.path.join(prefix, "meta.json")] + content_keys(prefix)
+    # Content may be stored under any codec suffix; missing keys are no-ops.
+    client.delete_objects(
+        Bucket=Bucket,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
     )
-    criteria = get_text(card, "div", "serpHotelCard__criteria")
-    price = get_text(card, "span", "serpHotelCard__btn-price")
-    oil_tax = get_text(card, "span", "serpHotelCard__btn-oilTax")
-
-    attributes_cards = card.find_all("div", class_="serpHotelCard__attribute")
-    attributes = ";".join(map(lambda x: x.get_text(" ", strip=True), attributes_cards))
 
-    return {
-        "title": title,
-        "href": href,
-        "location": location,
-        "distances": distances_str,
-        "rating": rating,
-        "reviews": reviews,
-        "less_places": less_places,
-        "num_stars": num_stars,
-        "orders_count": orders_count,
-        "criteria": criteria,
-        "price": price,
-        "oil_tax": oil_tax,
-        "attributes": attributes,
-    }
+def parse_page(
+    content: bytes, meta: dict, Bucket: str, Key: str,
+    get_cards: Callable, parse_card: Callable,
+    cache: Optional[PageCache] = None,
+) -> list:
+    digest = page_digest(content, PARSER_VERSION)
+    cached = cache.get(digest) if cache is not None else None
+    if cached is not None:
+        logging.info(f"Page {digest} already parsed, reusing cards")
+        result = cached
+    else:
+        soup = extractor.make_soup(content)
+        cards = get_cards(soup)
+        result = list(map(parse_card, cards))
+        if cache is not None:
+            cache.put(digest, result)
+    return update_dicts(
+        result, parsing_id=meta["parsing_id"], key=Key, bucket=Bucket)
 
 def load_process_html_cards_from_s3(
     client, Bucket: str, Key: str,
-    get_cards: Callable, parse_card: Callable
+    get_cards: Callable, parse_card: Callable,
+    cache: Optional[PageCache] = None,
+    span: Optional[Span] = None,
 ) -> list:
     prefix = "/".join(Key.split("/")[:-1])
-    object_key = os.path.join(prefix, "content.html")
     meta_key = os.path.join(prefix, "meta.json")
 
     meta_object_response = client.get_object(
         Bucket=Bucket, Key=meta_key)
 
     meta = json.loads(meta_object_response["Body"].read())
+    if span is not None:
+        span.bind_meta(meta)
 
     if not meta["failed"]:
         logging.info("Start parsing object")
-        get_object_response = client.get_object(
-            Bucket=Bucket, Key=object_key)
-        content = get_object_response["Body"].read()
-        soup = BeautifulSoup(content, "html.parser")
-        cards = get_cards(soup)
-        result = list(map(parse_card, cards))
+        object_key, get_object_response = get_content_object(
+            lambda key: client.get_object(Bucket=Bucket, Key=key),
+            candidate_keys(prefix, meta))
+        content = read_content(get_object_response, object_key, meta)
+        result_with_meta = parse_page(
+            content, meta, Bucket, Key, get_cards, parse_card, cache=cache)
         logging.info("End parsing object")
-        result_with_meta = update_dicts(
-            result, parsing_id=meta["parsing_id"], key=Key, bucket=Bucket)
-        
-        logging.info("Deleting objects")
-        client.delete_object(Bucket=Bucket, Key=Key)
-        client.delete_object(Bucket=Bucket, Key=object_key)
-        client.delete_object(Bucket=Bucket, Key=meta_key)
         return result_with_meta
     else:
         logging.error("Failed flg in meta")
@@ -173,11 +176,19 @@ def load_process_html_cards_from_s3(
         client.delete_object(Bucket=Bucket, Key=meta_key)
         return None
 
-def format_record(record: list):
-    return '''("{}","{}","{}","{}","{}","{}","{}","{}","{}","{}","{}",
-    "{}","{}",cast("{}" as datetime),"{}","{}","{}","{}","{}","{}","{}")'''.format(*record.values())
+def format_record(record: dict):
+    template = (
+        '("{title}","{href}","{location}","{distances}",'
+        '"{rating}","{reviews}","{less_places}",'
+        '"{num_stars}","{orders_count}","{criteria}",'
+        '"{price}","{oil_tax}","{attributes}",'
+        'cast("{created_dttm}" as datetime),"{website}",'
+        '"{link}","{offer_hash}","{row_id}","{parsing_id}",'
+        '"{key}","{bucket}")'
+    )
+    return template.format(**record)
 
-def create_statement(data: list) -> str:
+def create_statement(records: list) -> str:
     query = """
     REPLACE INTO `parser/raw/travelata`(
         title, href, location, distances, 
@@ -188,21 +199,10 @@ def create_statement(data: list) -> str:
         key, bucket)
     VALUES
     {}
-    """.format(',\n'.join(map(format_record, data)))
+    """.format(',\n'.join(records))
 
     return query
 
-def create_queries(data, max_records):
-
-    queries = []
-    for i in range(len(data) // max_records + 1):
-        sub_data = data[i * max_records: (i + 1) * max_records]
-        if len(sub_data) > 0:
-            queries.append(
-                create_statement(data[i * max_records: (i + 1) * max_records])
-            )
-    return queries
-
 def create_execute_query(query):
   # Create the transaction and execute query.
     def _execute_query(session):
@@ -213,30 +213,238 @@ def create_execute_query(query):
         )
     return _execute_query
 
-def process_file(Bucket, Key):
-    result = load_process_html_cards_from_s3(
-        s3, Bucket, Key, 
-        get_cards_travelata, parse_hotel_card_travelata
+def load_checkpoints(parsing_id: str, key: str):
+    def _select_checkpoints(session):
+        prepared = session.prepare(checkpoint_select_query)
+        return session.transaction().execute(
+            prepared, {"$parsing_id": parsing_id, "$key": key},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )[0].rows
+    return parse_checkpoints(pool.retry_operation_sync(_select_checkpoints))
+
+def update_price_history(rows: list) -> list:
+    points = latest_points(rows)
+    if not points:
+        return []
+    query = heads_select_template.format(
+        offer_hashes=",".join(f'"{offer_hash}"' for offer_hash in points))
+
+    def _update_history(session):
+        # Heads are read and replaced in one serializable transaction so
+        # concurrent pages with the same offer don't lose points.
+        tx = session.transaction(ydb.SerializableReadWrite()).begin()
+        heads = tx.execute(query)[0].rows
+        new_heads, sealed, drops = apply_points(heads, points, PRICE_DROP_PCT)
+        prepared = session.prepare(heads_replace_query)
+        tx.execute(
+            prepared, {"$heads": new_heads, "$sealed": sealed},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+        return drops
+
+    drops = pool.retry_operation_sync(_update_history)
+    for drop in drops:
+        log.info("price.drop", **drop)
+    return drops
+
+def get_subscription_index():
+    global _subscription_index, _subscription_index_built
+    now = time.monotonic()
+    if _subscription_index is None or now - _subscription_index_built > SUBSCRIPTIONS_TTL:
+        rows = []
+        query = ydb.ScanQuery(subscriptions_select_query, {})
+        for response in driver.table_client.scan_query(query):
+            rows.extend(response.result_set.rows)
+        index = build_index(rows)
+        logging.info(f"Built subscription index over {len(index)} searches")
+        _subscription_index, _subscription_index_built = index, now
+    return _subscription_index
+
+def write_prod_offers(offers: list, created_dttm: int) -> int:
+    rows = prod_rows(offers, created_dttm)
+    if not rows:
+        return 0
+
+    def _upsert_offers(session):
+        prepared = session.prepare(prod_offers_upsert_query)
+        session.transaction().execute(
+            prepared, {"$offers": rows},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+
+    pool.retry_operation_sync(_upsert_offers)
+    return len(rows)
+
+def notify_subscribers(offers: list, created_dttm: int) -> list:
+    index = get_subscription_index()
+    if len(index) == 0:
+        return []
+    matches = match_offers(index, offers, created_dttm)
+    if not matches:
+        return []
+
+    def _upsert_matches(session):
+        prepared = session.prepare(matches_upsert_query)
+        session.transaction().execute(
+            prepared, {"$matches": matches},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+
+    pool.retry_operation_sync(_upsert_matches)
+    logging.info(f"Matched {len(matches)} offers to saved searches")
+    return matches
+
+def publish_offers(rows: list) -> list:
+    # Rows are normalized once for both the prod table and subscriptions.
+    offers = list(filter(None, map(normalize_offer, rows)))
+    if not offers:
+        return []
+    created_dttm = to_timestamp(rows[0]["created_dttm"])
+    write_prod_offers(offers, created_dttm)
+    notify_subscribers(offers, created_dttm)
+    return offers
+
+def prepare_write(result: list, Key: str, checkpoints: tuple) -> tuple:
+    parsing_id = result[0]["parsing_id"]
+    committed, created_dttm = checkpoints
+    if created_dttm is None:
+        created_dttm = datetime.datetime.now().strftime(TIME_FMT)
+    else:
+        logging.info(f"Resuming {Key} after {len(committed)} committed batches")
+
+    rows = stamp_rows(result, created_dttm)
+    formatted = list(map(format_record, rows))
+
+    def build_query(first_row, last_row):
+        return create_checkpoint_query(
+            create_statement(formatted[first_row:last_row]),
+            parsing_id, Key, first_row, last_row, created_dttm)
+
+    ranges = pending_ranges(len(rows), committed, max_records=len(rows))
+    return rows, build_query, list(map(len, formatted)), ranges
+
+def create_controller() -> AimdController:
+    return AimdController(
+        batch_size=BATCH_SIZE,
+        max_in_flight=int(os.getenv("YDB_MAX_IN_FLIGHT", "4")),
     )
 
+def write_rows(result: list, Key: str):
+    checkpoints = load_checkpoints(result[0]["parsing_id"], Key)
+    rows, build_query, row_sizes, ranges = prepare_write(result, Key, checkpoints)
+    writer = AdaptiveWriter(pool, build_query, row_sizes, create_controller())
+    writer.write(ranges)
+    update_price_history(rows)
+    publish_offers(rows)
+
+def process_file(Bucket, Key, created_at=None):
+    with tracer.page(queued_at=created_at, website="travelata", key=Key) as span:
+        return _process_file(Bucket, Key, span)
+
+def _process_file(Bucket, Key, span: Span):
+    # S3 reads and extraction; the sync path doesn't split them.
+    with span.child("load"):
+        result = load_process_html_cards_from_s3(
+            s3, Bucket, Key,
+            get_cards, parse_card,
+            cache=page_cache, span=span,
+        )
+
     if result is None:
         return 0
 
-    queries = create_queries(result, max_records=5)
-    for query in queries:
-        try:
-            pool.retry_operation_sync(create_execute_query(query))
-        except:
-            raise ValueError(f"Failed at query {query}")
-        
+    if len(result) > 0:
+        with span.child("ydb.write", rows=len(result)):
+            write_rows(result, Key)
+
+    # Source objects go only once every batch is committed, so a failed
+    # write leaves the page in place for the retry.
+    with span.child("s3.delete"):
+        delete_page_objects(s3, Bucket, Key)
     return len(result)
-    
+
+async def process_file_async(Bucket, Key, created_at=None):
+    with tracer.page(queued_at=created_at, website="travelata", key=Key) as span:
+        return await _process_file_async(Bucket, Key, span)
+
+async def _process_file_async(Bucket, Key, span: Span):
+    prefix = "/".join(Key.split("/")[:-1])
+    meta_key = os.path.join(prefix, "meta.json")
+
+    # Plain content.html is requested together with meta; a page whose
+    # meta names a codec, or whose plain content is missing, is requested
+    # again under the other keys.
+    plain_key = os.path.join(prefix, CONTENT_NAME)
+    with span.child("s3.read"):
+        meta_body, response = await aio.fetch_page(s3, Bucket, meta_key, plain_key)
+    meta = json.loads(meta_body)
+    span.bind_meta(meta)
+    keys = candidate_keys(prefix, meta)
+    object_key = keys[0]
+
+    if meta["failed"] or object_key != plain_key:
+        if isinstance(response, dict):
+            response["Body"].close()
+    if meta["failed"]:
+        logging.error("Failed flg in meta")
+        await aio.run_blocking(s3.delete_object, Bucket=Bucket, Key=Key)
+        await aio.run_blocking(s3.delete_object, Bucket=Bucket, Key=meta_key)
+        return 0
+    if object_key == plain_key and isinstance(response, BaseException):
+        if not is_missing(response):
+            raise response
+        keys = keys[1:]
+    if object_key != plain_key or isinstance(response, BaseException):
+        object_key, response = await aio.run_blocking(
+            get_content_object,
+            lambda key: s3.get_object(Bucket=Bucket, Key=key), keys)
+    with span.child("s3.read"):
+        content = await aio.run_blocking(read_content, response, object_key, meta)
+
+    with span.child("extract"):
+        result = await aio.run_blocking(
+            parse_page, content, meta, Bucket, Key,
+            get_cards, parse_card, cache=page_cache)
+
+    if len(result) > 0:
+        with span.child("ydb.write", rows=len(result)):
+            aio_pool = await aio.get_pool()
+            checkpoints = await aio.load_checkpoints(aio_pool, result[0]["parsing_id"], Key)
+            rows, build_query, row_sizes, ranges = prepare_write(result, Key, checkpoints)
+            writer = aio.AsyncAdaptiveWriter(aio_pool, build_query, row_sizes, create_controller())
+            await writer.write_async(ranges)
+            await aio.run_blocking(update_price_history, rows)
+            await aio.run_blocking(publish_offers, rows)
+
+    with span.child("s3.delete"):
+        await aio.run_blocking(delete_page_objects, s3, Bucket, Key)
+    return len(result)
+
+async def process_messages_async(messages: list) -> int:
+    lengths = await asyncio.gather(*(
+        process_file_async(
+            Bucket=message["details"]["bucket_id"],
+            Key=message["details"]["object_id"],
+            created_at=message.get("event_metadata", {}).get("created_at"))
+        for message in messages
+    ))
+    return sum(lengths)
+
 def handler(event, context):
 
-    length = process_file(
-        Bucket=event["messages"][0]["details"]["bucket_id"],
-        Key=event["messages"][0]["details"]["object_id"]
-    )
+    if PARSER_MODE == "async":
+        # Every page of the trigger batch is processed concurrently.
+        length = aio.run_async(process_messages_async(event["messages"]))
+    else:
+        length = process_file(
+            Bucket=event["messages"][0]["details"]["bucket_id"],
+            Key=event["messages"][0]["details"]["object_id"],
+            created_at=event["messages"][0].get("event_metadata", {}).get("created_at"),
+        )
 
     return {
         "objects": length,
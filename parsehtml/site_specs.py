@@ -0,0 +1,83 @@
+"""Card extraction specs per tour operator, see extractor.py for the format.
+
+Field order is the column order of the site's raw table.
+"""
+
+TRAVELATA = {
+    "website": "https://travelata.ru/",
+    "card": {"tag": "div", "class": "serpHotelCard"},
+    "fields": [
+        {"name": "title", "tag": "a", "class": "serpHotelCard__title"},
+        {"name": "href", "tag": "a", "class": "serpHotelCard__title", "attr": "href"},
+        {"name": "location", "tag": "a", "class": "serpHotelCard__resort"},
+        {
+            "name": "distances", "tag": "div", "class": "serpHotelCard__distance",
+            "within": {"tag": "div", "class": "serpHotelCard__distances"},
+            "all": True,
+        },
+        {"name": "rating", "tag": "div", "class": "serpHotelCard__rating"},
+        {"name": "reviews", "tag": "a", "class": "hotel-reviews", "required": False},
+        {
+            "name": "less_places", "tag": "div",
+            "class": "serpHotelCard__tip__less-places", "required": False,
+        },
+        {"name": "num_stars", "tag": "i", "class": "icon-i16_star", "count": True},
+        {
+            "name": "orders_count", "tag": "div",
+            "class": "serpHotelCard__ordersCount", "required": False,
+        },
+        {"name": "criteria", "tag": "div", "class": "serpHotelCard__criteria"},
+        {"name": "price", "tag": "span", "class": "serpHotelCard__btn-price"},
+        {"name": "oil_tax", "tag": "span", "class": "serpHotelCard__btn-oilTax"},
+        {
+            "name": "attributes", "tag": "div", "class": "serpHotelCard__attribute",
+            "all": True,
+        },
+    ],
+}
+
+_CITY_NAME = {"tag": "div", "class": "city-name"}
+
+TEZTOUR = {
+    "website": "https://tourist.tez-tour.com/",
+    "card": {"tag": "div", "class": "hotel_point"},
+    "fields": [
+        {"name": "href", "tag": "a", "class": "fav-detailurl", "attr": "href"},
+        {"name": "preview_img", "tag": "img", "class": "preview", "attr": "src"},
+        {"name": "location_name", **_CITY_NAME},
+        {"name": "hotel_id", **_CITY_NAME, "attr": "data-hotel-id", "group": "city"},
+        {"name": "hotel_rating", **_CITY_NAME, "attr": "data-hotel-rating", "group": "city"},
+        {
+            "name": "hotel_rating_text", **_CITY_NAME,
+            "attr": "data-hotel-rating-text", "group": "city",
+        },
+        {"name": "latitude", **_CITY_NAME, "attr": "data-lat", "group": "city"},
+        {"name": "longitude", **_CITY_NAME, "attr": "data-lng", "group": "city"},
+        {"name": "title", **_CITY_NAME, "attr": "data-title", "group": "city"},
+        {
+            "name": "hint_text", "tag": "div", "class": "clipped-text",
+            "attr": "data-title", "required": False,
+        },
+        {
+            "name": "amenities_list", "tag": "h6", "class": "hotel-amenities-item",
+            "all": True,
+        },
+        {
+            "name": "departure_info", "tag": "div", "class": "type",
+            "within": {"tag": "div", "class": "inline-visible"},
+        },
+        {"name": "mealplan", "tag": "div", "class": "fav-mealplan"},
+        {"name": "room_type", "tag": "div", "class": "fav-room"},
+        {"name": "currency", "tag": "a", "class": "price-box", "attr": "data-currency"},
+        {"name": "price", "tag": "a", "class": "price-box", "attr": "data-price"},
+        {"name": "price_box", "tag": "div", "class": "price-box-hint"},
+        {"name": "price_include", "tag": "ul", "class": "price-include"},
+        {"name": "till_info", "tag": "div", "class": "type", "index": 2},
+        {"name": "stars_class", "tag": "div", "class": "hotel-star-box", "attr": "class"},
+    ],
+}
+
+SITE_SPECS = {
+    "travelata": TRAVELATA,
+    "teztour": TEZTOUR,
+}
@@ -0,0 +1,121 @@
+"""Matching new offers against saved searches.
+
+A subscription holds the bot wizard's parameters (country_name,
+min_departure_date, interval_days, min_nights, max_nights, num_stars) with
+the same meaning as in get-offers. Subscriptions are kept in an inverted
+index from parameter values to subscription ids, so each offer is matched
+by intersecting a few posting sets instead of checking every subscriber.
+"""
+import datetime
+import json
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+MAX_STARS = 5
+
+subscriptions_select_query = """SELECT user_id, subscription_id, params
+FROM `users/subscriptions`
+"""
+
+matches_upsert_query = """DECLARE $matches AS List<Struct<
+    user_id: Int64,
+    offer_hash: Utf8,
+    subscription_id: Utf8,
+    link: Utf8,
+    title: Utf8?,
+    price: Int64,
+    start_date: Date,
+    num_nights: Int32,
+    created_dttm: Datetime>>;
+
+UPSERT INTO `users/subscription_matches`
+SELECT * FROM AS_TABLE($matches);
+"""
+
+
+class SubscriptionIndex:
+    def __init__(self, today: Optional[datetime.date] = None):
+        self.today = today or datetime.date.today()
+        self.users: Dict[str, int] = {}
+        self._country: Dict[Optional[str], Set[str]] = defaultdict(set)
+        self._nights: Dict[int, Set[str]] = defaultdict(set)
+        self._stars: Dict[int, Set[str]] = defaultdict(set)
+        self._dates: Dict[int, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def add(self, subscription_id: str, user_id: int, params: dict) -> bool:
+        """Indexes a subscription; incomplete or expired ones are skipped."""
+        try:
+            min_date = datetime.date.fromisoformat(params["min_departure_date"])
+            max_date = min_date + datetime.timedelta(int(params["interval_days"]))
+            nights = range(int(params["min_nights"]), int(params["max_nights"]) + 1)
+            num_stars = int(params["num_stars"])
+            country = params["country_name"]
+        except (KeyError, TypeError, ValueError):
+            return False
+        if max_date < self.today or not nights:
+            return False
+
+        self.users[subscription_id] = user_id
+        self._country[country].add(subscription_id)
+        for num_nights in nights:
+            self._nights[num_nights].add(subscription_id)
+        # An offer with n stars matches every subscription asking for at
+        # most n, so the posting for n holds all of them.
+        for stars in range(max(num_stars, 0), MAX_STARS + 1):
+            self._stars[stars].add(subscription_id)
+        for day in range(max(min_date, self.today).toordinal(), max_date.toordinal() + 1):
+            self._dates[day].add(subscription_id)
+        return True
+
+    def match(self, offer: dict) -> Set[str]:
+        postings = [
+            self._nights.get(offer["num_nights"]),
+            self._stars.get(min(offer["num_stars"], MAX_STARS)),
+            self._dates.get(offer["start_date"].toordinal()),
+        ]
+        if not all(postings):
+            return set()
+        country = self._country.get(offer["country_name"], set()) | self._country.get(None, set())
+        postings.append(country)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            result &= posting
+            if not result:
+                break
+        return result
+
+
+def build_index(rows: Iterable, today: Optional[datetime.date] = None) -> SubscriptionIndex:
+    """Index from rows read by subscriptions_select_query."""
+    index = SubscriptionIndex(today)
+    for row in rows:
+        try:
+            params = json.loads(row.params)
+        except (TypeError, ValueError):
+            continue
+        index.add(row.subscription_id, row.user_id, params)
+    return index
+
+
+def match_offers(index: SubscriptionIndex, offers: Iterable[dict], created_dttm: int) -> List[dict]:
+    """Rows for matches_upsert_query, one per user and offer."""
+    matches = {}
+    for offer in offers:
+        for subscription_id in index.match(offer):
+            user_id = index.users[subscription_id]
+            matches[(user_id, offer["offer_hash"])] = {
+                "user_id": user_id,
+                "offer_hash": offer["offer_hash"],
+                "subscription_id": subscription_id,
+                "link": offer["link"],
+                "title": offer["title"],
+                "price": offer["price"],
+                "start_date": offer["start_date"],
+                "num_nights": offer["num_nights"],
+                "created_dttm": created_dttm,
+            }
+    return list(matches.values())
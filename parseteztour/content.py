@@ -0,0 +1,104 @@
+"""Reading possibly compressed content.html objects.
+
+Scrapers may upload the page as ``content.html``, ``content.html.gz`` or
+``content.html.zst``. The codec is taken from the object key suffix,
+then from the object's Content-Encoding, then from ``content_encoding``
+in meta.json, and the body is decompressed chunk by chunk as it streams
+from S3. Unknown encodings, and ``identity``, are read as uncompressed.
+
+The key named by meta.json is tried first; if it doesn't exist, the
+other keys the content may be stored under are tried in turn, so a
+compressed page whose meta lacks ``content_encoding`` is still found.
+"""
+import gzip
+import os
+from typing import Callable, List, Optional, Tuple
+
+CONTENT_NAME = "content.html"
+
+CODEC_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst",
+}
+
+ENCODINGS = {
+    "gzip": "gzip",
+    "x-gzip": "gzip",
+    "zstd": "zstd",
+    "identity": None,
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_key(prefix: str, meta: dict) -> str:
+    codec = parse_encoding(meta.get("content_encoding"))
+    return os.path.join(prefix, CONTENT_NAME + CODEC_SUFFIXES.get(codec, ""))
+
+
+def content_keys(prefix: str) -> List[str]:
+    """Every key a page's content may be stored under."""
+    return [os.path.join(prefix, CONTENT_NAME)] + [
+        os.path.join(prefix, CONTENT_NAME + suffix) for suffix in CODEC_SUFFIXES.values()
+    ]
+
+
+def candidate_keys(prefix: str, meta: dict) -> List[str]:
+    """content_key first, then the other keys the content may be under."""
+    first = content_key(prefix, meta)
+    return [first] + [key for key in content_keys(prefix) if key != first]
+
+
+def is_missing(error: BaseException) -> bool:
+    if isinstance(error, FileNotFoundError):
+        return True
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in ("NoSuchKey", "404")
+
+
+def get_content_object(get_object: Callable[[str], dict], keys: List[str]) -> Tuple[str, dict]:
+    """(key, response) of the first of keys that exists."""
+    for key in keys[:-1]:
+        try:
+            return key, get_object(key)
+        except Exception as e:
+            if not is_missing(e):
+                raise
+    return keys[-1], get_object(keys[-1])
+
+
+def parse_encoding(value: Optional[str]) -> Optional[str]:
+    if not value:
+        return None
+    return ENCODINGS.get(value.strip().lower())
+
+
+def detect_codec(key: str, content_encoding: Optional[str], meta: dict) -> Optional[str]:
+    for codec, suffix in CODEC_SUFFIXES.items():
+        if key.endswith(suffix):
+            return codec
+    return parse_encoding(content_encoding) or parse_encoding(meta.get("content_encoding"))
+
+
+def decompressing_reader(stream, codec: Optional[str]):
+    if codec is None:
+        return stream
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=stream, mode="rb")
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(stream)
+    raise ValueError(f"Unsupported codec {codec}")
+
+
+def read_content(response: dict, key: str, meta: dict) -> bytes:
+    """Reads a get_object response body, decompressing it on the fly."""
+    codec = detect_codec(key, response.get("ContentEncoding"), meta)
+    reader = decompressing_reader(response["Body"], codec)
+    chunks = []
+    while True:
+        chunk = reader.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b"".join(chunks)
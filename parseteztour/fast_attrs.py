@@ -0,0 +1,157 @@
+"""Tree-free scan of teztour cards for their attribute fields.
+
+Ids, coordinates and prices of a teztour card all live in attributes:
+``href`` of ``a.fav-detailurl``, the ``data-*`` group of
+``div.city-name`` and ``data-currency``/``data-price`` of
+``a.price-box``. scan_cards reads them straight from the page bytes with
+precompiled regexes: card starts are found by a byte search, each card's
+tags are walked until its div closes, and attributes are parsed only on
+the three tags of interest. Comments, scripts and styles between cards
+are skipped over. No DOM is built.
+
+Values follow parse_card: the first matching tag wins, entity references
+in values are unescaped, and a missing attribute of the city-name group
+sets the whole group to None. Anything the scan can't vouch for (a
+missing required tag or attribute, comments or scripts inside a card,
+nested cards, duplicate attributes, an unterminated card, bytes that
+aren't UTF-8) makes it return None, and the caller parses the page with
+the tree instead.
+"""
+import html
+import re
+from typing import List, Optional
+
+FIELDS = (
+    "href", "hotel_id", "hotel_rating", "hotel_rating_text",
+    "latitude", "longitude", "title", "currency", "price",
+)
+
+CITY_GROUP = (
+    ("hotel_id", b"data-hotel-id"),
+    ("hotel_rating", b"data-hotel-rating"),
+    ("hotel_rating_text", b"data-hotel-rating-text"),
+    ("latitude", b"data-lat"),
+    ("longitude", b"data-lng"),
+    ("title", b"data-title"),
+)
+
+# (tag, class) of the tags whose attributes are read.
+TARGETS = {
+    (b"a", b"fav-detailurl"): "link",
+    (b"div", b"city-name"): "city",
+    (b"a", b"price-box"): "price",
+}
+
+_CARD_START = re.compile(rb"<div\b[^>]*hotel_point", re.IGNORECASE)
+# Card starts, or the start of a region whose contents aren't markup.
+_NEXT = re.compile(rb"(<!--|<script\b|<style\b)|<div\b[^>]*hotel_point", re.IGNORECASE)
+_SKIP_END = {
+    b"<!--": re.compile(rb"-->"),
+    b"<script": re.compile(rb"</script\s*>", re.IGNORECASE),
+    b"<style": re.compile(rb"</style\s*>", re.IGNORECASE),
+}
+_TAG = re.compile(rb"""<(/?)([a-zA-Z][^\s/>]*)((?:[^>"']|"[^"]*"|'[^']*')*)>""")
+_ATTR = re.compile(rb"""([^\s"'>/=]+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+)))?""")
+_SUSPECT = re.compile(rb"<!--|<script|<style|<!\[CDATA", re.IGNORECASE)
+_CLASS = re.compile(rb"class", re.IGNORECASE)
+
+
+def _attrs(raw: bytes) -> Optional[dict]:
+    attrs = {}
+    for match in _ATTR.finditer(raw):
+        name = match.group(1).lower()
+        if name in attrs:
+            return None
+        value = match.group(2)
+        if value is None:
+            value = match.group(3) if match.group(3) is not None else match.group(4)
+        attrs[name] = b"" if value is None else value
+    return attrs
+
+
+def _text(value: bytes) -> str:
+    text = value.decode("utf-8")
+    return html.unescape(text) if "&" in text else text
+
+
+def _scan_card(content: bytes, start: int):
+    """(found attrs by target, end of the card) or (None, end) to bail out."""
+    found = {}
+    depth = 0
+    for match in _TAG.finditer(content, start):
+        closing, name, raw = match.groups()
+        name = name.lower()
+        if name == b"div":
+            if closing:
+                depth -= 1
+                if depth == 0:
+                    return found, match.end()
+                continue
+            if not raw.rstrip().endswith(b"/"):
+                depth += 1
+        if closing or not _CLASS.search(raw):
+            continue
+        attrs = _attrs(raw)
+        if attrs is None:
+            return None, match.end()
+        for class_ in attrs.get(b"class", b"").split():
+            target = TARGETS.get((name, class_))
+            if target is not None and target not in found:
+                found[target] = attrs
+    return None, len(content)
+
+
+def _row(found: dict) -> Optional[dict]:
+    if len(found) != len(TARGETS):
+        return None
+    link, city, price = found["link"], found["city"], found["price"]
+    if b"href" not in link or b"data-currency" not in price or b"data-price" not in price:
+        return None
+    row = {"href": _text(link[b"href"])}
+    complete = all(attr in city for _, attr in CITY_GROUP)
+    for field, attr in CITY_GROUP:
+        row[field] = _text(city[attr]) if complete else None
+    row["currency"] = _text(price[b"data-currency"])
+    row["price"] = _text(price[b"data-price"])
+    return row
+
+
+def scan_cards(content: bytes) -> Optional[List[dict]]:
+    """FIELDS of every card in page order, or None to use the tree parser."""
+    rows = []
+    position = 0
+    try:
+        while True:
+            match = _NEXT.search(content, position)
+            if match is None:
+                return rows
+            if match.group(1):
+                # Comments, scripts and styles outside cards are skipped.
+                close = _SKIP_END[match.group(1).lower()].search(content, match.end())
+                if close is None:
+                    return None
+                position = close.end()
+                continue
+            start = match.start()
+            tag = _TAG.match(content, start)
+            if tag is None:
+                return None
+            attrs = _attrs(tag.group(3))
+            if attrs is None:
+                return None
+            if b"hotel_point" not in attrs.get(b"class", b"").split():
+                # Some other class containing the name, e.g. hotel_point-list.
+                position = match.end()
+                continue
+            found, end = _scan_card(content, start)
+            if found is None:
+                return None
+            if _SUSPECT.search(content, start, end) or _CARD_START.search(content, match.end(), end):
+                return None
+            row = _row(found)
+            if row is None:
+                return None
+            rows.append(row)
+            position = end
+    except UnicodeDecodeError:
+        return None
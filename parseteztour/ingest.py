@@ -0,0 +1,102 @@
+"""Idempotent, resumable page ingestion.
+
+Every row of a page gets a row id derived from the page and the card
+position, and every batch is committed together with a checkpoint row in
+`parser/ingest_checkpoints`. A retried page therefore rewrites the same
+primary keys and skips the row ranges that are already committed.
+"""
+import uuid
+from typing import List, Optional, Tuple
+
+import ydb
+
+ROW_NAMESPACE = uuid.UUID("5d3f8a52-3c1e-4a8e-9a52-6a0f6f2b1c7e")
+
+checkpoint_select_query = """DECLARE $parsing_id AS Utf8;
+DECLARE $key AS Utf8;
+
+SELECT first_row, last_row, created_dttm
+FROM `parser/ingest_checkpoints`
+WHERE parsing_id = $parsing_id AND key = $key
+"""
+
+# The checkpoint is committed in the same query as the rows of its batch,
+# so its parameters are declared ahead of the rows statement.
+checkpoint_declarations = """DECLARE $parsing_id AS Utf8;
+DECLARE $key AS Utf8;
+DECLARE $first_row AS Uint32;
+DECLARE $last_row AS Uint32;
+DECLARE $created_dttm AS Utf8;
+"""
+
+checkpoint_replace_statement = """
+REPLACE INTO `parser/ingest_checkpoints` (
+    parsing_id, key, first_row, last_row, created_dttm, committed_dttm)
+VALUES
+($parsing_id, $key, $first_row, $last_row, $created_dttm, CurrentUtcDatetime());
+"""
+
+checkpoint_types = {
+    "$parsing_id": ydb.PrimitiveType.Utf8,
+    "$key": ydb.PrimitiveType.Utf8,
+    "$first_row": ydb.PrimitiveType.Uint32,
+    "$last_row": ydb.PrimitiveType.Uint32,
+    "$created_dttm": ydb.PrimitiveType.Utf8,
+}
+
+def make_row_id(bucket: str, key: str, parsing_id: str, index: int) -> str:
+    return str(uuid.uuid5(ROW_NAMESPACE, f"{bucket}/{key}#{parsing_id}/{index}"))
+
+
+def stamp_rows(rows: List[dict], created_dttm: str) -> List[dict]:
+    return [
+        {
+            **row,
+            "created_dttm": created_dttm,
+            "row_id": make_row_id(row["bucket"], row["key"], row["parsing_id"], i),
+        }
+        for i, row in enumerate(rows)
+    ]
+
+
+def pending_ranges(
+    num_rows: int, committed: List[Tuple[int, int]], max_records: int
+) -> List[Tuple[int, int]]:
+    """Half-open row ranges of at most max_records rows not yet committed."""
+    done = [False] * num_rows
+    for first, last in committed:
+        for i in range(max(first, 0), min(last, num_rows)):
+            done[i] = True
+
+    ranges = []
+    first = None
+    for i in range(num_rows + 1):
+        if i < num_rows and not done[i]:
+            if first is None:
+                first = i
+            if i + 1 - first == max_records:
+                ranges.append((first, i + 1))
+                first = None
+        elif first is not None:
+            ranges.append((first, i))
+            first = None
+    return ranges
+
+
+def parse_checkpoints(rows) -> Tuple[List[Tuple[int, int]], Optional[str]]:
+    committed = [(row.first_row, row.last_row) for row in rows]
+    created = [row.created_dttm for row in rows]
+    return committed, (min(created) if created else None)
+
+
+def create_checkpoint_query(
+    statement: str, parsing_id: str, key: str, first_row: int, last_row: int, created_dttm: str
+) -> Tuple[ydb.DataQuery, dict]:
+    """The rows statement of a batch and its checkpoint, with parameters."""
+    query = ydb.DataQuery(
+        checkpoint_declarations + statement + ";" + checkpoint_replace_statement,
+        checkpoint_types)
+    return query, {
+        "$parsing_id": parsing_id, "$key": key, "$first_row": first_row,
+        "$last_row": last_row, "$created_dttm": created_dttm,
+    }
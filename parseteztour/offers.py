@@ -0,0 +1,159 @@
+"""Normalized offer attributes from raw parser rows.
+
+Raw rows keep the page text as is; this pulls out the search dimensions
+the bot works with (country, departure date, nights, stars, price).
+Rows that can't be normalized give None and are left out.
+
+Normalized offers are also written straight into `parser/prod/offers`,
+keyed by (link, start_date, num_nights), so a page becomes searchable as
+soon as it is parsed and reparsing the same offer overwrites its row.
+The same transaction stamps the ``prod_offers`` watermark.
+"""
+import datetime
+import re
+from typing import Iterable, List, Optional
+
+from price_history import parse_price
+
+DATE_RE = re.compile(r"(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?")
+NIGHTS_RE = re.compile(r"(\d+)\s*ноч", re.IGNORECASE)
+DIGIT_RE = re.compile(r"\d")
+
+
+def parse_date(text: Optional[str], reference: datetime.date) -> Optional[datetime.date]:
+    """First dd.mm[.yyyy] date in text; dates without a year are the next
+    such date on or after the reference date."""
+    if not text:
+        return None
+    match = DATE_RE.search(text)
+    if match is None:
+        return None
+    day, month, year = match.groups()
+    try:
+        if year is not None:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            return datetime.date(year, int(month), int(day))
+        date = datetime.date(reference.year, int(month), int(day))
+        if date < reference - datetime.timedelta(1):
+            date = datetime.date(reference.year + 1, int(month), int(day))
+        return date
+    except ValueError:
+        return None
+
+
+def parse_nights(text: Optional[str]) -> Optional[int]:
+    if not text:
+        return None
+    match = NIGHTS_RE.search(text)
+    return int(match.group(1)) if match else None
+
+
+def split_location(location: Optional[str]) -> tuple:
+    """("Египет", "Хургада") from "Египет, Хургада"."""
+    if not location:
+        return None, None
+    parts = [part.strip() for part in location.split(",") if part.strip()]
+    if not parts:
+        return None, None
+    return parts[0], (", ".join(parts[1:]) or None)
+
+
+def _reference_date(row: dict) -> datetime.date:
+    return datetime.datetime.strptime(row["created_dttm"], "%Y-%m-%dT%H:%M:%SZ").date()
+
+
+def _offer(row, country_name, city_name, start_date, num_nights, num_stars) -> Optional[dict]:
+    price = parse_price(row["price"])
+    if None in (country_name, start_date, num_nights, price):
+        return None
+    return {
+        "offer_hash": row["offer_hash"],
+        "row_id": row["row_id"],
+        "title": row["title"],
+        "link": row["link"],
+        "country_name": country_name,
+        "city_name": city_name,
+        "start_date": start_date,
+        "num_nights": num_nights,
+        "num_stars": num_stars,
+        "price": price,
+    }
+
+
+def normalize_travelata(row: dict) -> Optional[dict]:
+    country_name, city_name = split_location(row["location"])
+    return _offer(
+        row, country_name, city_name,
+        start_date=parse_date(row["criteria"], _reference_date(row)),
+        num_nights=parse_nights(row["criteria"]),
+        num_stars=int(row["num_stars"]),
+    )
+
+
+def normalize_teztour(row: dict) -> Optional[dict]:
+    city_name, country_name = split_location(row["location_name"])
+    stars = DIGIT_RE.findall(row["stars_class"] or "")
+    details = " ".join(filter(None, (row["departure_info"], row["till_info"])))
+    return _offer(
+        row, country_name or city_name, city_name if country_name else None,
+        start_date=parse_date(row["departure_info"], _reference_date(row)),
+        num_nights=parse_nights(details),
+        num_stars=int(stars[0]) if stars else 0,
+    )
+
+
+NORMALIZERS = {
+    "travelata": normalize_travelata,
+    "teztour": normalize_teztour,
+}
+
+
+prod_offers_upsert_query = """DECLARE $offers AS List<Struct<
+    link: Utf8,
+    start_date: Date,
+    num_nights: Int32,
+    end_date: Date,
+    title: Utf8?,
+    country_name: Utf8,
+    city_name: Utf8?,
+    num_stars: Int32,
+    price: Double,
+    price_per_night: Double,
+    offer_hash: Utf8,
+    row_id: Utf8,
+    created_dttm: Datetime>>;
+
+UPSERT INTO `parser/prod/offers`
+SELECT * FROM AS_TABLE($offers);
+
+-- Lets get-offers' precompute run see new offers without scanning them.
+UPSERT INTO `parser/prod/watermarks` (name, watermark)
+VALUES ("prod_offers", CurrentUtcDatetime());
+"""
+
+
+def prod_rows(offers: Iterable[dict], created_dttm: int) -> List[dict]:
+    """Rows for prod_offers_upsert_query; the cheapest one per key."""
+    rows = {}
+    for offer in offers:
+        if offer["num_nights"] <= 0:
+            continue
+        key = (offer["link"], offer["start_date"], offer["num_nights"])
+        if key in rows and rows[key]["price"] <= offer["price"]:
+            continue
+        rows[key] = {
+            "link": offer["link"],
+            "start_date": offer["start_date"],
+            "num_nights": offer["num_nights"],
+            "end_date": offer["start_date"] + datetime.timedelta(offer["num_nights"]),
+            "title": offer["title"],
+            "country_name": offer["country_name"],
+            "city_name": offer["city_name"],
+            "num_stars": offer["num_stars"],
+            "price": float(offer["price"]),
+            "price_per_night": offer["price"] / offer["num_nights"],
+            "offer_hash": offer["offer_hash"],
+            "row_id": offer["row_id"],
+            "created_dttm": created_dttm,
+        }
+    return list(rows.values())
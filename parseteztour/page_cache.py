@@ -0,0 +1,46 @@
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import List, Optional
+
+
+def page_digest(content: bytes, parser_version: str) -> str:
+    return sha256(parser_version.encode() + b"\0" + content).hexdigest()
+
+
+class PageCache:
+    """LRU cache of parsed cards keyed by page digest.
+
+    Lives for the lifetime of a warm function instance, so byte-identical
+    pages uploaded again by the scrapers skip tree building and parsing.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Pages may be parsed from executor threads in async mode.
+        self._lock = threading.Lock()
+
+    def get(self, digest: str) -> Optional[List[dict]]:
+        with self._lock:
+            cards = self._entries.get(digest)
+            if cards is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(digest)
+            return cards
+
+    def put(self, digest: str, cards: List[dict]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = cards
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,224 @@
+"""Pipeline tracing keyed by parsing_id.
+
+Every function handling a page records spans into the trace whose id is
+derived from the page's parsing_id, so collectmeta and the parsers join
+the same trace without passing headers along. Spans without a parent
+hang off a synthetic root span, also derived from parsing_id, which the
+parser emits once the page's rows are committed: it covers the whole way
+from ``parsing_started`` to queryable rows.
+
+Spans are exported as OTLP/JSON, either appended to a file
+(``TRACE_EXPORT=file:/tmp/traces.jsonl``) or posted to a collector
+(``TRACE_EXPORT=http://collector:4318/v1/traces``). Tracing is off when
+TRACE_EXPORT is empty.
+"""
+import calendar
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from hashlib import md5
+from typing import Optional
+
+SCOPE_NAME = "travel_functions"
+
+TIME_FORMATS = ("%Y-%m-%dT%H:%M:%SZ", "%Y-%m-%dT%H:%M:%S.%fZ", "%Y-%m-%d %H:%M:%S")
+
+
+def trace_id(parsing_id: str) -> str:
+    return md5(parsing_id.encode()).hexdigest()
+
+
+def root_span_id(parsing_id: str) -> str:
+    return md5(f"root:{parsing_id}".encode()).hexdigest()[:16]
+
+
+def parse_time(value) -> Optional[int]:
+    """Unix nanoseconds from meta and trigger timestamps (UTC)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return int(value * 1e9)
+    for time_fmt in TIME_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value, time_fmt)
+        except ValueError:
+            continue
+        return calendar.timegm(parsed.timetuple()) * 10**9 + parsed.microsecond * 1000
+    try:
+        parsed = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp() * 1e9)
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    def __init__(self, tracer, name, parent=None, parsing_id=None, start=None, root=False, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self._parsing_id = parsing_id
+        self.root = root
+        self.span_id = os.urandom(8).hex()
+        self.start = start if start is not None else time.time_ns()
+        self.end_time = None
+        self.attributes = attributes
+        self.error = None
+        # parsing_started and parsing_ended of the page, see bind_meta.
+        self.meta_times = (None, None)
+
+    @property
+    def parsing_id(self) -> Optional[str]:
+        if self._parsing_id is None and self.parent is not None:
+            return self.parent.parsing_id
+        return self._parsing_id
+
+    @parsing_id.setter
+    def parsing_id(self, value: str) -> None:
+        self._parsing_id = value
+
+    def bind_meta(self, meta: dict) -> None:
+        """Joins the span to the page's trace once meta.json is read."""
+        self.parsing_id = meta.get("parsing_id")
+        self.meta_times = (parse_time(meta.get("parsing_started")), parse_time(meta.get("parsing_ended")))
+
+    def child(self, name: str, **attributes) -> "Span":
+        return Span(self.tracer, name, parent=self, **attributes)
+
+    def end(self, end: Optional[int] = None) -> None:
+        if self.end_time is None:
+            self.end_time = end if end is not None else time.time_ns()
+            self.tracer.add(self)
+
+    def __enter__(self) -> "Span":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.error = repr(exc)
+        self.end()
+
+    def to_otlp(self) -> dict:
+        parsing_id = self.parsing_id
+        if parsing_id is not None:
+            trace = trace_id(parsing_id)
+            span_id = root_span_id(parsing_id) if self.root else self.span_id
+            if self.parent is not None:
+                parent_id = self.parent.span_id if not self.parent.root else root_span_id(parsing_id)
+            else:
+                parent_id = "" if self.root else root_span_id(parsing_id)
+        else:
+            trace = md5(self.span_id.encode()).hexdigest()
+            span_id = self.span_id
+            parent_id = self.parent.span_id if self.parent is not None else ""
+        attributes = {**self.attributes}
+        if parsing_id is not None:
+            attributes["parsing_id"] = parsing_id
+        span = {
+            "traceId": trace,
+            "spanId": span_id,
+            "parentSpanId": parent_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [_attribute(key, value) for key, value in attributes.items()],
+        }
+        if self.error is not None:
+            span["status"] = {"code": 2, "message": self.error}
+        return span
+
+
+class Tracer:
+    def __init__(self, service_name: str, export: Optional[str] = None):
+        self.service_name = service_name
+        self.export = export
+        self._spans = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.export)
+
+    def span(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        return Span(self, name, parent=parent, **attributes)
+
+    def record(self, name: str, start: Optional[int], end: Optional[int], **attributes) -> None:
+        """Span from known timestamps, skipped when either is missing."""
+        if start is None or end is None or end < start:
+            return
+        Span(self, name, start=start, **attributes).end(end)
+
+    @contextmanager
+    def page(self, queued_at=None, **attributes):
+        """Span of a parser handling one page.
+
+        On exit also records the wait in the trigger queue, from the
+        trigger's created_at (or parsing_ended) to the parser's start, and
+        the root span from parsing_started until now, then exports.
+        """
+        span = self.span("parse", **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            started, ended = span.meta_times
+            queued = parse_time(queued_at) or ended
+            self.record("queue.parse", queued, span.start, parsing_id=span.parsing_id)
+            span.end()
+            if started is not None:
+                self.record(
+                    "page", started, span.end_time, parsing_id=span.parsing_id, root=True,
+                    **attributes, **{"pipeline.latency_ms": (span.end_time - started) // 10**6})
+            self.flush()
+
+    def add(self, span: Span) -> None:
+        if self.enabled:
+            with self._lock:
+                self._spans.append(span)
+
+    def payload(self, spans: list) -> dict:
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": SCOPE_NAME},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]}
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if not spans:
+            return
+        body = json.dumps(self.payload(spans))
+        # Tracing must never fail the page.
+        try:
+            if self.export.startswith("file:"):
+                with open(self.export[len("file:"):], "a") as f:
+                    f.write(body + "\n")
+            else:
+                request = urllib.request.Request(
+                    self.export, data=body.encode(),
+                    headers={"Content-Type": "application/json"})
+                urllib.request.urlopen(request, timeout=2).close()
+        except Exception as e:
+            logging.warning(f"Failed to export {len(spans)} spans: {e}")
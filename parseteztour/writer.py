@@ -0,0 +1,149 @@
+"""Adaptive batched writes to YDB.
+
+Batches are cut by row count and by bytes of query text. The row limit
+and the number of transactions in flight follow AIMD: they grow by a
+constant after every fast commit and are halved whenever YDB reports
+overload or a commit is slower than the target latency.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Tuple
+
+import ydb
+
+OVERLOAD_ERRORS = (ydb.Overloaded, ydb.Unavailable, ydb.SessionPoolEmpty, ydb.Timeout)
+
+
+class AimdController:
+    def __init__(
+        self,
+        batch_size: int = 5,
+        min_batch_size: int = 1,
+        max_batch_size: int = 200,
+        max_in_flight: int = 4,
+        batch_increase: int = 5,
+        decrease: float = 0.5,
+        target_latency: float = 1.0,
+    ):
+        self.batch_size = batch_size
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.in_flight = 1
+        self.max_in_flight = max_in_flight
+        self.batch_increase = batch_increase
+        self.decrease = decrease
+        self.target_latency = target_latency
+        self.latency = None
+        self._lock = threading.Lock()
+
+    @property
+    def operation_timeout(self) -> float:
+        if self.latency is None:
+            return 2
+        return min(max(2, 4 * self.latency), 10)
+
+    def on_success(self, latency: float) -> None:
+        with self._lock:
+            if self.latency is None:
+                self.latency = latency
+            else:
+                self.latency = 0.8 * self.latency + 0.2 * latency
+            if latency > self.target_latency:
+                self._back_off()
+                return
+            self.batch_size = min(self.batch_size + self.batch_increase, self.max_batch_size)
+            self.in_flight = min(self.in_flight + 1, self.max_in_flight)
+
+    def on_overload(self) -> None:
+        with self._lock:
+            self._back_off()
+
+    def _back_off(self) -> None:
+        self.batch_size = max(int(self.batch_size * self.decrease), self.min_batch_size)
+        self.in_flight = max(int(self.in_flight * self.decrease), 1)
+
+
+class AdaptiveWriter:
+    """Writes row ranges with adaptive batches and several commits in flight.
+
+    `build_query(first_row, last_row)` returns the ydb.DataQuery for a
+    half-open range of rows and its parameters, `row_sizes` is the query
+    text size of every row.
+    """
+
+    def __init__(
+        self,
+        pool: ydb.SessionPool,
+        build_query: Callable[[int, int], Tuple[ydb.DataQuery, dict]],
+        row_sizes: List[int],
+        controller: AimdController,
+        max_batch_bytes: int = 512 * 1024,
+    ):
+        self.pool = pool
+        self.build_query = build_query
+        self.row_sizes = row_sizes
+        self.controller = controller
+        self.max_batch_bytes = max_batch_bytes
+
+    def _next_batch(self, first_row: int, last_row: int) -> int:
+        end = first_row + 1
+        size = self.row_sizes[first_row]
+        limit = min(first_row + self.controller.batch_size, last_row)
+        while end < limit and size + self.row_sizes[end] <= self.max_batch_bytes:
+            size += self.row_sizes[end]
+            end += 1
+        return end
+
+    def _execute(self, first_row: int, last_row: int) -> Tuple[int, int]:
+        query, parameters = self.build_query(first_row, last_row)
+        timeout = self.controller.operation_timeout
+
+        def _execute_query(session):
+            session.transaction().execute(
+                query, parameters,
+                commit_tx=True,
+                settings=ydb.BaseRequestSettings().with_timeout(timeout + 1).with_operation_timeout(timeout)
+            )
+
+        def _on_error(e):
+            if isinstance(e, OVERLOAD_ERRORS):
+                self.controller.on_overload()
+
+        started = time.monotonic()
+        try:
+            self.pool.retry_operation_sync(
+                _execute_query, ydb.RetrySettings(on_ydb_error_callback=_on_error))
+        except Exception as e:
+            raise ValueError(
+                f"Failed with exception {e} at rows {first_row}-{last_row}: {query.yql_text}")
+        self.controller.on_success(time.monotonic() - started)
+        return first_row, last_row
+
+    def write(self, ranges: List[Tuple[int, int]]) -> int:
+        """Writes every range, returns the number of committed batches."""
+        batches = 0
+        with ThreadPoolExecutor(self.controller.max_in_flight) as executor:
+            running = set()
+
+            def _collect(return_when):
+                nonlocal running, batches
+                done, running = wait(running, return_when=return_when)
+                for future in done:
+                    future.result()
+                    batches += 1
+
+            for first_row, last_row in ranges:
+                while first_row < last_row:
+                    while len(running) >= self.controller.in_flight:
+                        _collect(FIRST_COMPLETED)
+                    end = self._next_batch(first_row, last_row)
+                    running.add(executor.submit(self._execute, first_row, end))
+                    first_row = end
+            if running:
+                _collect(ALL_COMPLETED)
+        logging.info(
+            f"Wrote {batches} batches, batch size {self.controller.batch_size}, "
+            f"in flight {self.controller.in_flight}")
+        return batches
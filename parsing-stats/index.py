@@ -0,0 +1,89 @@
+import ydb
+import ydb.iam
+import os
+import json
+import time
+
+import logging
+
+from stats import ParsingStats
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Create driver in global space.
+driver = ydb.Driver(
+    endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+    credentials=ydb.iam.MetadataUrlCredentials(),)
+# Wait for the driver to become active for requests.
+driver.wait(fail_fast=True, timeout=5)
+# Create the session pool instance to manage YDB sessions.
+pool = ydb.SessionPool(driver)
+
+# Hours covered by a report unless the request says otherwise.
+REPORT_HOURS = int(os.getenv("REPORT_HOURS", "24"))
+
+# parsing_started leads the primary key, so this is a range read.
+stat_rows_query = """SELECT website, parsing_started, parsing_ended, failed
+FROM `parser/parsing_stat_raws`
+WHERE parsing_started >= DateTime::FromSeconds({since}u)
+"""
+
+hourly_replace_query = """DECLARE $hourly AS List<Struct<
+    website: Utf8,
+    hour: Datetime,
+    count: Uint64,
+    failed: Uint64,
+    durations: Json>>;
+
+REPLACE INTO `parser/parsing_stats_hourly`
+SELECT * FROM AS_TABLE($hourly);
+"""
+
+
+def collect_stats(since: int) -> ParsingStats:
+    stats = ParsingStats()
+    query = ydb.ScanQuery(stat_rows_query.format(since=since), {})
+    for response in driver.table_client.scan_query(query):
+        stats.extend(response.result_set.rows)
+    return stats
+
+
+def create_save_hourly(stats: ParsingStats):
+    rows = [
+        {
+            "website": website, "hour": hour, "count": bucket.count,
+            "failed": bucket.failed, "durations": json.dumps(bucket.durations.to_dict()),
+        }
+        for (website, hour), bucket in stats.buckets.items()
+    ]
+
+    def _save_hourly(session):
+        prepared = session.prepare(hourly_replace_query)
+        session.transaction().execute(
+            prepared, {"$hourly": rows},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+    return _save_hourly
+
+
+def handler(event, context):
+    hours = REPORT_HOURS
+    if event and event.get("body"):
+        hours = int(json.loads(event["body"]).get("hours", hours))
+
+    now = int(time.time())
+    since = now - now % 3600 - (hours - 1) * 3600
+    stats = collect_stats(since)
+    if stats.buckets:
+        # Hourly sketches are kept so longer windows can be merged later
+        # without rescanning the raw rows.
+        pool.retry_operation_sync(create_save_hourly(stats))
+
+    report = stats.report()
+    logging.info(f"Parsing stats since {since}: {json.dumps(report)}")
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(report),
+    }
@@ -0,0 +1,74 @@
+"""Per-website, per-hour aggregates over parsing_stat_raws rows.
+
+Each (website, hour) bucket keeps a row count, a failure count and a
+t-digest of run durations in seconds, so memory depends on the number of
+buckets, not on the number of rows streamed through.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, Optional, Tuple
+
+from tdigest import TDigest
+
+HOUR = 3600
+
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class Bucket:
+    __slots__ = ("count", "failed", "durations")
+
+    def __init__(self):
+        self.count = 0
+        self.failed = 0
+        self.durations = TDigest()
+
+    def add(self, duration: Optional[float], failed: bool) -> None:
+        self.count += 1
+        self.failed += bool(failed)
+        if duration is not None and duration >= 0:
+            self.durations.add(duration)
+
+    def merge(self, other: "Bucket") -> "Bucket":
+        self.count += other.count
+        self.failed += other.failed
+        self.durations.merge(other.durations)
+        return self
+
+    def summary(self) -> dict:
+        result = {
+            "count": self.count,
+            "failed": self.failed,
+            "failure_rate": round(self.failed / self.count, 4) if self.count else None,
+        }
+        for q in QUANTILES:
+            value = self.durations.quantile(q)
+            result[f"p{round(q * 100)}_s"] = round(value, 3) if value is not None else None
+        result["max_s"] = self.durations.max if self.durations.count else None
+        return result
+
+
+class ParsingStats:
+    def __init__(self):
+        self.buckets: Dict[Tuple[str, int], Bucket] = defaultdict(Bucket)
+
+    def add(self, website: str, started: int, ended: Optional[int], failed: bool) -> None:
+        """started and ended are epoch seconds."""
+        duration = ended - started if ended is not None else None
+        self.buckets[(website, started - started % HOUR)].add(duration, failed)
+
+    def extend(self, rows: Iterable) -> "ParsingStats":
+        for row in rows:
+            self.add(row.website or "", row.parsing_started, row.parsing_ended, row.failed)
+        return self
+
+    def report(self) -> dict:
+        """Totals and hourly breakdown per website."""
+        websites = defaultdict(Bucket)
+        hourly = defaultdict(list)
+        for (website, hour), bucket in sorted(self.buckets.items()):
+            websites[website].merge(bucket)
+            hourly[website].append({"hour": hour, **bucket.summary()})
+        return {
+            website: {"total": total.summary(), "hourly": hourly[website]}
+            for website, total in websites.items()
+        }
@@ -0,0 +1,108 @@
+"""Merging t-digest for streaming quantiles.
+
+Values are buffered and folded into a sorted list of centroids whose
+sizes are bounded by the k1 scale function, so the tails keep small
+centroids and quantiles stay accurate there. Digests merge by folding one
+digest's centroids into the other's, which lets per-hour digests be
+combined into daily or per-website ones.
+"""
+import math
+from typing import List, Optional, Tuple
+
+
+class TDigest:
+    def __init__(self, compression: float = 100):
+        self.compression = compression
+        self.centroids: List[Tuple[float, float]] = []
+        self.count = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self._buffer: List[Tuple[float, float]] = []
+
+    def add(self, value: float, weight: float = 1.0) -> None:
+        self._buffer.append((value, weight))
+        self.count += weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) >= 5 * self.compression:
+            self._compress()
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        other._compress()
+        self._buffer.extend(other.centroids)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def _k(self, q: float) -> float:
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _compress(self) -> None:
+        if not self._buffer:
+            return
+        points = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in points)
+
+        merged = []
+        mean, weight = points[0]
+        done = 0.0
+        k_limit = self._k(0) + 1
+        for point_mean, point_weight in points[1:]:
+            if self._k((done + weight + point_weight) / total) <= k_limit:
+                mean += (point_mean - mean) * point_weight / (weight + point_weight)
+                weight += point_weight
+            else:
+                merged.append((mean, weight))
+                done += weight
+                k_limit = self._k(done / total) + 1
+                mean, weight = point_mean, point_weight
+        merged.append((mean, weight))
+        self.centroids = merged
+
+    def quantile(self, q: float) -> Optional[float]:
+        self._compress()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+        target = q * self.count
+        # Each centroid's mass is centred on its mean; the ends are pinned
+        # to the exact min and max.
+        cumulative = 0.0
+        previous_mean, previous_mid = self.min, 0.0
+        for mean, weight in self.centroids:
+            mid = cumulative + weight / 2
+            if target < mid:
+                if mid == previous_mid:
+                    return mean
+                fraction = (target - previous_mid) / (mid - previous_mid)
+                return previous_mean + fraction * (mean - previous_mean)
+            cumulative += weight
+            previous_mean, previous_mid = mean, mid
+        if self.count == previous_mid:
+            return self.max
+        fraction = (target - previous_mid) / (self.count - previous_mid)
+        return previous_mean + min(fraction, 1.0) * (self.max - previous_mean)
+
+    def to_dict(self) -> dict:
+        self._compress()
+        # An empty digest has no min or max; infinities aren't valid JSON.
+        empty = not self.centroids
+        return {
+            "compression": self.compression,
+            "min": None if empty else self.min,
+            "max": None if empty else self.max,
+            "centroids": [[round(mean, 6), weight] for mean, weight in self.centroids],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TDigest":
+        digest = cls(data["compression"])
+        digest.centroids = [tuple(centroid) for centroid in data["centroids"]]
+        digest.count = sum(weight for _, weight in digest.centroids)
+        digest.min = math.inf if data["min"] is None else data["min"]
+        digest.max = -math.inf if data["max"] is None else data["max"]
+        return digest
@@ -0,0 +1,113 @@
+import os
+import datetime
+from collections import defaultdict
+
+import requests
+import ydb
+import ydb.iam
+
+import logging
+
+logging.getLogger().setLevel(logging.INFO)
+
+# Create driver in global space.
+driver = ydb.Driver(
+    endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+    credentials=ydb.iam.MetadataUrlCredentials(),)
+# Wait for the driver to become active for requests.
+driver.wait(fail_fast=True, timeout=5)
+# Create the session pool instance to manage YDB sessions.
+pool = ydb.SessionPool(driver)
+
+# Offers listed in one message at most.
+MAX_OFFERS_PER_MESSAGE = int(os.getenv("MAX_OFFERS_PER_MESSAGE", "5"))
+
+# Matches handled per invocation.
+MAX_MATCHES = int(os.getenv("MAX_MATCHES", "1000"))
+
+EPOCH = datetime.date(1970, 1, 1)
+
+pending_query = f"""SELECT user_id, offer_hash, link, title, price, start_date, num_nights
+FROM `users/subscription_matches`
+WHERE notified_dttm IS NULL
+ORDER BY user_id, price
+LIMIT {MAX_MATCHES}
+"""
+
+mark_notified_query = """DECLARE $notified AS List<Struct<
+    user_id: Int64,
+    offer_hash: Utf8,
+    notified_dttm: Datetime>>;
+
+UPDATE `users/subscription_matches` ON
+SELECT * FROM AS_TABLE($notified);
+"""
+
+
+def select_pending(session):
+    return session.transaction().execute(
+        pending_query,
+        commit_tx=True,
+        settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+    )[0].rows
+
+
+def create_mark_notified(notified: list):
+    def _mark_notified(session):
+        prepared = session.prepare(mark_notified_query)
+        session.transaction().execute(
+            prepared, {"$notified": notified},
+            commit_tx=True,
+            settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+        )
+    return _mark_notified
+
+
+def format_date(days: int) -> str:
+    # Date columns come back from the SDK as days since the epoch; shown
+    # the way get-offers formats dates for the bot.
+    return (EPOCH + datetime.timedelta(days=days)).strftime("%d.%m.%Y")
+
+
+def format_alert(matches: list) -> str:
+    lines = ["Появились новые туры по твоей подписке:"]
+    for match in matches[:MAX_OFFERS_PER_MESSAGE]:
+        title = f'{match.title}\n' if match.title else ''
+        lines.append(
+            f'\n{title}С {format_date(match.start_date)} на {match.num_nights} ночей, '
+            f'{match.price} RUB\n{match.link}')
+    if len(matches) > MAX_OFFERS_PER_MESSAGE:
+        lines.append(f"\nИ еще {len(matches) - MAX_OFFERS_PER_MESSAGE}, смотри /search")
+    return "\n".join(lines)
+
+
+def send_message(chat_id: int, text: str) -> bool:
+    url = f"https://api.telegram.org/bot{os.environ['BOT_TOKEN']}/sendMessage"
+    response = requests.post(url, json={"chat_id": chat_id, "text": text}, timeout=10)
+    if not response.ok:
+        logging.error(f"Failed to alert {chat_id}: {response.text}")
+    return response.ok
+
+
+def handler(event, context):
+    by_user = defaultdict(list)
+    for row in pool.retry_operation_sync(select_pending):
+        by_user[row.user_id].append(row)
+
+    now = int(datetime.datetime.now(datetime.timezone.utc).timestamp())
+    notified = []
+    for user_id, matches in by_user.items():
+        if send_message(user_id, format_alert(matches)):
+            notified.extend(
+                {"user_id": user_id, "offer_hash": match.offer_hash, "notified_dttm": now}
+                for match in matches)
+
+    if notified:
+        pool.retry_operation_sync(create_mark_notified(notified))
+    logging.info(f"Alerted {len(by_user)} users about {len(notified)} offers")
+
+    return {
+        "users": len(by_user),
+        "offers": len(notified),
+        'statusCode': 200,
+    }
@@ -0,0 +1,8 @@
+-- Search filters compare country_name without String::Strip, so stored
+-- names have to be stripped once before the index is built.
+UPDATE `parser/prod/offers`
+SET country_name = String::Strip(country_name)
+WHERE country_name != String::Strip(country_name);
+
+ALTER TABLE `parser/prod/offers`
+    ADD INDEX country_start_date GLOBAL ON (country_name, start_date);
@@ -0,0 +1,6 @@
+CREATE TABLE `users/compaction_state` (
+    job Utf8,
+    watermark Date,
+    updated_dttm Datetime,
+    PRIMARY KEY (job)
+);
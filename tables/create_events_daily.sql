@@ -0,0 +1,11 @@
+CREATE TABLE `users/events_daily` (
+    day Date NOT NULL,
+    event Utf8 NOT NULL,
+    events Uint64,
+    users Uint64,
+    PRIMARY KEY (day, event)
+)
+PARTITION BY HASH(day)
+WITH (
+    STORE = COLUMN
+);
@@ -0,0 +1,9 @@
+CREATE TABLE `parser/prod/hotel_ids` (
+    website Utf8,
+    link Utf8,
+    hotel_id Utf8,
+    title Utf8,
+    updated_dttm Datetime,
+    PRIMARY KEY (website, link),
+    INDEX hotel_id_index GLOBAL ON (hotel_id)
+);
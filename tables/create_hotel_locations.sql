@@ -0,0 +1,8 @@
+CREATE TABLE `parser/prod/hotel_locations` (
+    link Utf8,
+    hotel_id Utf8,
+    latitude Double,
+    longitude Double,
+    updated_dttm Datetime,
+    PRIMARY KEY (link) 
+);
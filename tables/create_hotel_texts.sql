@@ -0,0 +1,8 @@
+CREATE TABLE `parser/prod/hotel_texts` (
+    link Utf8,
+    tokens Utf8,
+    updated_dttm Datetime,
+    PRIMARY KEY (link)
+) WITH (
+    TTL = Interval("PT120H") ON updated_dttm
+);
@@ -0,0 +1,11 @@
+CREATE TABLE `parser/ingest_checkpoints` (
+    parsing_id Utf8,
+    key Utf8,
+    first_row Uint32,
+    last_row Uint32,
+    created_dttm Utf8,
+    committed_dttm Datetime,
+    PRIMARY KEY (parsing_id, key, first_row) 
+) WITH (
+    TTL = Interval("PT120H") ON committed_dttm
+);
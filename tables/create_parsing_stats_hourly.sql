@@ -0,0 +1,8 @@
+CREATE TABLE `parser/parsing_stats_hourly` (
+    website Utf8,
+    hour Datetime,
+    count Uint64,
+    failed Uint64,
+    durations Json,
+    PRIMARY KEY (website, hour) 
+);
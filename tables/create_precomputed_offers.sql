@@ -0,0 +1,18 @@
+CREATE TABLE `users/precomputed_offers` (
+    params_key Utf8,
+    offer_number Int64,
+    start_date utf8,
+    end_date utf8,
+    title utf8,
+    country_name utf8,
+    num_nights double,
+    city_name utf8,
+    price double,
+    link utf8,
+    num_stars double,
+    row_id utf8,
+    computed_dttm Datetime,
+    PRIMARY KEY (params_key, offer_number)
+) WITH (
+    TTL = Interval("PT72H") ON computed_dttm
+);
@@ -0,0 +1,15 @@
+CREATE TABLE `parser/prod/price_history_head` (
+    offer_hash Utf8,
+    chunk_start Uint32,
+    points String,
+    last_seen Uint32,
+    PRIMARY KEY (offer_hash) 
+);
+
+CREATE TABLE `parser/prod/price_history` (
+    offer_hash Utf8,
+    chunk_start Uint32,
+    chunk_end Uint32,
+    points String,
+    PRIMARY KEY (offer_hash, chunk_start) 
+);
@@ -0,0 +1,18 @@
+-- The country_start_date index is added by alter_offers_country_index.sql,
+-- which existing tables are upgraded with as well.
+CREATE TABLE `parser/prod/offers` (
+    link Utf8,
+    start_date Date,
+    num_nights Int32,
+    end_date Date,
+    title Utf8,
+    country_name Utf8,
+    city_name Utf8,
+    num_stars Int32,
+    price Double,
+    price_per_night Double,
+    offer_hash Utf8,
+    row_id Utf8,
+    created_dttm Datetime,
+    PRIMARY KEY (link, start_date, num_nights)
+);
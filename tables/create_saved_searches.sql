@@ -0,0 +1,9 @@
+CREATE TABLE `users/saved_searches` (
+    params_key Utf8,
+    params Utf8,
+    last_used_dttm Datetime,
+    computed_dttm Datetime,
+    PRIMARY KEY (params_key)
+) WITH (
+    TTL = Interval("PT72H") ON last_used_dttm
+);
@@ -0,0 +1,7 @@
+CREATE TABLE `users/seen_updates` (
+    update_id Int64,
+    seen_dttm Datetime,
+    PRIMARY KEY (update_id)
+) WITH (
+    TTL = Interval("PT24H") ON seen_dttm
+);
@@ -0,0 +1,15 @@
+CREATE TABLE `users/subscription_matches` (
+    user_id Int64,
+    offer_hash Utf8,
+    subscription_id Utf8,
+    link Utf8,
+    title Utf8,
+    price Int64,
+    start_date Date,
+    num_nights Int32,
+    created_dttm Datetime,
+    notified_dttm Datetime,
+    PRIMARY KEY (user_id, offer_hash) 
+) WITH (
+    TTL = Interval("PT720H") ON created_dttm
+);
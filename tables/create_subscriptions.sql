@@ -0,0 +1,7 @@
+CREATE TABLE `users/subscriptions` (
+    user_id Int64,
+    subscription_id Utf8,
+    params Utf8,
+    created_dttm Datetime,
+    PRIMARY KEY (user_id, subscription_id) 
+);
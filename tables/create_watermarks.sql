@@ -0,0 +1,5 @@
+CREATE TABLE `parser/prod/watermarks` (
+    name Utf8,
+    watermark Datetime,
+    PRIMARY KEY (name)
+);
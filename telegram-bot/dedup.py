@@ -0,0 +1,134 @@
+"""Seen-set of webhook update_ids.
+
+Telegram redelivers an update when the webhook answers slowly or fails,
+so a busy function sees the same update_id again. The first delivery
+claims the id and later ones are acknowledged without running handlers.
+
+Ids are kept in process in a bounded TTL map, which catches retries that
+land on the same warm instance. The optional YDB backend claims ids with
+an INSERT into `users/seen_updates`, which fails on an existing key, so
+retries routed to another instance are caught as well.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class SeenUpdates:
+    """LRU of update_ids that expire ttl seconds after they are claimed."""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _claim_local(self, update_id: int, now: float) -> bool:
+        with self._lock:
+            expires = self._entries.get(update_id)
+            if expires is not None and expires > now:
+                return False
+            self._entries[update_id] = now + self.ttl
+            self._entries.move_to_end(update_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+    def claim(self, update_id: int) -> bool:
+        """True for the first delivery of update_id, False for a repeat."""
+        if not self._claim_local(update_id, time.monotonic()):
+            return False
+        if self.backend is None:
+            return True
+        try:
+            return self.backend.claim(update_id)
+        except Exception as e:
+            # A failing backend must not drop updates, the local claim stands.
+            logging.warning(f"Shared update dedup failed: {e!r}")
+            return True
+
+    def release(self, update_id: int) -> None:
+        """Forgets an id whose processing failed, so the retry runs."""
+        with self._lock:
+            self._entries.pop(update_id, None)
+        if self.backend is not None:
+            try:
+                self.backend.release(update_id)
+            except Exception as e:
+                logging.warning(f"Shared update dedup release failed: {e!r}")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+claim_query = """DECLARE $update_id AS Int64;
+
+INSERT INTO `users/seen_updates` (update_id, seen_dttm)
+VALUES ($update_id, CurrentUtcDatetime());
+"""
+
+release_query = """DECLARE $update_id AS Int64;
+
+DELETE FROM `users/seen_updates`
+WHERE update_id = $update_id;
+"""
+
+
+class YdbSeenUpdates:
+    """Shared claims in `users/seen_updates`; rows expire by the table TTL."""
+
+    def __init__(self):
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            import ydb
+            import ydb.iam
+
+            driver = ydb.Driver(
+                endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
+                credentials=ydb.iam.MetadataUrlCredentials(),)
+            driver.wait(fail_fast=True, timeout=5)
+            self._pool = ydb.SessionPool(driver)
+        return self._pool
+
+    def _execute(self, query: str, update_id: int):
+        import ydb
+
+        def _execute_query(session):
+            prepared = session.prepare(query)
+            session.transaction().execute(
+                prepared, {"$update_id": update_id},
+                commit_tx=True,
+                settings=ydb.BaseRequestSettings().with_timeout(3).with_operation_timeout(2)
+            )
+        self.pool.retry_operation_sync(_execute_query)
+
+    def claim(self, update_id: int) -> bool:
+        import ydb
+
+        try:
+            self._execute(claim_query, update_id)
+        except ydb.PreconditionFailed:
+            # The key exists: another instance already took this update.
+            return False
+        return True
+
+    def release(self, update_id: int) -> None:
+        self._execute(release_query, update_id)
+
+
+def from_env() -> SeenUpdates:
+    backend: Optional[YdbSeenUpdates] = None
+    if os.getenv("UPDATE_DEDUP_BACKEND", "") == "ydb":
+        backend = YdbSeenUpdates()
+    return SeenUpdates(
+        max_entries=int(os.getenv("UPDATE_DEDUP_SIZE", "10000")),
+        ttl=float(os.getenv("UPDATE_DEDUP_TTL", "3600")),
+        backend=backend,
+    )
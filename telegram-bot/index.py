@@ -1,4 +1,3 @@
-import boto3
 import os
 import json
 import datetime
@@ -11,19 +10,27 @@ from telegram.ext.callbackcontext import CallbackContext
 from telegram.ext.commandhandler import CommandHandler
 from telegram.ext import CallbackQueryHandler
 
-from telegram_bot_calendar import DetailedTelegramCalendar, LSTEP
-
-import ydb
-import ydb.iam
-
-import requests
+# boto3, ydb, requests and telegram_bot_calendar are imported by the
+# handlers that need them, so cold starts for /start and /help stay cheap.
 
 import logging
 
+from dedup import from_env as seen_updates_from_env
+from slog import EventLogger
+
 logging.getLogger().setLevel(logging.INFO)
 
+# Full offer lists are logged for a sample of searches only.
+log = EventLogger(rates={"offers.results": 0.1})
+
+# Redelivered webhooks are acknowledged without running the handlers again.
+seen_updates = seen_updates_from_env()
+
 
 def initialize_session():
+    import ydb
+    import ydb.iam
+
     driver = ydb.Driver(
         endpoint=os.getenv('YDB_ENDPOINT'), database=os.getenv('YDB_DATABASE'),
         credentials=ydb.iam.MetadataUrlCredentials(),)
@@ -39,11 +46,16 @@ def initialize_session():
         exit(1)
 
 def post_user_event(event):
+    import requests
+
     url = os.getenv("ADD_USER_HANDLER")
     requests.post(url, json=event)
 
 help_string = """Вот что я могу:
 /search - Найти туры
+/find <текст> - Найти туры по названию, месту или удобствам
+/subscribe - Сообщать о новых турах по последнему поиску
+/unsubscribe - Отменить подписки
 /start - Начать разговор
 /help - Вывести список доступных команд
 """
@@ -60,6 +72,8 @@ hello_string = """Привет!👋
 """
 
 def load_to_s3(data: Union[str, dict, list], Key, Bucket, is_json=False):
+    import boto3
+
     boto_session = boto3.session.Session(
         aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
         aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
@@ -107,16 +121,65 @@ countries_dict_tg = {
 
 STAR = "⭐"
 
-def search(update: Update, context: CallbackContext) -> int:
+MIN_NIGHTS = 5
+MAX_NIGHTS = 8
 
-    logging.info("Search event", extra={"context": {"SEVERITY": "info"}})
+# Static keyboards are built once per instance and reused by every update.
+
+def build_countries_keyboard() -> InlineKeyboardMarkup:
     keyboard_list = []
     for i, country in countries_dict_tg.items():
         entry = json.dumps({"val": i , "id": 1})
         keyboard_list.append(
             InlineKeyboardButton(country, callback_data=entry))
+    return InlineKeyboardMarkup([keyboard_list])
+
+def build_interval_keyboard() -> InlineKeyboardMarkup:
+    keyboard_list = [[]]
+    j = 0
+    for days in range(0, 30):
+        entry = json.dumps({"val": days, "id": 2})
+        if days % 5 == 0:
+            j += 1
+            keyboard_list.append([])
+
+        keyboard_list[j].append(
+            InlineKeyboardButton(str(days), callback_data=entry))
+    return InlineKeyboardMarkup(keyboard_list)
+
+def build_nights_keyboard(min_nights: int, step_id: int) -> InlineKeyboardMarkup:
+    keyboard_list = []
+    for num_nights in range(min_nights, MAX_NIGHTS + 1):
+        entry = json.dumps({"val": num_nights, "id": step_id})
+        keyboard_list.append(
+            InlineKeyboardButton(str(num_nights), callback_data=entry))
+    return InlineKeyboardMarkup([keyboard_list])
 
-    reply_markup = InlineKeyboardMarkup([keyboard_list])
+def build_stars_keyboard() -> InlineKeyboardMarkup:
+    keyboard_list = []
+    for num_stars in range(0, 6):
+        entry = json.dumps({"val": num_stars, "id": 5})
+        if num_stars == 0:
+            text = "Без звезд"
+        else:
+            text = num_stars * STAR
+        keyboard_list.append(
+            InlineKeyboardButton(text, callback_data=entry))
+    return InlineKeyboardMarkup([keyboard_list])
+
+countries_keyboard = build_countries_keyboard()
+interval_keyboard = build_interval_keyboard()
+min_nights_keyboard = build_nights_keyboard(MIN_NIGHTS, 3)
+max_nights_keyboards = {
+    min_nights: build_nights_keyboard(min_nights, 4)
+    for min_nights in range(MIN_NIGHTS, MAX_NIGHTS + 1)
+}
+stars_keyboard = build_stars_keyboard()
+
+def search(update: Update, context: CallbackContext) -> int:
+
+    logging.info("Search event", extra={"context": {"SEVERITY": "info"}})
+    reply_markup = countries_keyboard
 
     user_event = {
         "user": update.to_dict()["message"]["from"],
@@ -158,16 +221,18 @@ def format_result(result):
     return text
 
 def get_offers_handler(data):
+    import requests
+
     url = os.getenv("GET_OFFERS_HANDLER")
     response = requests.get(url, json=data)
     try:
         results = response.json()
     except:
-        logging.info(response.content)
+        log.error("offers.bad_response", content=response.content)
         raise ValueError("JSON decode error")
     if len(results) == 0:
         return ["Ничего не найдено"]
-    logging.info(json.dumps(results))
+    log.info("offers.results", count=len(results), results=results)
     return list(map(format_result, results))
 
 def button(update: Update, context: CallbackContext) -> None:
@@ -181,6 +246,8 @@ def button(update: Update, context: CallbackContext) -> None:
     query.answer()
 
     if query.data.startswith("cbcal"):
+        from telegram_bot_calendar import DetailedTelegramCalendar, LSTEP
+
         min_date = datetime.date.today() + datetime.timedelta(1)
         max_date = min_date + datetime.timedelta(29)
         result, key, step = DetailedTelegramCalendar(
@@ -199,19 +266,8 @@ def button(update: Update, context: CallbackContext) -> None:
                                     reply_markup=key)
         elif result:
             query.edit_message_text(f"Примерная дата вылета {result}")
-            logging.info(f"Selected {result}")
-            keyboard_list = [[]]
-            j = 0
-            for days in range(0, 30):
-                entry = json.dumps({"val": days, "id": 2})
-                if days % 5 == 0:
-                    j += 1
-                    keyboard_list.append([])
-
-                keyboard_list[j].append(
-                    InlineKeyboardButton(str(days), callback_data=entry))
-        
-            reply_markup = InlineKeyboardMarkup(keyboard_list)
+            log.info("calendar.selected", date=result)
+            reply_markup = interval_keyboard
             context.bot.send_message(
                 chat_id=update.effective_chat.id,
                 text= "Выбери диапазон дней от даты вылета\nесли дата вылета точная, выбери 0",
@@ -239,13 +295,15 @@ def button(update: Update, context: CallbackContext) -> None:
 
     data = json.loads(query.data)
 
-    logging.info(f"Got callback: {json.dumps(data)}")
+    log.info("callback", data=data)
 
     if data["id"] == 1:
         query.edit_message_text(text=countries_dict_tg.get(data["val"]))
 
         logging.info("Edit msg country", extra={"context": {"SEVERITY": "info"}})
 
+        from telegram_bot_calendar import DetailedTelegramCalendar
+
         min_date = datetime.date.today() + datetime.timedelta(1)
         max_date = min_date + datetime.timedelta(29)
 
@@ -276,13 +334,7 @@ def button(update: Update, context: CallbackContext) -> None:
         query.edit_message_text(text=text_mn)
 
         logging.info(f"Edit msg interval")
-        keyboard_list = []
-        for num_nights in range(5, 9):
-            entry = json.dumps({"val": num_nights, "id": 3})
-            keyboard_list.append(
-                InlineKeyboardButton(str(num_nights), callback_data=entry))
-    
-        reply_markup = InlineKeyboardMarkup([keyboard_list])
+        reply_markup = min_nights_keyboard
         context.bot.send_message(
             chat_id=update.effective_chat.id,
             text= "Отлично👌🏻\nТеперь выбери минимальное количество ночей",
@@ -309,13 +361,9 @@ def button(update: Update, context: CallbackContext) -> None:
         query.edit_message_text(text=text_mn)
         logging.info("Edit msg nights", extra={"context": {"SEVERITY": "info"}})
         min_nights = data["val"]
-        keyboard_list = []
-        for num_nights in range(min_nights, 9):
-            entry = json.dumps({"val": num_nights, "id": 4})
-            keyboard_list.append(
-                InlineKeyboardButton(str(num_nights), callback_data=entry))
-        
-        reply_markup = InlineKeyboardMarkup([keyboard_list])
+        reply_markup = max_nights_keyboards.get(min_nights)
+        if reply_markup is None:
+            reply_markup = build_nights_keyboard(min_nights, 4)
         context.bot.send_message(
             chat_id=update.effective_chat.id,
             text= "Теперь выбери максимальное количество ночей",
@@ -341,17 +389,7 @@ def button(update: Update, context: CallbackContext) -> None:
         query.edit_message_text(text=text_mn)
         logging.info("Edit msg min nights", extra={"context": {"SEVERITY": "info"}})
 
-        keyboard_list = []
-        for num_stars in range(0, 6):
-            entry = json.dumps({"val": num_stars, "id": 5})
-            if num_stars == 0:
-                text = "Без звезд"
-            else:
-                text = num_stars * STAR
-            keyboard_list.append(
-                InlineKeyboardButton(text, callback_data=entry))
-            
-        reply_markup = InlineKeyboardMarkup([keyboard_list])
+        reply_markup = stars_keyboard
         context.bot.send_message(
             chat_id=update.effective_chat.id,
             text= "Теперь минимальное количество звезд отеля",
@@ -418,7 +456,7 @@ def button(update: Update, context: CallbackContext) -> None:
         reply_markup = InlineKeyboardMarkup([
             [InlineKeyboardButton("Загрузить еще", callback_data=entry)]
         ])
-        logging.info(f"Last tex {texts[-1]}")
+        log.info("offers.last_text", text=texts[-1])
         context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=texts[-1], reply_markup=reply_markup)
@@ -470,19 +508,134 @@ def button(update: Update, context: CallbackContext) -> None:
         logging.info("End displaying", extra={"context": {"SEVERITY": "info"}})
 
 
+def find(update: Update, context: CallbackContext) -> None:
+    logging.info("Find event", extra={"context": {"SEVERITY": "info"}})
+    text = " ".join(context.args)
+    if not text:
+        update.message.reply_text("Напиши, что искать, например /find аквапарк all inclusive")
+        return
+
+    user = update.to_dict()["message"]["from"]
+    user_event = {
+        "user": user,
+        "event": "find",
+        "clear": False,
+        "param": json.dumps({"text": text})
+    }
+    post_user_event(user_event)
+
+    data = {
+        "user_id": user["id"],
+        "params": {"text": text},
+        "offset": 0,
+        "number": 4
+    }
+    texts = get_offers_handler(data)
+    for result in texts[:-1]:
+        update.message.reply_text(result)
+
+    # Further pages are read from the saved results like after /search.
+    entry = json.dumps({"val": 0, "id": 6})
+    reply_markup = InlineKeyboardMarkup([
+        [InlineKeyboardButton("Загрузить еще", callback_data=entry)]
+    ])
+    update.message.reply_text(texts[-1], reply_markup=reply_markup)
+
+
+SEARCH_PARAMS = (
+    "country_name", "min_departure_date", "interval_days",
+    "min_nights", "max_nights", "num_stars",
+)
+
+def subscribe(update: Update, context: CallbackContext) -> None:
+    logging.info("Subscribe event", extra={"context": {"SEVERITY": "info"}})
+    user = update.to_dict()["message"]["from"]
+    params = get_params(user["id"])
+    if any(name not in params for name in SEARCH_PARAMS):
+        update.message.reply_text("Сначала выбери параметры тура через /search")
+        return
+
+    user_event = {
+        "user": user,
+        "event": "subscribe",
+        "clear": False,
+        "param": json.dumps(
+            {name: params[name] for name in SEARCH_PARAMS}, sort_keys=True)
+    }
+    post_user_event(user_event)
+    update.message.reply_text("Готово! Я напишу, когда появятся подходящие туры")
+
+def unsubscribe(update: Update, context: CallbackContext) -> None:
+    logging.info("Unsubscribe event", extra={"context": {"SEVERITY": "info"}})
+    user_event = {
+        "user": update.to_dict()["message"]["from"],
+        "event": "unsubscribe",
+        "clear": False,
+        "param": None
+    }
+    post_user_event(user_event)
+    update.message.reply_text("Подписки отменены")
+
+
+# update_ids whose handler failed during this invocation.
+_failed_updates = set()
+
+def release_failed_update(update: object, context: CallbackContext) -> None:
+    # The dispatcher catches handler errors itself, so the claim is released
+    # here and the webhook answers with an error for Telegram to redeliver.
+    logging.error(f"Handling update failed: {context.error!r}", exc_info=context.error)
+    if isinstance(update, Update):
+        seen_updates.release(update.update_id)
+        _failed_updates.add(update.update_id)
+
+
+_dispatcher = None
+
+def get_dispatcher() -> Dispatcher:
+    # Built on the first invocation and reused while the instance is warm.
+    global _dispatcher
+    if _dispatcher is None:
+        bot = Bot(os.environ["BOT_TOKEN"])
+        dispatcher = Dispatcher(bot, None, use_context=True)
+        dispatcher.add_handler(CommandHandler("start", start))
+        dispatcher.add_handler(CommandHandler("help", help_))
+        dispatcher.add_handler(CallbackQueryHandler(button))
+        dispatcher.add_handler(CommandHandler("search", search))
+        dispatcher.add_handler(CommandHandler("find", find))
+        dispatcher.add_handler(CommandHandler("subscribe", subscribe))
+        dispatcher.add_handler(CommandHandler("unsubscribe", unsubscribe))
+        dispatcher.add_error_handler(release_failed_update)
+        _dispatcher = dispatcher
+    return _dispatcher
+
 def handler(event, context):
-    bot = Bot(os.environ["BOT_TOKEN"])
-    dispatcher = Dispatcher(bot, None, use_context=True)
-    dispatcher.add_handler(CommandHandler("start", start))
-    dispatcher.add_handler(CommandHandler("help", help_))
-    dispatcher.add_handler(CallbackQueryHandler(button))
-    dispatcher.add_handler(CommandHandler("search", search))
+    dispatcher = get_dispatcher()
 
     message = json.loads(event["body"])
-    load_to_s3(message, "message0.json", "parsing", is_json=True)
-    dispatcher.process_update(
-        Update.de_json(json.loads(event["body"]), bot)
-    )
+    update_id = message.get("update_id")
+    if update_id is not None and not seen_updates.claim(update_id):
+        logging.info(f"Update {update_id} already handled, skipping")
+        return {
+            'statusCode': 200,
+            'body': 'Duplicate update',
+        }
+
+    try:
+        load_to_s3(message, "message0.json", "parsing", is_json=True)
+        dispatcher.process_update(
+            Update.de_json(message, dispatcher.bot)
+        )
+    except Exception:
+        if update_id is not None:
+            seen_updates.release(update_id)
+        raise
+
+    if update_id in _failed_updates:
+        _failed_updates.discard(update_id)
+        return {
+            'statusCode': 500,
+            'body': 'Update failed',
+        }
 
     return {
         'statusCode': 200,
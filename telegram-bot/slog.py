@@ -0,0 +1,139 @@
+"""Sampled structured log events with lazily built payloads.
+
+``log.info("offers.select", params=params)`` emits one JSON line,
+``{"event": "offers.select", "params": {...}}``, through the standard
+logging module. Nothing is serialized when the level is disabled or the
+event is sampled out. Fields are only JSON-encoded when a handler formats
+the record, and callables passed as fields are called at that point too.
+
+Per-event sampling rates come from the code's defaults and from
+``LOG_SAMPLE_RATES`` (``"offers.results=0.1,callback=0.5"``); sampled
+events carry ``sample_rate`` so counts can be scaled back. Payloads are
+capped: strings at ``LOG_MAX_CHARS`` and lists at ``LOG_MAX_ITEMS``
+entries. Fields that are small on top and serialize within
+``LOG_MAX_LINE`` are dumped as they are, without walking them first.
+"""
+import json
+import logging
+import os
+import random
+from typing import Dict, Optional
+
+MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "512"))
+MAX_ITEMS = int(os.getenv("LOG_MAX_ITEMS", "10"))
+MAX_LINE = int(os.getenv("LOG_MAX_LINE", "4096"))
+
+
+def parse_rates(value: Optional[str]) -> Dict[str, float]:
+    rates = {}
+    for item in (value or "").split(","):
+        name, _, rate = item.partition("=")
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+_PLAIN = {bool, int, float, type(None)}
+
+
+def cap(value, depth: int = 0):
+    """Copy of value small enough to log."""
+    if callable(value):
+        value = value()
+    if isinstance(value, bytes):
+        value = value.decode("utf-8", "replace")
+    if isinstance(value, str):
+        if len(value) > MAX_CHARS:
+            return value[:MAX_CHARS] + f"...(+{len(value) - MAX_CHARS})"
+        return value
+    if type(value) in _PLAIN:
+        return value
+    if depth >= 3:
+        return cap(repr(value), depth)
+    # Short strings and numbers, most of a payload, are kept without a call.
+    if isinstance(value, dict):
+        return {
+            key if type(key) is str else str(key):
+                item if type(item) in _PLAIN or type(item) is str and len(item) <= MAX_CHARS
+                else cap(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple, set)):
+        items = value if isinstance(value, list) else list(value)
+        result = [
+            item if type(item) in _PLAIN or type(item) is str and len(item) <= MAX_CHARS
+            else cap(item, depth + 1)
+            for item in items[:MAX_ITEMS]
+        ]
+        if len(items) > MAX_ITEMS:
+            result.append(f"...(+{len(items) - MAX_ITEMS})")
+        return result
+    return cap(str(value), depth)
+
+
+def _oversized(value) -> bool:
+    if isinstance(value, (str, bytes)):
+        return isinstance(value, bytes) or len(value) > MAX_CHARS
+    if isinstance(value, (list, tuple, set, dict)):
+        return len(value) > MAX_ITEMS
+    return False
+
+
+class Event:
+    """Log message that serializes its fields when first formatted."""
+
+    __slots__ = ("name", "fields", "rate", "_text")
+
+    def __init__(self, name: str, fields: dict, rate: float):
+        self.name = name
+        self.fields = fields
+        self.rate = rate
+        self._text = None
+
+    def __str__(self) -> str:
+        if self._text is None:
+            fields = {
+                key: value() if callable(value) else value
+                for key, value in self.fields.items()
+            }
+            text = None
+            if not any(map(_oversized, fields.values())):
+                text = self._dump(fields)
+                if len(text) > MAX_LINE:
+                    text = None
+            if text is None:
+                text = self._dump({key: cap(value) for key, value in fields.items()})
+            self._text = text
+        return self._text
+
+    def _dump(self, fields: dict) -> str:
+        payload = {"event": self.name, **fields}
+        if self.rate < 1:
+            payload["sample_rate"] = self.rate
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class EventLogger:
+    def __init__(self, rates: Optional[Dict[str, float]] = None, logger: Optional[logging.Logger] = None):
+        self.rates = {**(rates or {}), **parse_rates(os.getenv("LOG_SAMPLE_RATES"))}
+        self.logger = logger or logging.getLogger()
+
+    def log(self, level: int, name: str, /, **fields) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = self.rates.get(name, 1.0)
+        if rate < 1 and random.random() >= rate:
+            return
+        self.logger.log(level, Event(name, fields, rate))
+
+    def debug(self, name: str, /, **fields) -> None:
+        self.log(logging.DEBUG, name, **fields)
+
+    def info(self, name: str, /, **fields) -> None:
+        self.log(logging.INFO, name, **fields)
+
+    def warning(self, name: str, /, **fields) -> None:
+        self.log(logging.WARNING, name, **fields)
+
+    def error(self, name: str, /, **fields) -> None:
+        self.log(logging.ERROR, name, **fields)
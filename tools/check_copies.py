@@ -0,0 +1,60 @@
+"""Checks that shared helper modules are identical in every function.
+
+Each cloud function is zipped from its own directory (create_version.sh
+uses ``zip -j``), so helpers shared between functions, e.g. tracing.py,
+slog.py or geo.py, live as a copy in each directory that imports them.
+Any module other than index.py that exists in more than one function
+directory is treated as shared, and all of its copies must be byte for
+byte the same. Differing copies are printed as a diff against the first
+one, and the script exits with status 1.
+
+Usage: python tools/check_copies.py
+"""
+import difflib
+import os
+import sys
+from collections import defaultdict
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def function_dirs() -> list:
+    return sorted(
+        name for name in os.listdir(ROOT)
+        if os.path.isfile(os.path.join(ROOT, name, "index.py"))
+    )
+
+
+def shared_modules() -> dict:
+    """Paths of every copy by module name, for modules in several functions."""
+    copies = defaultdict(list)
+    for directory in function_dirs():
+        for name in sorted(os.listdir(os.path.join(ROOT, directory))):
+            if name.endswith(".py") and name != "index.py":
+                copies[name].append(os.path.join(directory, name))
+    return {name: paths for name, paths in copies.items() if len(paths) > 1}
+
+
+def read(path: str) -> str:
+    with open(os.path.join(ROOT, path), encoding="utf-8") as f:
+        return f.read()
+
+
+def main():
+    drifted = 0
+    modules = shared_modules()
+    for name, paths in sorted(modules.items()):
+        reference = read(paths[0])
+        for path in paths[1:]:
+            text = read(path)
+            if text != reference:
+                drifted += 1
+                sys.stdout.writelines(difflib.unified_diff(
+                    reference.splitlines(keepends=True), text.splitlines(keepends=True),
+                    fromfile=paths[0], tofile=path))
+    print(f"{len(modules)} shared modules checked, {drifted} copies differ")
+    sys.exit(1 if drifted else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""Offline reprocessing of archived pages.
+
+Runs the parser functions' extractor over archived ``meta.json`` +
+``content.html[.gz|.zst]`` pairs from a local directory or an S3 prefix,
+across a process pool, and writes the rows to a JSON lines file or back
+into the site's raw table. Nothing is deleted from the source.
+
+Rows get the same ``key`` (``<prefix>/meta.flg``, the object that
+triggers the parser) and therefore the same ``row_id`` as the trigger
+path. The raw tables are keyed by (created_dttm, parsing_id, row_id), so
+when writing to the table each page's rows are stamped with the
+created_dttm of its original ingestion, read from
+`parser/ingest_checkpoints` the way a retried page does, and replace the
+rows of that run. Pages without a checkpoint (never ingested, or past
+its TTL) are stamped with the current time and added as new rows. Price
+history and subscription matches are not touched.
+
+Writing to the table imports the site's index.py and needs the same
+environment as the function (AWS_* and YDB_* variables).
+
+``--fast`` (teztour, ``--out`` only) extracts just the attribute fields
+of parseteztour/fast_attrs.py (ids, rating, coordinates, title, price)
+with its tree-free scanner, for runs that only need those. Pages the
+scanner can't vouch for are parsed with the tree, so the rows are the
+same either way; they just lack the text fields.
+
+Usage: python tools/reparse.py --site {travelata,teztour}
+           (--dir DIR | --s3 BUCKET/PREFIX) (--out FILE | --table)
+           [--fast] [--workers N] [--batch-rows N] [--progress SECONDS]
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from hashlib import md5
+from urllib.parse import urljoin
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+SITE_DIRS = {
+    "travelata": "parsehtml",
+    "teztour": "parseteztour",
+}
+
+TIME_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Objects the trigger path is started by, see collectmeta.
+FLAG_NAME = "meta.flg"
+
+# Per-process state set up by init_worker.
+_worker = None
+
+
+class LocalSource:
+    """Archive laid out like the bucket: <dir>/<prefix>/meta.json."""
+
+    def __init__(self, root: str, bucket: str):
+        self.root = root
+        self.bucket = bucket
+
+    def prefixes(self) -> list:
+        result = []
+        for path, _, files in os.walk(self.root):
+            if "meta.json" in files:
+                result.append(os.path.relpath(path, self.root).replace(os.sep, "/"))
+        return sorted(result)
+
+    def get(self, key: str) -> dict:
+        return {"Body": open(os.path.join(self.root, key), "rb")}
+
+
+class S3Source:
+    def __init__(self, bucket: str, prefix: str):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = None
+
+    @property
+    def client(self):
+        # Created per process, boto3 clients aren't shared across forks.
+        if self._client is None:
+            import boto3
+            session = boto3.session.Session(
+                aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
+                aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
+            )
+            self._client = session.client(
+                service_name="s3",
+                endpoint_url=os.getenv("AWS_ENDPOITNT_URL", "https://storage.yandexcloud.net"),
+                region_name=os.getenv("AWS_REGION_NAME", "ru-central1"),
+            )
+        return self._client
+
+    def prefixes(self) -> list:
+        result = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                if item["Key"].endswith("/meta.json"):
+                    result.append(item["Key"][:-len("/meta.json")])
+        return sorted(result)
+
+    def get(self, key: str) -> dict:
+        return self.client.get_object(Bucket=self.bucket, Key=key)
+
+
+def make_source(args):
+    if args.dir is not None:
+        return LocalSource(args.dir, args.bucket)
+    bucket, _, prefix = args.s3.partition("/")
+    return S3Source(bucket, prefix)
+
+
+def init_worker(site: str, source, created_dttm: str, fast: bool = False) -> None:
+    global _worker
+    sys.path.insert(0, os.path.join(ROOT, SITE_DIRS[site]))
+    from extractor import Extractor
+    from site_specs import SITE_SPECS
+
+    _worker = (Extractor(SITE_SPECS[site]), source, created_dttm, fast)
+
+
+def read_response(response: dict, key: str, meta: dict) -> bytes:
+    from content import read_content
+
+    try:
+        return read_content(response, key, meta)
+    finally:
+        response["Body"].close()
+
+
+def read_object(source, key: str, meta: dict) -> bytes:
+    return read_response(source.get(key), key, meta)
+
+
+def parse_cards(extractor, content: bytes, fast: bool) -> list:
+    if fast:
+        from fast_attrs import FIELDS, scan_cards
+
+        rows = scan_cards(content)
+        if rows is not None:
+            return rows
+    cards = extractor.get_cards(extractor.make_soup(content))
+    rows = list(map(extractor.parse_card, cards))
+    if fast:
+        rows = [{field: row[field] for field in FIELDS} for row in rows]
+    return rows
+
+
+def parse_prefix(prefix: str) -> tuple:
+    """(prefix, rows, error); rows is None for pages scraped with a failure."""
+    from content import candidate_keys, get_content_object
+    from ingest import stamp_rows
+
+    extractor, source, created_dttm, fast = _worker
+    try:
+        meta = json.loads(read_object(source, f"{prefix}/meta.json", {}))
+        if meta["failed"]:
+            return prefix, None, None
+        key, response = get_content_object(source.get, candidate_keys(prefix, meta))
+        content = read_response(response, key, meta)
+
+        rows = []
+        for row in parse_cards(extractor, content, fast):
+            # Same fields as parse_func_wrapper and update_dicts in index.py.
+            row["website"] = extractor.website
+            row["link"] = urljoin(extractor.website, row["href"])
+            row["offer_hash"] = md5(row["link"].encode()).hexdigest()
+            row.update(
+                parsing_id=meta["parsing_id"],
+                key=f"{prefix}/{FLAG_NAME}", bucket=source.bucket)
+            rows.append(row)
+        return prefix, stamp_rows(rows, created_dttm), None
+    except Exception as e:
+        return prefix, None, repr(e)
+
+
+class FileOutput:
+    def __init__(self, path: str):
+        self._file = open(path, "w")
+
+    def write(self, rows: list) -> None:
+        for row in rows:
+            self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class TableOutput:
+    """REPLACEs rows into the site's raw table with index.py's statements."""
+
+    def __init__(self, site: str, batch_rows: int, writers: int):
+        sys.path.insert(0, os.path.join(ROOT, SITE_DIRS[site]))
+        import index
+
+        self._index = index
+        self.batch_rows = batch_rows
+        self._buffer = []
+        self.writers = writers
+        self._executor = ThreadPoolExecutor(max_workers=writers)
+        self._futures = []
+        # Original created_dttm by (parsing_id, key), None for new pages.
+        self._ingested = {}
+
+    def _original_created_dttm(self, parsing_id: str, key: str):
+        page = (parsing_id, key)
+        if page not in self._ingested:
+            _, self._ingested[page] = self._index.load_checkpoints(parsing_id, key)
+        return self._ingested[page]
+
+    def _write_batch(self, rows: list) -> None:
+        index = self._index
+        query = index.create_statement(list(map(index.format_record, rows)))
+        index.pool.retry_operation_sync(index.create_execute_query(query))
+
+    def write(self, rows: list) -> None:
+        # Pages are resolved here rather than in the writer threads, so each
+        # is looked up once and the cache needs no lock.
+        self._buffer.extend(
+            {**row, "created_dttm": self._original_created_dttm(row["parsing_id"], row["key"])
+             or row["created_dttm"]}
+            for row in rows
+        )
+        while len(self._buffer) >= self.batch_rows:
+            batch, self._buffer = self._buffer[:self.batch_rows], self._buffer[self.batch_rows:]
+            self._futures.append(self._executor.submit(self._write_batch, batch))
+        # Surfaces write errors early and keeps the backlog bounded.
+        while len(self._futures) > 4 * self.writers:
+            self._futures.pop(0).result()
+
+    def close(self) -> None:
+        if self._buffer:
+            self._futures.append(self._executor.submit(self._write_batch, self._buffer))
+            self._buffer = []
+        for future in self._futures:
+            future.result()
+        self._executor.shutdown()
+        new_pages = sum(created_dttm is None for created_dttm in self._ingested.values())
+        print(f"{len(self._ingested) - new_pages} pages replaced, {new_pages} added",
+              file=sys.stderr)
+
+
+class Progress:
+    def __init__(self, total: int, interval: float):
+        self.total = total
+        self.interval = interval
+        self.pages = self.rows = self.skipped = self.errors = 0
+        self.started = self._reported = time.monotonic()
+
+    def update(self, rows, error) -> None:
+        self.pages += 1
+        if error is not None:
+            self.errors += 1
+        elif rows is None:
+            self.skipped += 1
+        else:
+            self.rows += len(rows)
+        now = time.monotonic()
+        if now - self._reported >= self.interval or self.pages == self.total:
+            self._reported = now
+            self.report(now)
+
+    def report(self, now: float) -> None:
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.pages / elapsed
+        eta = (self.total - self.pages) / rate if rate else 0
+        print(
+            f"{self.pages}/{self.total} pages, {self.rows} rows, "
+            f"{self.skipped} failed scrapes, {self.errors} errors, "
+            f"{rate:.1f} pages/s, eta {eta:.0f} s",
+            file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--site", choices=sorted(SITE_DIRS), required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="local archive directory")
+    source.add_argument("--s3", help="BUCKET/PREFIX of archived pages")
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--out", help="JSON lines file for the rows")
+    output.add_argument("--table", action="store_true", help="REPLACE into the raw table")
+    parser.add_argument("--fast", action="store_true",
+                        help="attribute fields only, with the teztour byte scanner")
+    parser.add_argument("--bucket", default="parsing",
+                        help="bucket recorded in the rows of a local archive")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--batch-rows", type=int, default=500)
+    parser.add_argument("--progress", type=float, default=5)
+    args = parser.parse_args()
+    if args.fast and (args.site != "teztour" or args.table):
+        # The raw table needs every field, and only teztour has a scanner.
+        parser.error("--fast needs --site teztour and --out")
+
+    source = make_source(args)
+    prefixes = source.prefixes()
+    print(f"{len(prefixes)} pages to reparse with {args.workers} workers", file=sys.stderr)
+
+    if args.table:
+        out = TableOutput(args.site, args.batch_rows, args.writers)
+    else:
+        out = FileOutput(args.out)
+
+    created_dttm = datetime.datetime.now().strftime(TIME_FMT)
+    progress = Progress(len(prefixes), args.progress)
+    failed = []
+    # Spawned workers don't inherit the YDB driver's threads.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=context,
+        initializer=init_worker, initargs=(args.site, source, created_dttm, args.fast),
+    ) as executor:
+        chunksize = max(1, min(64, len(prefixes) // (4 * args.workers)))
+        for prefix, rows, error in executor.map(parse_prefix, prefixes, chunksize=chunksize):
+            if error is not None:
+                failed.append((prefix, error))
+            elif rows:
+                out.write(rows)
+            progress.update(rows, error)
+    out.close()
+
+    for prefix, error in failed:
+        print(f"failed {prefix}: {error}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()